@@ -1,15 +1,19 @@
 # admin_bot.py
 import logging
 import os
-import zipfile
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile, InlineQueryResultArticle, InputTextMessageContent, ReplyKeyboardRemove
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent, ReplyKeyboardRemove
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, ConversationHandler, InlineQueryHandler
 from telegram.ext import filters
 
-from config import ADMIN_BOT_TOKEN, ADMIN_ID, CHANNEL_ID, SURA_NAMES
-from database import db
+from config import ADMIN_BOT_TOKEN, ADMIN_ID, CHANNEL_ID, SURA_NAMES, TELEGRAM_API_URL
+from database import db, adb
 from text_resources import get_text
 from mistral_integration import translator
+from broadcast import BroadcastWorker
+from rate_limiter import RateLimiter
+from keyboards import admin_sura_select_keyboard, page_buttons, parse_page_callback
+from sura_import import (ChannelUploader, ProgressReporter, SuraZipImporter, progress_bar, sura_names_for,
+                         upload_telegram_audio)
 import json as json_module
 
 logging.basicConfig(
@@ -18,6 +22,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Общий лимит отправки сообщений админ-ботом (лимиты Telegram: ~30/сек, 1/сек в чат).
+# Более строгий лимит канала не угадываем заранее: загрузки встают на паузу по RetryAfter
+send_limiter = RateLimiter(global_rate=25, per_chat_rate=1.0)
+
 # Состояния для ConversationHandler
 WAITING_QARI_PHOTO, WAITING_QARI_NAME, WAITING_SURA_AUDIO, WAITING_ZIP_FILE, WAITING_NASHEED_PHOTO, WAITING_NASHEED_AUDIO, WAITING_NASHEED_NAME, CHATTING_WITH_USER, WAITING_DAILY_SURA, WAITING_DAILY_NASHEED, WAITING_BROADCAST_MESSAGE, SELECTING_SURA_FROM_LIST, WAITING_SELECTED_SURA_AUDIO = range(13)
 
@@ -37,18 +45,7 @@ async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Стартовая команда админ-бота"""
     
     # Проверяем новые сообщения от пользователей
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT COUNT(*) FROM messages m
-        JOIN admin_chats ac ON m.chat_id = ac.chat_id
-        WHERE m.is_from_admin = 0 AND ac.admin_id = ?
-        AND m.message_id NOT IN (
-            SELECT message_id FROM messages WHERE is_from_admin = 1
-        )
-    ''', (ADMIN_ID,))
-    unread_count = cursor.fetchone()[0]
-    conn.close()
+    unread_count = await adb.get_unread_messages_count(ADMIN_ID)
     
     keyboard = [
         [InlineKeyboardButton("🎙 Добавить чтеца", callback_data="add_qari")],
@@ -56,7 +53,8 @@ async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("🗑️ Управление чтецами", callback_data="manage_qaris")],
         [InlineKeyboardButton(f"👥 Управление пользователями {'🔴' + str(unread_count) if unread_count > 0 else ''}", callback_data="manage_users")],
         [InlineKeyboardButton("📊 Статистика", callback_data="statistics")],
-        [InlineKeyboardButton("📢 Рассылка", callback_data="broadcast")],
+        [InlineKeyboardButton("📢 Рассылка", callback_data="broadcast"),
+         InlineKeyboardButton("📋 Статус рассылок", callback_data="broadcast_status")],
         [InlineKeyboardButton("☀️ Контент дня", callback_data="daily_content")]
     ]
     
@@ -109,13 +107,13 @@ async def handle_qari_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     processing_msg = await update.message.reply_text("🔄 Автоматический перевод имени чтеца на все языки...")
     
     # Вызываем AI для перевода имени на все языки
-    translation_result = translator.translate_to_all_languages(name)
+    translation_result = await translator.translate_to_all_languages(name)
     
     # Получаем переводы из результата
     names = translation_result['translations']
     
     # Сохранение в БД
-    qari_id = db.add_qari(
+    qari_id = await adb.add_qari(
         context.user_data['qari_data'].get('photo'),
         names
     )
@@ -173,35 +171,17 @@ async def start_suras_select(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    qari_id = query.data.split("_")[3]
-    context.user_data['current_qari_id'] = qari_id
+    # При листании (sura_select_page_N) чтец уже выбран
+    if query.data.startswith("add_suras_select_"):
+        context.user_data['current_qari_id'] = query.data.split("_")[3]
+        context.user_data['sura_select_page'] = 0
     
-    # Создаем инлайн-кнопки для всех 114 сур с пагинацией (по 10 на страницу)
+    # Все 114 сур с пагинацией (по 10 на страницу); клавиатуры страниц строятся один раз
     page = context.user_data.get('sura_select_page', 0)
-    items_per_page = 10
-    start_index = page * items_per_page + 1
-    end_index = min((page + 1) * items_per_page, 114)
-    
-    keyboard = []
-    for i in range(start_index, end_index + 1):
-        sura_name = SURA_NAMES.get(i, {}).get('ru', f'Сура {i}')
-        keyboard.append([InlineKeyboardButton(f"{i:03d}. {sura_name}", callback_data=f"select_sura_{i}")])
-    
-    # Навигация
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"sura_select_page_{page-1}"))
-    if end_index < 114:
-        nav_buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"sura_select_page_{page+1}"))
-    
-    if nav_buttons:
-        keyboard.append(nav_buttons)
-    
-    keyboard.append([InlineKeyboardButton("🚫 Отмена", callback_data="admin_back")])
     
     await query.edit_message_text(
         f"📋 Выберите суру для добавления (стр. {page+1}/12):",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=admin_sura_select_keyboard(page)
     )
     return SELECTING_SURA_FROM_LIST
 
@@ -250,12 +230,9 @@ async def handle_selected_sura_audio(update: Update, context: ContextTypes.DEFAU
         return ConversationHandler.END
     
     try:
-        # Пересылаем аудио на канал
-        message_on_channel = await context.bot.send_audio(
-            chat_id=CHANNEL_ID,
-            audio=update.message.audio.file_id
-        )
-        file_id = message_on_channel.audio.file_id
+        # Пересылаем аудио на канал (если этот файл там уже есть - берем готовый file_id)
+        uploader = ChannelUploader(context.bot, CHANNEL_ID, send_limiter)
+        file_id, _ = await upload_telegram_audio(adb, uploader, update.message.audio)
         
         if not file_id:
             raise ValueError("Не удалось получить file_id с канала")
@@ -269,7 +246,7 @@ async def handle_selected_sura_audio(update: Update, context: ContextTypes.DEFAU
         })
         
         # Сохраняем в БД
-        db.add_sura(qari_id, sura_number, file_id, sura_names)
+        await adb.add_suras(qari_id, [(sura_number, file_id, sura_names)])
         
         # Удаляем сообщение с аудио
         await context.bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
@@ -329,10 +306,10 @@ async def handle_sura_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if 'pending_suras' not in context.user_data:
         context.user_data['pending_suras'] = []
     
-    # Сохраняем file_id во временный список
+    # Сохраняем аудио во временный список
     context.user_data['pending_suras'].append({
         'sura_number': sura_number,
-        'file_id': update.message.audio.file_id,
+        'audio': update.message.audio,
         'message_id': update.message.message_id
     })
     
@@ -372,6 +349,7 @@ async def handle_sura_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def process_sura_batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Загружает собранные суры на канал с прогресс-баром"""
     import asyncio
+    import time
     
     qari_id = context.user_data.get('current_qari_id')
     pending = context.user_data.get('pending_suras', [])
@@ -383,54 +361,65 @@ async def process_sura_batch(update: Update, context: ContextTypes.DEFAULT_TYPE)
     total = len(pending)
     progress_msg = await context.bot.send_message(
         chat_id=update.effective_chat.id,
-        text=f"🔄 Загрузка {total} сур на канал...\n\n▱▱▱▱▱▱▱▱▱▱ 0%"
+        text=f"🔄 Загрузка {total} сур на канал...\n\n{progress_bar(0, total)}"
     )
+    progress = ProgressReporter(progress_msg)
     
     success = 0
+    reused = 0
     errors = []
-    
-    for i, sura_data in enumerate(pending):
+    # Записи в БД копим и сохраняем одной транзакцией после загрузки
+    uploaded = []
+    started = time.monotonic()
+    # Без фиксированных пауз: темп задает RateLimiter, на паузу встаем только по RetryAfter
+    uploader = ChannelUploader(context.bot, CHANNEL_ID, send_limiter)
+    
+    async def upload(sura_data):
+        nonlocal success, reused
+        sura_number = sura_data['sura_number']
         try:
-            # Задержка для flood control
-            await asyncio.sleep(2)
-            
-            # Загружаем на канал
-            message_on_channel = await context.bot.send_audio(
-                chat_id=CHANNEL_ID,
-                audio=sura_data['file_id']
-            )
-            file_id = message_on_channel.audio.file_id
-            
-            # Сохраняем в БД
-            sura_names = SURA_NAMES.get(sura_data['sura_number'], {
-                'ar': f'سورة {sura_data["sura_number"]}',
-                'uz': f'Sura {sura_data["sura_number"]}',
-                'ru': f'Сура {sura_data["sura_number"]}',
-                'en': f'Surah {sura_data["sura_number"]}'
-            })
-            
-            db.add_sura(qari_id, sura_data['sura_number'], file_id, sura_names)
+            async with uploader.semaphore:
+                # Уже загруженные на канал файлы (повторная отправка после сбоя) пропускаем
+                file_id, known = await upload_telegram_audio(adb, uploader, sura_data['audio'])
+            if known:
+                reused += 1
+            uploaded.append((sura_number, file_id, sura_names_for(sura_number)))
             success += 1
-            
-            # Обновляем прогресс-бар
-            percent = int((i + 1) / total * 100)
-            filled = int(percent / 10)
-            bar = "▰" * filled + "▱" * (10 - filled)
-            
-            await progress_msg.edit_text(
-                f"🔄 Загрузка {total} сур на канал...\n\n{bar} {percent}%\n\n"
-                f"✅ Загружено: {success}/{total}"
-            )
-            
         except Exception as e:
-            logger.error(f"Error uploading sura {sura_data['sura_number']}: {e}")
-            errors.append(f"Сура {sura_data['sura_number']}: {str(e)}")
+            logger.error(f"Error uploading sura {sura_number}: {e}")
+            errors.append(f"Сура {sura_number}: {str(e)}")
+        
+        # Прогресс-бар редактируется не чаще раза в 2 секунды
+        done = success + len(errors)
+        progress.update(
+            f"🔄 Загрузка {total} сур на канал...\n\n{progress_bar(done, total)}\n\n"
+            f"✅ Загружено: {success}/{total}"
+        )
+    
+    await asyncio.gather(*(upload(sura_data) for sura_data in pending))
+    
+    if uploaded:
+        try:
+            await adb.add_suras(qari_id, sorted(uploaded, key=lambda item: item[0]))
+        except Exception as e:
+            logger.error(f"Error saving sura batch for qari {qari_id}: {e}")
+            errors.extend(f"Сура {sura_number}: {str(e)}" for sura_number, _, _ in uploaded)
+            success = 0
+    
+    upload_stats = uploader.stats.summary()
+    logger.info(
+        f"Sura batch for qari {qari_id}: {success}/{total} in {time.monotonic() - started:.1f}s, "
+        f"upload stats: {json_module.dumps(upload_stats)}"
+    )
     
     # Финальный отчет
-    await progress_msg.edit_text(
+    await progress.finish(
         f"✅ Загрузка завершена!\n\n"
         f"📊 Успешно: {success}/{total}\n"
-        f"❌ Ошибок: {len(errors)}"
+        f"♻️ Уже были на канале: {reused}\n"
+        f"❌ Ошибок: {len(errors)}\n"
+        f"⏱ Время: {time.monotonic() - started:.0f} сек "
+        f"(загрузка в среднем {upload_stats['avg']} сек, флуд-контроль {upload_stats['flood_seconds']:.0f} сек)"
     )
     
     # Спрашиваем хотите ли еще добавить
@@ -495,139 +484,45 @@ async def handle_zip_addition(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
     
     zip_path = f"temp_{update.message.message_id}.zip"
-    extract_path = f"temp_extract_{update.message.message_id}"
-    
-    # Инициализация отчета
-    validation_report = {
-        "action": "process_zip",
-        "status": "ok",
-        "qari_id": qari_id,
-        "uploaded": 0,
-        "skipped": 0,
-        "errors": [],
-        "missing_files": [],
-        "integrity_check": "ok"
-    }
-    
     processing_msg = await update.message.reply_text("🔄 Обработка ZIP архива...")
     
     try:
-        # 1. Скачивание и проверка целостности
         zip_file = await update.message.document.get_file()
         await zip_file.download_to_drive(zip_path)
-        
-        # Проверка целостности ZIP
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                bad_file = zip_ref.testzip()
-                if bad_file is not None:
-                    validation_report['integrity_check'] = "failed"
-                    validation_report['status'] = "error"
-                    validation_report['errors'].append(f"Поврежденный файл в архиве: {bad_file}")
-                    raise ValueError(f"ZIP архив поврежден: {bad_file}")
-                
-                # Извлечение
-                os.makedirs(extract_path, exist_ok=True)
-                zip_ref.extractall(extract_path)
-        except zipfile.BadZipFile as e:
-            validation_report['integrity_check'] = "failed"
-            validation_report['status'] = "error"
-            validation_report['errors'].append(f"Невалидный ZIP файл: {str(e)}")
-            raise
-        
-        # 2. Получаем аудио файлы и парсим их номера
-        audio_files = {}
-        allowed_extensions = ('.mp3', '.m4a', '.ogg')
-        
-        for filename in os.listdir(extract_path):
-            if filename.lower().endswith(allowed_extensions):
-                # Пытаемся извлечь номер суры из имени файла
-                # Поддерживаем форматы: 001.mp3, 1.mp3, sura_001.mp3 и т.д.
-                import re
-                match = re.search(r'(\d+)', filename)
-                if match:
-                    sura_number = int(match.group(1))
-                    if 1 <= sura_number <= 114:
-                        audio_files[sura_number] = filename
-        
-        if len(audio_files) == 0:
-            validation_report['status'] = "error"
-            validation_report['errors'].append("В архиве не найдено аудио файлов с корректными номерами (1-114)")
-            await processing_msg.edit_text("❌ В архиве не найдено аудио файлов")
-            return WAITING_ZIP_FILE
-        
-        # 3. Проверка последовательности (выявление пропусков)
-        expected_numbers = set(range(1, 115))
-        found_numbers = set(audio_files.keys())
-        missing_numbers = sorted(expected_numbers - found_numbers)
-        
-        if missing_numbers:
-            validation_report['missing_files'] = [f"{num:03d}.mp3" for num in missing_numbers[:10]]  # Первые 10
-            if len(missing_numbers) > 10:
-                validation_report['missing_files'].append(f"...и еще {len(missing_numbers)-10}")
-        
-        # 4. Обработка файлов с детальной валидацией
-        await processing_msg.edit_text(f"🔄 Загрузка {len(audio_files)} сур на канал...")
-        
-        for sura_number in sorted(audio_files.keys()):
-            filename = audio_files[sura_number]
-            file_path = os.path.join(extract_path, filename)
-            
-            try:
-                # Проверка размера файла
-                file_size = os.path.getsize(file_path)
-                if file_size == 0:
-                    validation_report['errors'].append(f"Сура {sura_number}: пустой файл")
-                    validation_report['skipped'] += 1
-                    continue
-                
-                if file_size < 10000:  # Меньше 10KB - подозрительно
-                    validation_report['errors'].append(f"Сура {sura_number}: подозрительно малый размер ({file_size} байт)")
-                
-                # Загружаем на канал
-                with open(file_path, 'rb') as audio_file:
-                    message = await context.bot.send_audio(
-                        chat_id=CHANNEL_ID,
-                        audio=InputFile(audio_file, filename=filename),
-                        title=f"Surah {sura_number}",
-                        duration=0  # Telegram сам определит длительность
-                    )
-                    
-                    file_id = message.audio.file_id
-                    duration = message.audio.duration or 0
-                    
-                    # Проверка длительности
-                    if duration < 1:
-                        validation_report['errors'].append(f"Сура {sura_number}: длительность меньше 1 секунды")
-                
-                # Получаем название суры
-                sura_names = SURA_NAMES.get(sura_number, {
-                    'ar': f'سورة {sura_number}',
-                    'uz': f'Sura {sura_number}',
-                    'ru': f'Сура {sura_number}',
-                    'en': f'Surah {sura_number}'
-                })
-                
-                # Сохраняем в БД
-                db.add_sura(qari_id, sura_number, file_id, sura_names)
-                validation_report['uploaded'] += 1
-                
-            except Exception as e:
-                logger.error(f"Error processing file {filename}: {e}")
-                validation_report['errors'].append(f"Сура {sura_number} ({filename}): {str(e)}")
-                validation_report['skipped'] += 1
-                continue
-        
-        # 5. Формирование итогового отчета
-        if validation_report['errors'] or validation_report['missing_files']:
-            validation_report['status'] = "warning" if validation_report['uploaded'] > 0 else "error"
-        
+    except Exception as e:
+        logger.error(f"ZIP download error: {e}")
+        await processing_msg.edit_text(f"❌ Не удалось скачать архив: {e}")
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+        return WAITING_ZIP_FILE
+    
+    # Загрузка на канал идет в фоне, админ-бот тем временем продолжает отвечать
+    context.application.create_task(import_sura_zip(context.bot, processing_msg, zip_path, qari_id))
+    
+    await admin_start(update, context)
+    return ConversationHandler.END
+
+async def import_sura_zip(bot, processing_msg, zip_path, qari_id):
+    """Импорт сур из скачанного архива с живым прогрессом и итоговым отчетом"""
+    progress = ProgressReporter(processing_msg)
+    importer = SuraZipImporter(adb, ChannelUploader(bot, CHANNEL_ID, send_limiter))
+    
+    try:
+        validation_report = await importer.import_zip(zip_path, qari_id, progress)
         logger.info(f"ZIP processing report: {json_module.dumps(validation_report, ensure_ascii=False)}")
         
-        # 6. Отправка отчета админу
+        missing_numbers = validation_report['missing_numbers']
+        
         report_text = f"📦 **Отчет обработки ZIP архива**\n\n"
         report_text += f"✅ Загружено сур: {validation_report['uploaded']}\n"
+        if validation_report['reused']:
+            report_text += f"♻️ Из них уже были на канале: {validation_report['reused']}\n"
         report_text += f"⏭ Пропущено: {validation_report['skipped']}\n"
+        if 'elapsed' in validation_report:
+            upload_stats = validation_report['upload_stats']
+            report_text += f"⏱ Время: {validation_report['elapsed']:.0f} сек\n"
+            report_text += (f"📶 Загрузка в среднем {upload_stats['avg']} сек, "
+                            f"флуд-контроль {upload_stats['flood_seconds']:.0f} сек\n")
         
         if validation_report['missing_files']:
             report_text += f"\n⚠️ **Отсутствующие суры:** {len(missing_numbers)}\n"
@@ -642,31 +537,19 @@ async def handle_zip_addition(update: Update, context: ContextTypes.DEFAULT_TYPE
             if len(validation_report['errors']) > 10:
                 report_text += f"...и еще {len(validation_report['errors'])-10} ошибок\n"
         
-        await processing_msg.edit_text(report_text, parse_mode='Markdown')
+        await progress.finish(report_text, parse_mode='Markdown')
         
     except Exception as e:
         logger.error(f"ZIP processing error: {e}")
-        validation_report['status'] = "error"
-        validation_report['errors'].append(str(e))
-        
-        await processing_msg.edit_text(
-            f"❌ Критическая ошибка обработки ZIP:\n{str(e)}\n\n"
-            f"Загружено: {validation_report['uploaded']}, Пропущено: {validation_report['skipped']}"
-        )
+        await progress.finish(f"❌ Критическая ошибка обработки ZIP:\n{str(e)}")
     
     finally:
-        # Очистка временных файлов
+        # Очистка временного файла
         try:
             if os.path.exists(zip_path):
                 os.remove(zip_path)
-            if os.path.exists(extract_path):
-                import shutil
-                shutil.rmtree(extract_path)
         except Exception as cleanup_error:
             logger.error(f"Cleanup error: {cleanup_error}")
-    
-    await admin_start(update, context)
-    return ConversationHandler.END
 
 @admin_only
 async def add_nasheed_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -707,7 +590,7 @@ async def handle_nasheed_name(update: Update, context: ContextTypes.DEFAULT_TYPE
     processing_msg = await update.message.reply_text("🔄 Автоматический перевод названия нашида...")
 
     # Вызываем AI для перевода названия на все языки
-    translation_result = translator.translate_to_all_languages(name)
+    translation_result = await translator.translate_to_all_languages(name)
     titles = translation_result['translations']
     context.user_data['nasheed_data']['titles'] = titles
     context.user_data['nasheed_data']['translation_result'] = translation_result
@@ -741,7 +624,7 @@ async def handle_nasheed_performer(update: Update, context: ContextTypes.DEFAULT
         return ConversationHandler.END
 
     # Сохраняем в БД
-    nasheed_id = db.add_nasheed(
+    nasheed_id = await adb.add_nasheed(
         file_id=nasheed_data['file_id'],
         titles=nasheed_data['titles'],
         performer=performer
@@ -780,18 +663,22 @@ async def manage_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    users = db.get_all_users()
+    cursor, backward = parse_page_callback(query.data, "users_page_")
+    users = await adb.get_users_page(cursor, backward)
     
     keyboard = []
     for user_id, username, first_name in users:
         btn_text = f"👤 {first_name} (@{username})" if username else f"👤 {first_name}"
         keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"user_info_{user_id}")])
     
+    nav_buttons = page_buttons(users, "users_page_")
+    if nav_buttons:
+        keyboard.append(nav_buttons)
     keyboard.append([InlineKeyboardButton("🔍 Поиск пользователя", switch_inline_query_current_chat="")])
     keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")])
     
     await query.edit_message_text(
-        f"👥 Управление пользователями ({len(users)}):", 
+        f"👥 Управление пользователями ({users.total}):", 
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
@@ -802,18 +689,18 @@ async def show_user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.data.split("_")[2]
-    users = db.get_all_users()
-    user = next((u for u in users if u[0] == int(user_id)), None)
+    user = await adb.get_user(int(user_id))
     
     if not user:
         await query.message.reply_text("Пользователь не найден")
         return
     
+    user_lang = await adb.get_user_language(user[0])
     text = f"""📋 Информация о пользователе:
 ID: {user[0]}
 Имя: {user[2]}
 Username: @{user[1] or 'Не указан'}
-Язык: {db.get_user_language(user[0])}"""
+Язык: {user_lang}"""
     
     keyboard = [
         [InlineKeyboardButton("💬 Открыть чат", callback_data=f"open_chat_{user_id}")],
@@ -823,16 +710,48 @@ Username: @{user[1] or 'Не указан'}
     
     await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
+# Сообщений на одной странице истории чата
+CHAT_PAGE_SIZE = 15
+
+async def chat_history_screen(user_id, user, cursor=None, backward=False):
+    """(chat_id, текст, клавиатура) страницы переписки: новые сообщения внизу, «Старее» листает назад"""
+    header = f"💬 Чат с {user[2]} (@{user[1] or 'N/A'}, ID: {user_id})\n"
+    header += "=" * 40 + "\n\n"
+
+    chat_id = await adb.get_chat_id(ADMIN_ID, user_id)
+    page = await adb.get_chat_messages_page(chat_id, cursor, backward, CHAT_PAGE_SIZE) if chat_id else None
+    keyboard = []
+    if page and page.rows:
+        # Компактный формат, от старых к новым; длинные сообщения целиком - в экспорте
+        history = ""
+        for msg in reversed(page.rows):
+            sender_icon = "👨‍💼" if msg[5] else "👤"
+            sender_name = "Admin" if msg[5] else user[2]
+            message_text = msg[3] or ""
+            if len(message_text) > 200:
+                message_text = message_text[:200] + "…"
+            history += f"{sender_icon} {sender_name}: {message_text}\n"
+        text = header + f"📜 Всего сообщений: {page.total}\n\n" + history
+
+        nav_buttons = page_buttons(page, f"chat_history_{user_id}_", "⬇️ Новее", "⬆️ Старее")
+        if nav_buttons:
+            keyboard.append(nav_buttons)
+        keyboard.append([InlineKeyboardButton("📄 Экспорт переписки", callback_data=f"chat_export_{user_id}")])
+    else:
+        text = header + "📭 Нет сообщений"
+    keyboard.append([InlineKeyboardButton("🚪 Закрыть чат", callback_data=f"close_chat_{user_id}")])
+    return chat_id, text, InlineKeyboardMarkup(keyboard)
+
 @admin_only
 async def open_chat_with_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Начинает чат с пользователем, показывает ВСЕ сообщения компактно"""
+    """Начинает чат с пользователем, показывает последние сообщения"""
     query = update.callback_query
     await query.answer()
 
     user_id = int(query.data.split("_")[-1])
     context.user_data['chatting_with_user_id'] = user_id
 
-    user = db.get_user_by_id(user_id)
+    user = await adb.get_user_by_id(user_id)
     if not user:
         await query.edit_message_text("❌ Пользователь не найден.")
         return ConversationHandler.END
@@ -843,52 +762,71 @@ async def open_chat_with_user(update: Update, context: ContextTypes.DEFAULT_TYPE
     except:
         pass
 
-    chat_id = db.get_chat_id(ADMIN_ID, user_id)
-    
-    # Отправляем заголовок
-    header = f"💬 Чат с {user[2]} (@{user[1] or 'N/A'}, ID: {user_id})\n"
-    header += "=" * 40 + "\n\n"
-    
-    # Получаем сообщения
+    chat_id, text, reply_markup = await chat_history_screen(user_id, user)
     if chat_id:
-        messages = db.get_chat_messages(chat_id, limit=50)
-        
-        if messages:
-            # Группируем сообщения компактно
-            history = ""
-            for msg in reversed(messages):  # От старых к новым
-                sender_icon = "👨‍💼" if msg[5] else "👤"
-                sender_name = "Admin" if msg[5] else user[2]
-                message_text = msg[3]
-                
-                # Компактный формат
-                history += f"{sender_icon} {sender_name}: {message_text}\n"
-            
-            # Отправляем историю одним сообщением
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=header + history,
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🚪 Закрыть чат", callback_data=f"close_chat_{user_id}")]
-                ])
-            )
-        else:
-            await context.bot.send_message(
+        await adb.mark_chat_read(chat_id)
+    await context.bot.send_message(chat_id=ADMIN_ID, text=text, reply_markup=reply_markup)
+    
+    return CHATTING_WITH_USER
+
+@admin_only
+async def show_chat_history_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание истории чата: chat_history_{user_id}_n_{курсор} / ..._p_{курсор}"""
+    query = update.callback_query
+    await query.answer()
+
+    user_id = int(query.data[len("chat_history_"):].split("_")[0])
+    cursor, backward = parse_page_callback(query.data, f"chat_history_{user_id}_")
+    user = await adb.get_user_by_id(user_id)
+    if not user:
+        await query.edit_message_text("❌ Пользователь не найден.")
+        return ConversationHandler.END
+
+    _, text, reply_markup = await chat_history_screen(user_id, user, cursor, backward)
+    await query.edit_message_text(text, reply_markup=reply_markup)
+    return CHATTING_WITH_USER
+
+def write_chat_transcript(path, chat_id, user_name):
+    """Выгрузка переписки в текстовый файл пачками из БД; вызывается в отдельном потоке"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as transcript:
+        for batch in db.iter_chat_messages(chat_id):
+            for _, _, _, message_text, message_date, is_from_admin in batch:
+                sender_name = "Admin" if is_from_admin else user_name
+                transcript.write(f"[{message_date}] {sender_name}: {message_text or ''}\n")
+                count += 1
+    return count
+
+@admin_only
+async def export_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отправляет админу всю переписку с пользователем файлом"""
+    import asyncio
+    query = update.callback_query
+    await query.answer("📄 Готовим файл...")
+
+    user_id = int(query.data.split("_")[-1])
+    chat_id = await adb.get_chat_id(ADMIN_ID, user_id)
+    if not chat_id:
+        return CHATTING_WITH_USER
+    user = await adb.get_user_by_id(user_id)
+    user_name = user[2] if user else str(user_id)
+
+    transcript_path = f"temp_chat_{user_id}_{query.message.message_id}.txt"
+    try:
+        count = await asyncio.to_thread(write_chat_transcript, transcript_path, chat_id, user_name)
+        with open(transcript_path, 'rb') as transcript:
+            await context.bot.send_document(
                 chat_id=ADMIN_ID,
-                text=header + "📭 Нет сообщений",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🚪 Закрыть", callback_data=f"close_chat_{user_id}")]
-                ])
+                document=transcript,
+                filename=f"chat_{user_id}.txt",
+                caption=f"📄 Переписка с {user_name}: {count} сообщений"
             )
-    else:
-        await context.bot.send_message(
-            chat_id=ADMIN_ID,
-            text=header + "📭 Чат пуст",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("🚪 Закрыть", callback_data=f"close_chat_{user_id}")]
-            ])
-        )
-    
+    except Exception as e:
+        logger.error(f"Chat export failed for user {user_id}: {e}")
+        await context.bot.send_message(chat_id=ADMIN_ID, text=f"❌ Не удалось выгрузить переписку: {e}")
+    finally:
+        if os.path.exists(transcript_path):
+            os.remove(transcript_path)
     return CHATTING_WITH_USER
 
 @admin_only
@@ -908,8 +846,8 @@ async def handle_admin_chat_message(update: Update, context: ContextTypes.DEFAUL
             text=f"Сообщение от Администратора:\n\n{text}"
         )
         # Сохраняем в БД
-        chat_id = db.get_chat_id(ADMIN_ID, user_id, create_if_not_exists=True)
-        db.save_message(chat_id, ADMIN_ID, text, is_from_admin=True)
+        chat_id = await adb.get_chat_id(ADMIN_ID, user_id, create_if_not_exists=True)
+        await adb.save_message(chat_id, ADMIN_ID, text, is_from_admin=True)
 
         await update.message.reply_text("✅ Сообщение отправлено пользователю.")
     except Exception as e:
@@ -933,12 +871,37 @@ async def statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    total_users = db.get_total_users_count()
-    today_users = db.get_today_users_count()
+    # Сводные строки stats_rollup обновляются триггерами - без COUNT по исходным таблицам
+    stats = await adb.get_stats_summary()
+    pool_stats = db.get_pool_stats()
+    translation_stats = translator.cache.get_stats()
+    translation_cache_size = await adb.get_translation_cache_size()
+
+    def value(period, metric, dimension=''):
+        return stats.get((period, metric, dimension), 0)
+
+    languages = ', '.join(
+        f"{language or '—'} {count}" for (period, metric, language), count in sorted(stats.items())
+        if period == 'total' and metric == 'users_by_language' and count
+    )
+    top_suras = []
+    for sura_id, plays in await adb.get_top_plays('sura_plays'):
+        sura = await adb.get_sura_with_qari(sura_id)
+        if sura:
+            top_suras.append(f"  {sura[2]}. {sura[6]} - {sura[10]}: {plays}")
     
     text = f"""📊 Статистика бота:
-👥 Всего пользователей: {total_users}
-📈 Активных сегодня: {today_users}"""
+👥 Всего пользователей: {value('total', 'users')} ({languages or 'нет данных'})
+📈 Активных: сегодня {value('day', 'active_users')}, за неделю {value('week', 'active_users')}, за месяц {value('month', 'active_users')}
+🆕 Новых: сегодня {value('day', 'new_users')}, за неделю {value('week', 'new_users')}, за месяц {value('month', 'new_users')}
+🎧 Прослушиваний сегодня: сур {value('day', 'sura_plays')}, нашидов {value('day', 'nasheed_plays')} (за месяц {value('month', 'sura_plays')} / {value('month', 'nasheed_plays')})
+💝 В избранном: сур {value('total', 'favorites', 'sura')} (+{value('week', 'sura_favorites_added')} -{value('week', 'sura_favorites_removed')} за неделю), нашидов {value('total', 'favorites', 'nasheed')} (+{value('week', 'nasheed_favorites_added')} -{value('week', 'nasheed_favorites_removed')})
+🏆 Топ сур недели:
+{chr(10).join(top_suras) or '  пока нет прослушиваний'}
+
+🗄 Пул БД: {pool_stats['size']} соединений (макс. свободных {pool_stats['max_size']}), занято {pool_stats['in_use']}
+♻️ Переиспользовано: {pool_stats['reused']} из {pool_stats['acquired']}, сверх пула: {pool_stats['overflow_closed']}
+🌐 Кэш переводов: {translation_cache_size} записей, попаданий {translation_stats['hit_rate']:.0%} (память {translation_stats['memory_hits']}, БД {translation_stats['db_hits']}, промахов {translation_stats['misses']})"""
     
     keyboard = [[InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")]]
     
@@ -955,7 +918,7 @@ async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Отправьте сообщение (текст) на вашем языке.\n"
         "Система автоматически переведет его на язык каждого пользователя:\n"
         "🇸🇦 Арабский\n🇺🇿 Узбекский\n🇷🇺 Русский\n🇬🇧 Английский\n\n"
-        "⚡ Рассылка выполняется с интеллектуальным throttling (30 сообщений/мин)",
+        "⚡ Рассылка выполняется в фоне, до 25 сообщений/сек, и продолжится после перезапуска бота",
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="admin_back")]]),
         parse_mode='Markdown'
     )
@@ -973,11 +936,11 @@ async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("❌ Пожалуйста, отправьте текстовое сообщение")
         return WAITING_BROADCAST_MESSAGE
     
-    # Получаем всех пользователей, ИСКЛЮЧАЯ админа
-    all_users = db.get_all_users()
-    users = [u for u in all_users if u[0] != ADMIN_ID]  # Исключаем админа!
+    # Сегмент получателей: все, кроме админа и заблокировавших бота
+    segment = {'exclude_user_ids': (ADMIN_ID,)}
+    total = await adb.count_broadcast_recipients(**segment)
     
-    if not users:
+    if not total:
         await update.message.reply_text("❌ Нет пользователей для рассылки (админ не считается)")
         await admin_start(update, context)
         return ConversationHandler.END
@@ -986,7 +949,7 @@ async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT
     broadcast_report = {
         "action": "broadcast",
         "status": "ok",
-        "total": len(users),
+        "total": total,
         "sent": 0,
         "failed": 0,
         "errors": [],
@@ -996,130 +959,78 @@ async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT
     
     # Отправляем уведомление о начале рассылки
     progress_msg = await update.message.reply_text(
-        f"🔄 Подготовка рассылки для {len(users)} пользователей...\n"
+        f"🔄 Подготовка рассылки для {total} пользователей...\n"
         f"Переводим сообщение на все языки..."
     )
     
     # Генерируем переводы для всех языков заранее
     translations = {'ru': broadcast_text}  # Предполагаем что исходный текст на русском
     
-    for lang in ['ar', 'uz', 'en']:
-        try:
-            translated = translator.translate_broadcast_message(broadcast_text, lang)
+    # Все языки переводятся параллельно
+    target_langs = ['ar', 'uz', 'en']
+    results = await asyncio.gather(
+        *(translator.translate_broadcast_message(broadcast_text, lang) for lang in target_langs),
+        return_exceptions=True
+    )
+    for lang, translated in zip(target_langs, results):
+        if isinstance(translated, Exception):
+            logger.error(f"Translation error for {lang}: {translated}")
+            translations[lang] = broadcast_text  # Fallback к оригиналу
+            broadcast_report['errors'].append(f"Ошибка перевода на {lang}: {str(translated)}")
+        else:
             translations[lang] = translated
             broadcast_report['translations'][lang] = translated
-        except Exception as e:
-            logger.error(f"Translation error for {lang}: {e}")
-            translations[lang] = broadcast_text  # Fallback к оригиналу
-            broadcast_report['errors'].append(f"Ошибка перевода на {lang}: {str(e)}")
     
     await progress_msg.edit_text(
         f"✅ Переводы готовы!\n"
-        f"🔄 Начинаем рассылку {len(users)} пользователям...\n"
-        f"Отправлено: 0/{len(users)}"
+        f"🔄 Начинаем рассылку {total} пользователям...\n"
+        f"Отправлено: 0/{total}"
     )
     
-    # Группируем пользователей по языкам для оптимизации
-    users_by_lang = {'ar': [], 'uz': [], 'ru': [], 'en': []}
-    for user in users:
-        user_id, username, first_name = user
-        user_lang = db.get_user_language(user_id)
-        if user_lang in users_by_lang:
-            users_by_lang[user_lang].append((user_id, username, first_name))
-        else:
-            users_by_lang['ru'].append((user_id, username, first_name))  # По умолчанию русский
-    
-    # Конфигурация throttling
-    BATCH_SIZE = 30
-    BATCH_DELAY = 60  # секунд
-    RETRY_LIMIT = 3
-    
-    sent_count = 0
-    failed_count = 0
-    batch_count = 0
-    
-    # Рассылка по языкам
-    for lang, lang_users in users_by_lang.items():
-        message_text = translations.get(lang, broadcast_text)
-        
-        for i, (user_id, username, first_name) in enumerate(lang_users):
-            retry_count = 0
-            success = False
-            
-            while retry_count < RETRY_LIMIT and not success:
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=f"📢 {message_text}"
-                    )
-                    sent_count += 1
-                    success = True
-                    
-                except Exception as e:
-                    retry_count += 1
-                    logger.error(f"Broadcast error for user {user_id} (attempt {retry_count}): {e}")
-                    
-                    if retry_count >= RETRY_LIMIT:
-                        failed_count += 1
-                        broadcast_report['errors'].append(f"User {user_id} ({username}): {str(e)}")
-                    else:
-                        await asyncio.sleep(1)  # Небольшая задержка перед повтором
-            
-            # Обновляем прогресс каждые 10 пользователей
-            if (sent_count + failed_count) % 10 == 0:
-                try:
-                    await progress_msg.edit_text(
-                        f"🔄 Рассылка в процессе...\n"
-                        f"✅ Отправлено: {sent_count}/{len(users)}\n"
-                        f"❌ Ошибок: {failed_count}"
-                    )
-                except:
-                    pass  # Игнорируем ошибки обновления прогресса
-            
-            # Throttling: пауза после каждых BATCH_SIZE сообщений
-            batch_count += 1
-            if batch_count >= BATCH_SIZE:
-                logger.info(f"Throttling: sent {batch_count} messages, waiting {BATCH_DELAY}s...")
-                await asyncio.sleep(BATCH_DELAY)
-                batch_count = 0
-            else:
-                await asyncio.sleep(0.05)  # Минимальная задержка между сообщениями
-    
-    # Финальный отчет
-    broadcast_report['sent'] = sent_count
-    broadcast_report['failed'] = failed_count
-    broadcast_report['end_time'] = datetime.now().isoformat()
-    
-    if failed_count > 0:
-        broadcast_report['status'] = "warning"
-    
-    logger.info(f"Broadcast report: {json_module.dumps(broadcast_report, ensure_ascii=False)}")
-    
-    # Отправляем итоговый отчет админу
-    final_report = (
-        f"📊 **Отчет о рассылке**\n\n"
-        f"✅ Успешно отправлено: {sent_count}\n"
-        f"❌ Ошибок: {failed_count}\n"
-        f"📝 Всего пользователей: {len(users)}\n\n"
-        f"🌍 **Распределение по языкам:**\n"
-        f"🇸🇦 AR: {len(users_by_lang['ar'])}\n"
-        f"🇺🇿 UZ: {len(users_by_lang['uz'])}\n"
-        f"🇷🇺 RU: {len(users_by_lang['ru'])}\n"
-        f"🇬🇧 EN: {len(users_by_lang['en'])}\n"
+    # Получатели (user_id, язык) читаются из БД пачками прямо при создании рассылки;
+    # сегмент (и сброс буфера активности) вычисляется здесь, до транзакции записи
+    batches = await adb.iter_broadcast_recipients(**segment)
+    recipients = (recipient for batch in batches for recipient in batch)
+    texts = {lang: f"📢 {text}" for lang, text in translations.items()}
+    
+    # Рассылка сохраняется в БД и выполняется в фоне: админ-бот продолжает отвечать,
+    # а после перезапуска процесса рассылка продолжится с того же места
+    job_id = await adb.create_broadcast_job(
+        ADMIN_ID, texts, recipients,
+        progress_chat_id=progress_msg.chat_id,
+        progress_message_id=progress_msg.message_id,
+        report=broadcast_report
     )
-    
-    if broadcast_report['errors'] and len(broadcast_report['errors']) <= 10:
-        final_report += f"\n❌ **Ошибки:**\n"
-        for error in broadcast_report['errors']:
-            final_report += f"• {error}\n"
-    elif len(broadcast_report['errors']) > 10:
-        final_report += f"\n❌ Всего ошибок: {len(broadcast_report['errors'])} (см. логи)\n"
-    
-    await progress_msg.edit_text(final_report, parse_mode='Markdown')
+    context.bot_data['broadcast_worker'].start(job_id)
     
     await admin_start(update, context)
     return ConversationHandler.END
 
+@admin_only
+async def broadcast_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Состояние последних рассылок по данным таблицы broadcast_recipients"""
+    query = update.callback_query
+    
+    jobs = await adb.get_recent_broadcast_jobs()
+    if not jobs:
+        text = "📋 Рассылок пока не было."
+    else:
+        text = "📋 Последние рассылки:\n"
+        status_names = {'pending': '⏳ в очереди', 'running': '🔄 идет', 'done': '✅ завершена', 'failed': '❌ ошибка'}
+        for job_id, status, total, created_date, finished_date in jobs:
+            progress = await adb.get_broadcast_progress(job_id)
+            text += (
+                f"\n#{job_id} от {created_date} - {status_names.get(status, status)}\n"
+                f"✅ {progress.get('sent', 0)}/{total}  🚫 {progress.get('blocked', 0)}  "
+                f"❌ {progress.get('failed', 0)}  ⏳ {progress.get('pending', 0) + progress.get('claimed', 0) + progress.get('sending', 0)}\n"
+            )
+    
+    keyboard = [
+        [InlineKeyboardButton("🔄 Обновить", callback_data="broadcast_status")],
+        [InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")]
+    ]
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
 @admin_only
 async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка callback админ-меню"""
@@ -1132,7 +1043,7 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await admin_start(update, context)
     elif data == "manage_qaris":
         await manage_qaris(update, context)
-    elif data == "manage_users":
+    elif data == "manage_users" or data.startswith("users_page_"):
         await manage_users(update, context)
     elif data.startswith("user_info_"):
         await show_user_info(update, context)
@@ -1145,6 +1056,8 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
     elif data == "broadcast":
         # Эта функция теперь обрабатывается ConversationHandler
         await broadcast_start(update, context)
+    elif data == "broadcast_status":
+        await broadcast_status(update, context)
     elif data == "daily_content":
         await daily_content_menu(update, context)
     elif data == "set_daily_sura":
@@ -1153,7 +1066,7 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await set_daily_nasheed_start(update, context)
     elif data.startswith("delete_qari_confirm_"):
         qari_id = int(data.split("_")[-1])
-        qari = db.get_qari_by_id(qari_id)
+        qari = await adb.get_qari_by_id(qari_id)
         if not qari:
             await query.edit_message_text("❌ Чтец не найден.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="manage_qaris")]]))
             return
@@ -1166,7 +1079,7 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     elif data.startswith("delete_qari_execute_"):
         qari_id = int(data.split("_")[-1])
-        photo_path = db.delete_qari(qari_id)
+        photo_path = await adb.delete_qari(qari_id)
         if photo_path and os.path.exists(photo_path):
             os.remove(photo_path)
         await query.answer("✅ Чтец удален!")
@@ -1182,7 +1095,7 @@ async def manage_qaris(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query:
         await query.answer()
 
-    qaris = db.get_all_qaris()
+    qaris = await adb.get_all_qaris()
     keyboard = []
 
     if not qaris:
@@ -1206,7 +1119,7 @@ async def show_add_suras_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     qari_id = int(query.data.split("_")[-1])
-    qari = db.get_qari_by_id(qari_id)
+    qari = await adb.get_qari_by_id(qari_id)
     qari_name = qari[4] if qari else f"Чтец {qari_id}"  # name_ru
     
     keyboard = [
@@ -1239,7 +1152,7 @@ async def set_daily_sura_start(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    qaris = db.get_all_qaris()
+    qaris = await adb.get_all_qaris()
     if not qaris:
         await query.edit_message_text(
             "❌ Нет чтецов в базе. Сначала добавьте чтеца.",
@@ -1265,44 +1178,37 @@ async def handle_daily_sura_qari_select(update: Update, context: ContextTypes.DE
     query = update.callback_query
     await query.answer()
     
-    qari_id = int(query.data.split("_")[-1])
-    context.user_data['daily_sura_qari'] = qari_id
+    if query.data.startswith("daily_sura_qari_"):
+        qari_id = int(query.data.split("_")[-1])
+        context.user_data['daily_sura_qari'] = qari_id
+    else:  # daily_sura_page_...
+        qari_id = context.user_data.get('daily_sura_qari')
+    cursor, backward = parse_page_callback(query.data, "daily_sura_page_")
     
-    # Получаем все суры этого чтеца
-    suras = db.get_suras_by_qari(qari_id, 114, 0)
+    # Страница сур вместе с sura_id и общим количеством - один запрос
+    suras = await adb.get_suras_page(qari_id, cursor, backward, limit=10)
     
-    if not suras:
+    if not suras.rows:
         await query.edit_message_text(
             "❌ У этого чтеца нет сур",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="set_daily_sura")]])
         )
         return WAITING_DAILY_SURA
     
-    # Показываем первые 10 с пагинацией
-    page = 0
-    items_per_page = 10
-    context.user_data['daily_sura_page'] = page
-    
     keyboard = []
-    for sura_data in suras[page*items_per_page:(page+1)*items_per_page]:
-        order = sura_data[0]
-        name_ru = sura_data[2]
-        # Получаем sura_id из БД
-        sura_id = db.get_sura_by_qari_and_order(qari_id, order)
+    for sura_id, order, _, _, name_ru, _ in suras:
         keyboard.append([InlineKeyboardButton(f"{order}. {name_ru}", callback_data=f"set_daily_sura_id_{sura_id}")])
     
     # Навигация
-    nav_buttons = []
-    if len(suras) > (page+1)*items_per_page:
-        nav_buttons.append(InlineKeyboardButton("Далее ▶️", callback_data=f"daily_sura_page_{page+1}"))
+    nav_buttons = page_buttons(suras, "daily_sura_page_", "◀️ Назад", "Далее ▶️")
     if nav_buttons:
         keyboard.append(nav_buttons)
     
     keyboard.append([InlineKeyboardButton("⬅️ Назад к чтецам", callback_data="set_daily_sura")])
     
-    qari_name = db.get_qari_by_id(qari_id)[4]  # name_ru
+    qari_name = (await adb.get_qari_by_id(qari_id))[4]  # name_ru
     await query.edit_message_text(
-        f"📖 Выберите суру ({qari_name}):",
+        f"📖 Выберите суру ({qari_name}, всего {suras.total}):",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
     return WAITING_DAILY_SURA
@@ -1314,7 +1220,7 @@ async def handle_daily_sura_id(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     sura_id = int(query.data.split("_")[-1])
-    db.set_daily_sura(sura_id)
+    await adb.set_daily_sura(sura_id)
     
     await query.edit_message_text(f"✅ Сура установлена как 'Сура дня'!")
     await admin_start(update, context)
@@ -1326,8 +1232,9 @@ async def set_daily_nasheed_start(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    nasheeds = db.get_nasheeds(20, 0)  # Первые 20
-    if not nasheeds:
+    cursor, backward = parse_page_callback(query.data, "daily_nasheed_page_")
+    nasheeds = await adb.get_nasheeds_page(cursor, backward, limit=20)
+    if not nasheeds.rows:
         await query.edit_message_text(
             "❌ Нет нашидов в базе. Сначала добавьте нашид.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="daily_content")]])
@@ -1339,6 +1246,9 @@ async def set_daily_nasheed_start(update: Update, context: ContextTypes.DEFAULT_
         display = f"{title} - {performer or '...'}"
         keyboard.append([InlineKeyboardButton(display, callback_data=f"set_daily_nasheed_id_{nasheed_id}")])
     
+    nav_buttons = page_buttons(nasheeds, "daily_nasheed_page_")
+    if nav_buttons:
+        keyboard.append(nav_buttons)
     keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="daily_content")])
     
     await query.edit_message_text(
@@ -1354,7 +1264,7 @@ async def handle_daily_nasheed_id(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     nasheed_id = int(query.data.split("_")[-1])
-    db.set_daily_nasheed(nasheed_id)
+    await adb.set_daily_nasheed(nasheed_id)
     
     await query.edit_message_text(f"✅ Нашид установлен как 'Нашид дня'!")
     await admin_start(update, context)
@@ -1373,10 +1283,11 @@ async def inline_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.inline_query.query
     results = []
 
-    if len(query) < 2:
+    # Триграммный индекс ищет подстроки от трех символов; ID - любой длины
+    if len(query.strip()) < 3 and not query.strip().isdigit():
         return
 
-    users = db.search_users(query)
+    users = await adb.search_users(query)
 
     for user_id, username, first_name in users:
         title = f"{first_name} (@{username or 'N/A'})"
@@ -1398,11 +1309,43 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка ошибок"""
     logger.error(f"Exception while handling an update: {context.error}")
 
-def main():
-    """Запуск админ-бота"""
+async def on_startup(application: Application):
+    """Запускаем воркер рассылок и продолжаем незавершенные рассылки"""
+    worker = BroadcastWorker(application.bot, adb, send_limiter)
+    application.bot_data['broadcast_worker'] = worker
+    await worker.resume()
+
+async def on_stop(application: Application):
+    """Ставим рассылки на паузу, пока бот еще может работать с БД"""
+    await application.bot_data['broadcast_worker'].stop()
+
+async def on_shutdown(application: Application):
+    """Закрываем HTTP-клиент Mistral и пул соединений с БД при остановке бота"""
+    await translator.close()
+    await adb.aclose()
+
+def build_application(webhook=False):
+    """Админ-бот со всеми обработчиками; webhook=True - без Updater, апдейты приносит webhook_server.
+
+    В отличие от юзер-бота апдейты обрабатываются по одному даже в режиме
+    webhook: у админ-бота состояния хранят ConversationHandler, и при
+    параллельной обработке следующее сообщение админа могло бы попасть
+    в обработчик старого состояния.
+    """
     os.makedirs("qari_photos", exist_ok=True)
     
-    application = Application.builder().token(ADMIN_BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(ADMIN_BOT_TOKEN)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Conversation Handler для добавления чтеца
     qari_conv_handler = ConversationHandler(
@@ -1453,7 +1396,9 @@ def main():
         states={
             CHATTING_WITH_USER: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_admin_chat_message),
-                CallbackQueryHandler(close_chat, pattern='^close_chat_')
+                CallbackQueryHandler(close_chat, pattern='^close_chat_'),
+                CallbackQueryHandler(show_chat_history_page, pattern='^chat_history_'),
+                CallbackQueryHandler(export_chat, pattern='^chat_export_')
             ]
         },
         fallbacks=[CommandHandler("cancel", cancel_operation)],
@@ -1468,10 +1413,11 @@ def main():
         ],
         states={
             WAITING_DAILY_SURA: [
-                CallbackQueryHandler(handle_daily_sura_qari_select, pattern='^daily_sura_qari_'),
+                CallbackQueryHandler(handle_daily_sura_qari_select, pattern='^daily_sura_(qari|page)_'),
                 CallbackQueryHandler(handle_daily_sura_id, pattern='^set_daily_sura_id_')
             ],
             WAITING_DAILY_NASHEED: [
+                CallbackQueryHandler(set_daily_nasheed_start, pattern='^daily_nasheed_page_'),
                 CallbackQueryHandler(handle_daily_nasheed_id, pattern='^set_daily_nasheed_id_')
             ],
         },
@@ -1533,7 +1479,11 @@ def main():
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, admin_start))
     
     application.add_error_handler(error_handler)
-    
+    return application
+
+def main():
+    """Запуск админ-бота"""
+    application = build_application()
     logger.info("Admin bot is starting...")
     application.run_polling()
 
@@ -0,0 +1,18 @@
+# backfill_stats.py
+import sys
+from database import db
+
+def backfill_stats():
+    """Пересчет сводной статистики stats_rollup по исходным таблицам.
+
+    Нужен после восстановления БД из копии или ручных правок данных:
+    в обычной работе строки обновляют триггеры.
+    """
+    print("🔄 Пересчет статистики...")
+    rows = db.rebuild_stats_rollup()
+    print(f"✅ Статистика пересчитана: {rows} строк")
+    db.close()
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if backfill_stats() else 1)
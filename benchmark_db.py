@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки обработчиков: синхронные вызовы db.* против AsyncDatabase
+
+Подает апдейты с постоянной частотой: каждый пятый апдейт - это /start
+с записью в БД, остальные - просмотр меню (только чтение). Параллельно второй "процесс" (поток) периодически
+держит блокировку записи, как это делает админ-бот при добавлении сур.
+Задержка считается от запланированного момента прихода апдейта, поэтому
+учитывается и время, пока апдейт ждал заблокированный event loop.
+
+Запуск: python benchmark_db.py [--updates 1000] [--rate 200]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from database import Database, AsyncDatabase
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def writer_contention(db_path, stop_event, hold=0.05, pause=0.2):
+    """Держит RESERVED-блокировку hold секунд каждые pause секунд"""
+    conn = sqlite3.connect(db_path, timeout=10)
+    while not stop_event.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE qaris SET name_ru = name_ru")
+        time.sleep(hold)
+        conn.commit()
+        time.sleep(pause)
+    conn.close()
+
+
+async def handle_update_sync(db, user_id):
+    if user_id % 5 == 0:
+        db.save_user(user_id, f"user{user_id}", "Test")
+        db.update_user_activity(user_id)
+    db.get_user_language(user_id)
+    db.get_all_qaris()
+    db.get_user_favorite_suras(user_id)
+    db.get_user_favorite_nasheeds(user_id)
+
+
+async def handle_update_async(adb, user_id):
+    if user_id % 5 == 0:
+        await adb.save_user(user_id, f"user{user_id}", "Test")
+        await adb.update_user_activity(user_id)
+    await adb.get_user_language(user_id)
+    await adb.get_all_qaris()
+    await adb.get_user_favorite_suras(user_id)
+    await adb.get_user_favorite_nasheeds(user_id)
+
+
+async def run(handler, backend, updates, rate):
+    latencies = {'all': [], 'read': []}
+
+    async def one(user_id, due):
+        await handler(backend, user_id)
+        latency = time.perf_counter() - due
+        latencies['all'].append(latency)
+        if user_id % 5:
+            latencies['read'].append(latency)
+
+    started = time.perf_counter()
+    tasks = []
+    for i in range(updates):
+        due = started + i / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i % 1000 + 1, due)))
+    await asyncio.gather(*tasks)
+    return latencies, time.perf_counter() - started
+
+
+def report(name, latencies, elapsed):
+    for kind, values in latencies.items():
+        print(
+            f"{name:<6} {kind:<5} p50={percentile(values, 50) * 1000:8.1f} ms  "
+            f"p99={percentile(values, 99) * 1000:8.1f} ms  "
+            f"max={max(values) * 1000:8.1f} ms"
+        )
+    print(f"{name:<6} throughput={len(latencies['all']) / elapsed:.1f} upd/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p99 latency of bot handlers: sync vs async DB")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="updates per second")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = Database(db_path)
+        adb = AsyncDatabase(db)
+
+        stop_event = threading.Event()
+        writer = threading.Thread(target=writer_contention, args=(db_path, stop_event), daemon=True)
+        writer.start()
+
+        try:
+            print(f"{args.updates} updates at {args.rate:.0f}/s, with write-lock contention")
+            latencies, elapsed = asyncio.run(run(handle_update_sync, db, args.updates, args.rate))
+            report("sync", latencies, elapsed)
+            latencies, elapsed = asyncio.run(run(handle_update_async, adb, args.updates, args.rate))
+            report("async", latencies, elapsed)
+        finally:
+            stop_event.set()
+            writer.join()
+            adb.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Движок массовой рассылки
+
+Получатели читаются из (асинхронного) итератора в ограниченную очередь и
+отправляются пулом воркеров через общий RateLimiter. RetryAfter ставит на
+паузу всю рассылку, временные сетевые ошибки повторяются с задержкой, а
+заблокировавшие бота и удаленные аккаунты сразу помечаются как blocked.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from rate_limiter import RateLimiter, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Ошибки BadRequest, после которых повторять отправку бессмысленно
+PERMANENT_BAD_REQUESTS = ('chat not found', 'user is deactivated', 'peer_id_invalid', 'bot was blocked')
+
+SENT = 'sent'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+
+def is_permanent_failure(error):
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and any(
+        reason in str(error).lower() for reason in PERMANENT_BAD_REQUESTS
+    )
+
+
+class BroadcastStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.errors = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def processed(self):
+        return self.sent + self.failed + self.blocked
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self):
+        """Обработано сообщений в секунду"""
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class BroadcastEngine:
+    def __init__(self, bot, limiter=None, workers=20, max_attempts=3, retry_delay=1.0,
+                 on_progress=None, progress_interval=3.0, on_result=None, on_send=None, max_errors=100):
+        self.bot = bot
+        self.limiter = limiter or RateLimiter()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.on_result = on_result
+        # Вызывается перед первой попыткой отправки получателю, когда лимитер уже пропустил ее
+        self.on_send = on_send
+        self.max_errors = max_errors
+        self.stats = BroadcastStats()
+        # Получатели, отправка которым уже начата (для корректной остановки)
+        self.in_flight = set()
+        self.stopped = False
+
+    def stop(self):
+        """Не брать новых получателей; уже начатые отправки доводятся до конца"""
+        self.stopped = True
+
+    async def send_one(self, chat_id, text):
+        """Отправить одно сообщение с повторами; возвращает (статус, ошибка)"""
+        attempt = 0
+        started = False
+        while True:
+            await self.limiter.acquire(chat_id)
+            if not started:
+                started = True
+                if self.on_send:
+                    await self.on_send(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                return SENT, None
+            except RetryAfter as e:
+                # Флуд-контроль действует на весь бот: останавливаем всех воркеров
+                seconds = retry_after_seconds(e)
+                self.stats.flood_waits += 1
+                self.limiter.pause(seconds)
+                logger.warning(f"Broadcast flood control: pausing for {seconds}s")
+            except Exception as e:
+                if is_permanent_failure(e):
+                    return BLOCKED, str(e)
+                attempt += 1
+                # BadRequest в PTB - тоже NetworkError, но повтор его не исправит
+                transient = isinstance(e, (TimedOut, NetworkError)) and not isinstance(e, BadRequest)
+                if attempt >= self.max_attempts or not transient:
+                    return FAILED, str(e)
+                self.stats.retries += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def _record(self, chat_id, status, error):
+        if status == SENT:
+            self.stats.sent += 1
+        elif status == BLOCKED:
+            self.stats.blocked += 1
+        else:
+            self.stats.failed += 1
+            logger.error(f"Broadcast error for user {chat_id}: {error}")
+            if len(self.stats.errors) < self.max_errors:
+                self.stats.errors.append(f"User {chat_id}: {error}")
+
+    async def _worker(self, queue):
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                if self.stopped:
+                    continue
+                chat_id, text = item
+                self.in_flight.add(chat_id)
+                status, error = await self.send_one(chat_id, text)
+                self._record(chat_id, status, error)
+                if self.on_result:
+                    await self.on_result(chat_id, status, error)
+            except Exception as e:
+                logger.error(f"Broadcast worker error: {e}")
+            finally:
+                if item is not None:
+                    self.in_flight.discard(item[0])
+                queue.task_done()
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await self.on_progress(self.stats)
+            except Exception as e:
+                logger.error(f"Broadcast progress callback error: {e}")
+
+    async def run(self, recipients):
+        """Разослать по recipients: итерируемое или async-итерируемое из (chat_id, text)"""
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report_progress()) if self.on_progress else None
+        try:
+            if hasattr(recipients, '__aiter__'):
+                async for item in recipients:
+                    if self.stopped:
+                        break
+                    await queue.put(item)
+            else:
+                for item in recipients:
+                    if self.stopped:
+                        break
+                    await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if reporter:
+                reporter.cancel()
+            self.stats.finished_at = time.monotonic()
+        logger.info(
+            f"Broadcast finished: sent={self.stats.sent} blocked={self.stats.blocked} "
+            f"failed={self.stats.failed} in {self.stats.elapsed:.1f}s ({self.stats.throughput:.1f} msg/s)"
+        )
+        return self.stats
+
+
+class SendingMarks:
+    """Групповая запись отметки sending.
+
+    Отметка должна попасть в БД до send_message, иначе после аварии не
+    понять, кому сообщение уже могло уйти. RateLimiter пропускает воркеров
+    по одному, поэтому первая отметка ждет еще linger секунд, собирая
+    отметки остальных воркеров, и все они пишутся одной транзакцией; пока
+    пишется пачка, следующие отметки копятся для следующей. Задержка не
+    снижает скорость рассылки, пока воркеров больше, чем лимит сообщений
+    в секунду, умноженный на linger.
+    """
+
+    def __init__(self, database, job_id, linger=0.2):
+        self.database = database
+        self.job_id = job_id
+        self.linger = linger
+        self._pending = []
+        self._writer = None
+
+    async def mark(self, user_id):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+        await future
+
+    async def _write_pending(self):
+        await asyncio.sleep(self.linger)
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await self.database.mark_broadcast_recipients_sending(
+                    self.job_id, [user_id for user_id, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+
+LANG_FLAGS = {'ar': '🇸🇦', 'uz': '🇺🇿', 'ru': '🇷🇺', 'en': '🇬🇧'}
+
+
+def format_progress(job_id, total, progress, throughput=None):
+    done = progress.get(SENT, 0) + progress.get(FAILED, 0) + progress.get(BLOCKED, 0)
+    text = (
+        f"🔄 Рассылка #{job_id} в процессе...\n"
+        f"✅ Отправлено: {progress.get(SENT, 0)}/{total}\n"
+        f"🚫 Заблокировали бота: {progress.get(BLOCKED, 0)}\n"
+        f"❌ Ошибок: {progress.get(FAILED, 0)}"
+    )
+    if throughput:
+        eta = (total - done) / throughput
+        text += f"\n⚡️ Скорость: {throughput:.1f} сообщ./сек, осталось ~{eta:.0f} сек"
+    return text
+
+
+def format_report(job_id, total, progress, lang_counts, errors):
+    report = (
+        f"📊 **Отчет о рассылке #{job_id}**\n\n"
+        f"✅ Успешно отправлено: {progress.get(SENT, 0)}\n"
+        f"🚫 Заблокировали бота: {progress.get(BLOCKED, 0)}\n"
+        f"❌ Ошибок: {progress.get(FAILED, 0)}\n"
+        f"📝 Всего пользователей: {total}\n\n"
+        f"🌍 **Распределение по языкам:**\n"
+    )
+    for lang, flag in LANG_FLAGS.items():
+        report += f"{flag} {lang.upper()}: {lang_counts.get(lang, 0)}\n"
+    if errors:
+        report += f"\n❌ **Ошибки:**\n"
+        for user_id, error in errors:
+            report += f"• User {user_id}: {error}\n"
+        if progress.get(FAILED, 0) > len(errors):
+            report += f"Всего ошибок: {progress.get(FAILED, 0)} (см. логи)\n"
+    return report
+
+
+class BroadcastWorker:
+    """Выполняет рассылки, сохраненные в broadcast_jobs.
+
+    Получатели забираются из БД небольшими пачками со статусом claimed;
+    непосредственно перед отправкой получатель помечается sending (одной
+    транзакцией на всех воркеров, дошедших до отправки, см. SendingMarks), а
+    результат записывается в broadcast_recipients. После перезапуска бота
+    resume() продолжает незавершенные рассылки с места остановки: claimed
+    возвращаются в очередь, а получателей, чья отправка была прервана на
+    лету (sending), повторно не трогаем, чтобы никто не получил сообщение
+    дважды.
+    """
+
+    def __init__(self, bot, database, limiter=None, claim_size=50, progress_interval=3.0, stop_timeout=10):
+        self.bot = bot
+        self.database = database
+        self.limiter = limiter or RateLimiter()
+        self.claim_size = claim_size
+        self.progress_interval = progress_interval
+        self.stop_timeout = stop_timeout
+        self._jobs = {}  # job_id -> (задача, движок, забранные и еще не отправленные user_id)
+
+    def start(self, job_id):
+        if job_id in self._jobs:
+            return
+        engine = BroadcastEngine(self.bot, self.limiter, progress_interval=self.progress_interval)
+        claimed = set()
+        task = asyncio.create_task(self._run(job_id, engine, claimed))
+        self._jobs[job_id] = (task, engine, claimed)
+        task.add_done_callback(lambda _: self._jobs.pop(job_id, None))
+
+    async def resume(self):
+        for job_id in await self.database.get_unfinished_broadcast_jobs():
+            logger.info(f"Resuming broadcast job {job_id}")
+            self.start(job_id)
+
+    async def stop(self):
+        """Остановить рассылки, вернув в pending тех, кому отправка еще не начиналась"""
+        for job_id, (task, engine, claimed) in list(self._jobs.items()):
+            # Даем начатым отправкам завершиться, чтобы их результат был известен
+            engine.stop()
+            done, _ = await asyncio.wait({task}, timeout=self.stop_timeout)
+            if not done:
+                # Оставшиеся на лету останутся в sending и не будут отправлены повторно
+                claimed -= engine.in_flight
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            await self.database.flush_broadcast_results()
+            await self.database.release_broadcast_recipients(job_id, list(claimed))
+            logger.info(f"Broadcast job {job_id} paused, {len(claimed)} recipients returned to queue")
+
+    async def _recipients(self, job_id, texts, claimed):
+        default_text = texts.get('ru') or next(iter(texts.values()))
+        while True:
+            batch = await self.database.claim_broadcast_recipients(job_id, self.claim_size)
+            if not batch:
+                return
+            claimed.update(user_id for user_id, _ in batch)
+            for user_id, language in batch:
+                yield user_id, texts.get(language, default_text)
+
+    async def _edit_progress(self, job, text, parse_mode=None):
+        chat_id, message_id = job[5], job[6]
+        if not chat_id or not message_id:
+            return
+        try:
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, parse_mode=parse_mode)
+        except Exception as e:
+            logger.error(f"Failed to update broadcast progress: {e}")
+
+    async def _run(self, job_id, engine, claimed):
+        job = None
+        try:
+            job = await self.database.get_broadcast_job(job_id)
+            if job:
+                await self._execute(job, engine, claimed)
+        except Exception as e:
+            logger.exception(f"Broadcast job {job_id} failed: {e}")
+            await self._fail(job_id, job, engine, claimed, e)
+
+    async def _fail(self, job_id, job, engine, claimed, error):
+        """Завершить рассылку со статусом failed, вернув забранных получателей в pending"""
+        engine.stop()
+        try:
+            # Уже помеченных sending release не тронет: вернутся только claimed
+            await self.database.flush_broadcast_results()
+            await self.database.release_broadcast_recipients(job_id, list(claimed))
+            report = json.loads(job[3] or '{}') if job else {}
+            report.update({'status': 'failed', 'error': str(error)})
+            await self.database.finish_broadcast_job(job_id, 'failed', report)
+        except Exception as e:
+            logger.exception(f"Broadcast job {job_id}: could not record the failure: {e}")
+        if job:
+            await self._edit_progress(job, f"❌ Рассылка #{job_id} остановлена из-за ошибки: {error}")
+
+    async def _execute(self, job, engine, claimed):
+        job_id = job[0]
+        texts = json.loads(job[2])
+        total = job[4]
+        interrupted = await self.database.start_broadcast_job(job_id)
+        if interrupted:
+            logger.warning(f"Broadcast job {job_id}: {interrupted} recipients were interrupted mid-send")
+
+        async def on_result(chat_id, status, error):
+            claimed.discard(chat_id)
+            await self.database.record_broadcast_result(job_id, chat_id, status, error)
+
+        async def on_progress(stats):
+            progress = await self.database.get_broadcast_progress(job_id)
+            await self._edit_progress(job, format_progress(job_id, total, progress, stats.throughput))
+
+        engine.on_result = on_result
+        engine.on_send = SendingMarks(self.database, job_id).mark
+        engine.on_progress = on_progress
+        stats = await engine.run(self._recipients(job_id, texts, claimed))
+        if engine.stopped:
+            return
+
+        progress = await self.database.get_broadcast_progress(job_id)
+        report = json.loads(job[3] or '{}')
+        report.update({
+            'status': 'warning' if progress.get(FAILED) else 'ok',
+            'sent': progress.get(SENT, 0),
+            'failed': progress.get(FAILED, 0),
+            'blocked': progress.get(BLOCKED, 0),
+            'elapsed': round(stats.elapsed, 1),
+        })
+        await self.database.finish_broadcast_job(job_id, 'done', report)
+        logger.info(f"Broadcast report: {json.dumps(report, ensure_ascii=False)}")
+
+        lang_counts = await self.database.get_broadcast_language_counts(job_id)
+        errors = await self.database.get_broadcast_errors(job_id)
+        await self._edit_progress(job, format_report(job_id, total, progress, lang_counts, errors), parse_mode='Markdown')
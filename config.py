@@ -13,9 +13,35 @@ USER_BOT_TOKEN = os.getenv("USER_BOT_TOKEN", "8356415375:AAHYvpAlCBFplUQ6rN0KgN9
 CHANNEL_ID = int(os.getenv("CHANNEL_ID", "-1003182432409"))
 ADMIN_ID = int(os.getenv("ADMIN_ID", "5912983856"))
 
+# Файл базы данных SQLite
+DATABASE_PATH = os.getenv("DATABASE_PATH", "bot.db")
+
+# Адрес Bot API (например, локальный telegram-bot-api сервер); пустой - api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
 # Mistral AI API ключ
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "SAIPWn5nSCdvXGFFV6DLkoXnk3T31pcX")
 
+# Контент дня: политика ротации (random или sequential) и на сколько дней планировать вперед
+DAILY_ROTATION = os.getenv("DAILY_ROTATION", "random")
+DAILY_SCHEDULE_DAYS = int(os.getenv("DAILY_SCHEDULE_DAYS", "7"))
+
+# Случайная сура/нашид и контент дня (random): uniform - равновероятно,
+# listens - чаще популярные, recency - чаще недавно добавленные
+RANDOM_SURA_WEIGHTING = os.getenv("RANDOM_SURA_WEIGHTING", "uniform")
+RANDOM_NASHEED_WEIGHTING = os.getenv("RANDOM_NASHEED_WEIGHTING", "uniform")
+
+# Режим webhook (webhook_server.py): оба бота на одном HTTP-сервере вместо двух long polling.
+# WEBHOOK_URL - публичный адрес сервера (https://...); пустой - боты работают через polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+# Адрес и порт локального HTTP-сервера; по умолчанию порт из PORT (Railway), иначе 8080
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token; пустой - новый случайный при каждом запуске
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Сколько апдейтов каждый бот обрабатывает одновременно в режиме webhook
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "16"))
+
 # Названия сур на разных языках (все 114 сур)
 SURA_NAMES = {
     1: {'ar': 'الفاتحة', 'uz': 'Fotiha', 'ru': 'Аль-Фатиха', 'en': 'Al-Fatihah'},
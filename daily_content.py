@@ -0,0 +1,156 @@
+"""
+Контент дня: расписание на несколько дней вперед и кэш в памяти
+
+Задача JobQueue юзер-бота сразу после полуночи заполняет daily_content
+на days дней вперед по политике ротации и загружает сегодняшние суру и
+нашид в память, поэтому «Сура дня» и «Нашид дня» отдают готовую строку
+(file_id, названия, чтец) без запросов к SQLite. Выбор админа не
+перезаписывается: планировщик заполняет только пустые дни и дни, чей
+контент был удален.
+
+Политики ротации:
+  sequential - по порядку библиотеки, продолжая с последнего дня;
+  random     - случайно (ContentSampler), без повторов за repeat_window дней.
+"""
+
+import bisect
+import datetime
+import logging
+import os
+import threading
+from collections import deque
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import DAILY_ROTATION, DAILY_SCHEDULE_DAYS
+from database import adb, db
+from sampler import ContentSampler, content_sampler
+
+logger = logging.getLogger(__name__)
+
+SEQUENTIAL = 'sequential'
+RANDOM = 'random'
+
+# Порядок совпадает со столбцами daily_content (sura_id, nasheed_id)
+KINDS = ('sura', 'nasheed')
+
+
+def local_timezone():
+    """Часовой пояс процесса (тот же, что у date.today()) с правилами перехода на летнее время"""
+    name = os.environ.get('TZ', '').lstrip(':')
+    try:
+        if name:
+            return ZoneInfo(name)
+        with open('/etc/localtime', 'rb') as zone_file:
+            return ZoneInfo.from_file(zone_file, key='localtime')
+    except (OSError, ValueError, ZoneInfoNotFoundError):
+        # Например, Windows без tzdata: текущее смещение, после перехода на
+        # летнее время ротация сдвинется на час до перезапуска
+        tzinfo = datetime.datetime.now().astimezone().tzinfo
+        logger.warning(f"Local time zone rules are not available, using fixed offset {tzinfo}")
+        return tzinfo
+
+
+# Через несколько секунд после полуночи по местному времени: date.today() уже новый день
+ROTATION_TIME = datetime.time(0, 0, 5, tzinfo=local_timezone())
+
+
+class DailyContent:
+    def __init__(self, database, days=7, policy=RANDOM, repeat_window=30, sampler=None, max_attempts=8):
+        self.database = database
+        self.days = days
+        self.policy = policy
+        self.repeat_window = repeat_window
+        self.sampler = sampler or content_sampler
+        self.max_attempts = max_attempts
+        self._day = None
+        self._rows = {}
+        self._generation = 0   # растет при каждом изменении контента
+        self._lock = threading.Lock()
+
+    def on_content_change(self, event, data):
+        """Слушатель Database: админ сменил контент дня или удалил контент"""
+        with self._lock:
+            self._generation += 1
+            self._day = None
+            self._rows = {}
+
+    async def warm(self, day=None):
+        """Загрузить в память суру и нашид дня; возвращает {тип: строка или None}"""
+        day = day or datetime.date.today().isoformat()
+        generation = self._generation
+        rows = {
+            'sura': await self.database.get_daily_sura(day),
+            'nasheed': await self.database.get_daily_nasheed(day),
+        }
+        with self._lock:
+            # Строки, прочитанные во время изменения контента, не сохраняем
+            if generation == self._generation:
+                self._day = day
+                self._rows = rows
+        return rows
+
+    async def get(self, kind):
+        """Строка суры (столбцы suras + qari_name) или нашида дня, None - не задано"""
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            if self._day == today:
+                return self._rows[kind]
+        # Первый запрос после запуска, смены контента или пропущенной задачи
+        rows = await self.warm(today)
+        return rows[kind]
+
+    async def _choose(self, kind, pool, recent):
+        if self.policy == SEQUENTIAL:
+            # Пул отсортирован по id: следующий после последнего, по кругу
+            index = bisect.bisect_right(pool, recent[-1]) if recent else 0
+            return pool[index % len(pool)]
+
+        # Окно не больше половины пула, иначе повторы неизбежны
+        size = min(len(recent), len(pool) // 2)
+        window = set(list(recent)[len(recent) - size:])
+        choice = await self.sampler.pick(self.database, kind)
+        for _ in range(self.max_attempts):
+            if choice not in window:
+                break
+            choice = await self.sampler.pick(self.database, kind)
+        return choice
+
+    async def fill_schedule(self):
+        """Запланировать контент на days дней начиная с сегодня; число заполненных слотов"""
+        today = datetime.date.today()
+        days = [(today + datetime.timedelta(days=offset)).isoformat() for offset in range(self.days)]
+        history_start = (today - datetime.timedelta(days=self.repeat_window)).isoformat()
+        schedule = {
+            day: (sura_id, nasheed_id)
+            for day, sura_id, nasheed_id in await self.database.get_daily_schedule(history_start, days[-1])
+        }
+
+        planned = {day: [None, None] for day in days}
+        filled = 0
+        for index, kind in enumerate(KINDS):
+            pool = [row[0] for row in await getattr(self.database, ContentSampler.POOL_LOADERS[kind])()]
+            if not pool:
+                continue
+            available = set(pool)
+            recent = deque(
+                (schedule[day][index] for day in sorted(schedule) if day < days[0]
+                 and schedule[day][index] in available),
+                maxlen=self.repeat_window
+            )
+            for day in days:
+                current = schedule.get(day, (None, None))[index]
+                if current not in available:
+                    current = planned[day][index] = await self._choose(kind, pool, recent)
+                    filled += 1
+                recent.append(current)
+
+        entries = [(day, sura_id, nasheed_id) for day, (sura_id, nasheed_id) in planned.items()
+                   if sura_id is not None or nasheed_id is not None]
+        if entries:
+            await self.database.fill_daily_schedule(entries)
+            logger.info(f"Daily content scheduled: {filled} slots till {days[-1]}, policy={self.policy}")
+        return filled
+
+
+daily_content = DailyContent(adb, days=DAILY_SCHEDULE_DAYS, policy=DAILY_ROTATION)
+db.add_content_listener(daily_content.on_content_change)
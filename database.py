@@ -1,14 +1,812 @@
 # database.py
 import sqlite3
+import abc
+import asyncio
+import functools
+import inspect
+import json
 import logging
-from datetime import datetime, date
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+
+from config import DATABASE_PATH
 
 logger = logging.getLogger(__name__)
 
+# Настройки каждого нового соединения: WAL позволяет читать параллельно с записью,
+# synchronous=NORMAL в WAL-режиме безопасен и убирает fsync на каждый коммит
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",  # ~8 МБ страничного кэша на соединение
+    "PRAGMA mmap_size=67108864",  # 64 МБ memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+]
+
+class PooledConnection:
+    """Обертка над sqlite3.Connection: close() возвращает соединение в пул, а не закрывает его"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a released connection.")
+        return getattr(conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        conn = self.__dict__.get('_conn')
+        if conn is not None:
+            self._conn = None
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Страховка для кода, который не дошел до close() из-за исключения
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite.
+
+    Соединения создаются лениво и переиспользуются между вызовами, поэтому кэш
+    подготовленных выражений sqlite3 (cached_statements) живет все время работы
+    бота, а не одну операцию. Пул никогда не блокирует вызывающего: если все
+    соединения заняты, открывается дополнительное, которое закрывается при
+    возврате, когда в пуле уже есть max_size свободных.
+    """
+
+    def __init__(self, db_path, max_size=5, timeout=10, cached_statements=256):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'acquired': 0,
+            'reused': 0,
+            'overflow_closed': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'rollbacks': 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Взять свободное соединение из пула или открыть новое"""
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = self._connect()
+            reused = False
+
+        with self._lock:
+            self._stats['acquired'] += 1
+            if reused:
+                self._stats['reused'] += 1
+            else:
+                self._size += 1
+                self._stats['created'] += 1
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Вернуть соединение в пул, откатив незавершенную транзакцию"""
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error as e:
+                logger.error(f"Rollback on release failed: {e}")
+            with self._lock:
+                self._stats['rollbacks'] += 1
+
+        with self._lock:
+            self._stats['in_use'] -= 1
+            discard = self._closed or self._idle.qsize() >= self.max_size
+            if discard:
+                self._size -= 1
+                if not self._closed:
+                    self._stats['overflow_closed'] += 1
+        if discard:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def close_all(self):
+        """Закрыть все свободные соединения; занятые закроются при возврате"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._size -= 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['max_size'] = self.max_size
+        stats['idle'] = self._idle.qsize()
+        return stats
+
+class WriteBehindBuffer(abc.ABC):
+    """Базовый буфер отложенной записи.
+
+    Данные копятся в памяти и сбрасываются в БД одной транзакцией фоновым
+    потоком: раз в flush_interval секунд или сразу, когда накопилось
+    max_pending записей. Наследник реализует _take/_restore/_write.
+    """
+
+    def __init__(self, flush_interval=5.0, max_pending=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._stats = {'recorded': 0, 'flushes': 0, 'rows_written': 0, 'errors': 0}
+
+    @abc.abstractmethod
+    def _take(self):
+        """Забрать накопленные данные (вызывается под self._lock)"""
+
+    @abc.abstractmethod
+    def _restore(self, batch):
+        """Вернуть данные в буфер после неудачной записи (под self._lock)"""
+
+    @abc.abstractmethod
+    def _write(self, batch):
+        """Записать пачку в БД, вернуть количество затронутых строк"""
+
+    def _after_record(self, pending):
+        if self._closed:
+            # После остановки фонового потока пишем сразу, чтобы ничего не потерять
+            self.flush()
+            return
+        self._ensure_thread()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def _ensure_thread(self):
+        # Поток запускается лениво: после fork() в дочернем процессе его нет
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=type(self).__name__,
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Сбросить накопленное в БД, вернуть количество записанных строк"""
+        with self._lock:
+            batch = self._take()
+        if not batch:
+            return 0
+        try:
+            written = self._write(batch)
+        except Exception as e:
+            logger.error(f"{type(self).__name__} flush error: {e}")
+            with self._lock:
+                self._restore(batch)
+                self._stats['errors'] += 1
+            return 0
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['rows_written'] += written
+        return written
+
+    def close(self):
+        """Остановить фоновый поток и записать остаток"""
+        self._closed = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=10)
+        self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+class ActivityBuffer(WriteBehindBuffer):
+    """Счетчик действий пользователей по (user_id, дата) с пакетной записью в user_activity"""
+
+    def __init__(self, database, flush_interval=5.0, max_pending=1000):
+        super().__init__(flush_interval, max_pending)
+        self._db = database
+        self._counts = {}
+
+    def record(self, user_id):
+        key = (user_id, date.today().isoformat())
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._stats['recorded'] += 1
+            pending = len(self._counts)
+        self._after_record(pending)
+
+    def _take(self):
+        counts, self._counts = self._counts, {}
+        return counts
+
+    def _restore(self, batch):
+        for key, count in batch.items():
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def _write(self, batch):
+        return self._db.write_activity_counts(batch)
+
+class BroadcastResultBuffer(WriteBehindBuffer):
+    """Результаты доставки рассылки с пакетной записью в broadcast_recipients"""
+
+    def __init__(self, database, flush_interval=1.0, max_pending=200):
+        super().__init__(flush_interval, max_pending)
+        self._db = database
+        self._results = {}
+
+    def record(self, job_id, user_id, status, error=None):
+        with self._lock:
+            self._results[(job_id, user_id)] = (status, error)
+            self._stats['recorded'] += 1
+            pending = len(self._results)
+        self._after_record(pending)
+
+    def _take(self):
+        results, self._results = self._results, {}
+        return results
+
+    def _restore(self, batch):
+        for key, result in batch.items():
+            self._results.setdefault(key, result)
+
+    def _write(self, batch):
+        return self._db.write_broadcast_results(batch)
+
+class PlayEventBuffer(WriteBehindBuffer):
+    """Прослушивания: кольцевой буфер событий и счетчики по контенту.
+
+    При сбросе счетчики прибавляются к listens, а события дописываются в
+    play_events - одной транзакцией на пачку, а не записью на каждое
+    прослушивание. Если БД долго недоступна, старые события вытесняются
+    новыми (capacity), но счетчики listens не теряются.
+    """
+
+    def __init__(self, database, flush_interval=10.0, max_pending=500, capacity=10000):
+        super().__init__(flush_interval, max_pending)
+        self._db = database
+        self._events = deque(maxlen=capacity)
+        self._counts = {}
+        self._stats['dropped'] = 0
+
+    def record(self, kind, content_id, user_id=None, source=None):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self._stats['dropped'] += 1
+            self._events.append((kind, content_id, user_id, source, int(time.time())))
+            key = (kind, content_id)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._stats['recorded'] += 1
+            pending = len(self._events)
+        self._after_record(pending)
+
+    def _take(self):
+        if not self._events:
+            return None
+        batch = (list(self._events), self._counts)
+        self._events = deque(maxlen=self._events.maxlen)
+        self._counts = {}
+        return batch
+
+    def _restore(self, batch):
+        events, counts = batch
+        capacity = self._events.maxlen
+        self._stats['dropped'] += max(0, len(events) + len(self._events) - capacity)
+        self._events = deque(events + list(self._events), maxlen=capacity)
+        for key, count in counts.items():
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def _write(self, batch):
+        return self._db.write_play_events(*batch)
+
+# Маркер промаха кэша (None - допустимое закэшированное значение языка)
+MISSING = object()
+
+class UserStateCache:
+    """Ограниченный LRU-кэш состояния пользователя с TTL.
+
+    Хранит поля, которые читаются почти в каждом апдейте: язык и флаги
+    наличия избранных сур/нашидов. Каждое попадание - это сэкономленный
+    запрос к БД, поэтому hits в статистике и есть число сэкономленных обращений.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # user_id -> {field: (value, expires_at)}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def get(self, user_id, field):
+        now = time.monotonic()
+        with self._lock:
+            fields = self._data.get(user_id)
+            if fields is not None:
+                cached = fields.get(field)
+                if cached is not None and cached[1] > now:
+                    self._data.move_to_end(user_id)
+                    self._stats['hits'] += 1
+                    return cached[0]
+            self._stats['misses'] += 1
+            return MISSING
+
+    def set(self, user_id, field, value):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            fields = self._data.get(user_id)
+            if fields is None:
+                fields = self._data[user_id] = {}
+            else:
+                self._data.move_to_end(user_id)
+            fields[field] = (value, expires_at)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, user_id, *fields):
+        """Сбросить поля пользователя (все, если поля не указаны)"""
+        with self._lock:
+            self._stats['invalidations'] += 1
+            if not fields:
+                self._data.pop(user_id, None)
+                return
+            cached = self._data.get(user_id)
+            if cached is not None:
+                for field in fields:
+                    cached.pop(field, None)
+
+    def invalidate_field(self, field):
+        """Сбросить поле у всех пользователей (массовые изменения, например удаление чтеца)"""
+        with self._lock:
+            self._stats['invalidations'] += 1
+            for cached in self._data.values():
+                cached.pop(field, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+class Page:
+    """Страница keyset-пагинации (Database.get_*_page).
+
+    rows - строки страницы, total - сколько всего строк в выборке (считается
+    на первой странице и дальше передается в курсоре), prev_cursor /
+    next_cursor - курсоры соседних страниц или None, если страницы нет.
+    Курсор - короткая строка, которую можно положить в callback_data.
+    """
+
+    def __init__(self, rows, total, prev_cursor=None, next_cursor=None):
+        self.rows = rows
+        self.total = total
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+def _encode_cursor(values):
+    return '|'.join(str(value) for value in values)
+
+def _decode_cursor(cursor, keys):
+    return [key_type(part) for (_, key_type), part in zip(keys, cursor.split('|'))]
+
+# Сводная статистика (stats_rollup): счетчики за день, неделю и месяц.
+# Корзина периода - его первый день: дата, понедельник недели, 1-е число месяца.
+# period = 'total' - текущие значения без периода (всего пользователей и т.п.).
+# Строки обновляют триггеры на исходных таблицах в той же транзакции, что и
+# сами данные, а STATS_BACKFILL пересчитывает их с нуля по тем же правилам.
+STATS_PERIODS = "(SELECT 'day' AS period UNION ALL SELECT 'week' UNION ALL SELECT 'month')"
+
+
+def _stats_bucket(day):
+    """SQL: первый день периода p.period, в который попадает дата day"""
+    return (f"CASE p.period WHEN 'day' THEN {day} "
+            f"WHEN 'week' THEN date({day}, '-6 days', 'weekday 1') "
+            f"ELSE date({day}, 'start of month') END")
+
+
+def _stats_increment(day, items, where='true'):
+    """SQL: прибавить (метрика, измерение, величина) из items ко всем трем периодам даты day"""
+    return f'''INSERT INTO stats_rollup (period, bucket, metric, dimension, value)
+            SELECT p.period, {_stats_bucket(day)}, i.metric, i.dimension, i.value
+            FROM {STATS_PERIODS} p, ({items}) i
+            WHERE {where}
+            ON CONFLICT (period, bucket, metric, dimension) DO UPDATE SET value = stats_rollup.value + excluded.value;'''
+
+
+def _stats_gauge(metric, dimension, delta):
+    """SQL: изменить текущее значение (period = 'total') на delta"""
+    return f'''INSERT INTO stats_rollup (period, bucket, metric, dimension, value)
+            VALUES ('total', '', '{metric}', {dimension}, {delta})
+            ON CONFLICT (period, bucket, metric, dimension) DO UPDATE SET value = stats_rollup.value + excluded.value;'''
+
+
+_REGISTRATION_DAY = "date(COALESCE({row}.registration_date, 'now'), 'localtime')"
+_PLAY_DAY = "date({row}.played_at, 'unixepoch', 'localtime')"
+_TODAY = "date('now', 'localtime')"
+
+STATS_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS stats_users_insert AFTER INSERT ON users BEGIN
+        {_stats_increment(_REGISTRATION_DAY.format(row='new'), "SELECT 'new_users' AS metric, '' AS dimension, 1 AS value")}
+        {_stats_gauge('users', "''", 1)}
+        {_stats_gauge('users_by_language', "COALESCE(new.language, '')", 1)}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS stats_users_delete AFTER DELETE ON users BEGIN
+        {_stats_gauge('users', "''", -1)}
+        {_stats_gauge('users_by_language', "COALESCE(old.language, '')", -1)}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS stats_users_language AFTER UPDATE OF language ON users
+    WHEN old.language IS NOT new.language BEGIN
+        {_stats_gauge('users_by_language', "COALESCE(old.language, '')", -1)}
+        {_stats_gauge('users_by_language', "COALESCE(new.language, '')", 1)}
+    END''',
+    # Новая строка user_activity - первое действие пользователя за день; за
+    # неделю и месяц он считается, только если раньше в этом периоде его не было
+    f'''CREATE TRIGGER IF NOT EXISTS stats_activity_insert AFTER INSERT ON user_activity BEGIN
+        {_stats_increment('new.activity_date', "SELECT 'active_users' AS metric, '' AS dimension, 1 AS value",
+                          f"""NOT EXISTS (SELECT 1 FROM user_activity a WHERE a.user_id = new.user_id
+                          AND a.activity_date >= {_stats_bucket('new.activity_date')}
+                          AND a.activity_date < new.activity_date)""")}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS stats_play_insert AFTER INSERT ON play_events BEGIN
+        {_stats_increment(_PLAY_DAY.format(row='new'), """
+            SELECT new.content_type || '_plays' AS metric, '' AS dimension, 1 AS value
+            UNION ALL SELECT new.content_type || '_plays', CAST(new.content_id AS TEXT), 1
+            UNION ALL SELECT 'qari_plays', CAST(qari_id AS TEXT), 1 FROM suras
+                WHERE new.content_type = 'sura' AND sura_id = new.content_id""")}
+    END''',
+]
+for _kind in ('sura', 'nasheed'):
+    STATS_TRIGGERS += [
+        f'''CREATE TRIGGER IF NOT EXISTS stats_favorite_{_kind}s_insert AFTER INSERT ON user_favorite_{_kind}s BEGIN
+        {_stats_increment(_TODAY, f"SELECT '{_kind}_favorites_added' AS metric, '' AS dimension, 1 AS value")}
+        {_stats_gauge('favorites', f"'{_kind}'", 1)}
+    END''',
+        f'''CREATE TRIGGER IF NOT EXISTS stats_favorite_{_kind}s_delete AFTER DELETE ON user_favorite_{_kind}s BEGIN
+        {_stats_increment(_TODAY, f"SELECT '{_kind}_favorites_removed' AS metric, '' AS dimension, 1 AS value")}
+        {_stats_gauge('favorites', f"'{_kind}'", -1)}
+    END''',
+    ]
+
+
+def _stats_backfill(metric, source, day, dimension="''", value='COUNT(*)'):
+    """SQL: посчитать метрику за все периоды по строкам source (алиас x)"""
+    return f'''INSERT INTO stats_rollup (period, bucket, metric, dimension, value)
+        SELECT period, bucket, metric, dimension, {value} FROM (
+            SELECT p.period, {_stats_bucket(day)} AS bucket, {metric} AS metric, {dimension} AS dimension, x.*
+            FROM {source} x, {STATS_PERIODS} p
+        ) GROUP BY period, bucket, metric, dimension'''
+
+
+STATS_BACKFILL = [
+    "DELETE FROM stats_rollup",
+    _stats_backfill("'new_users'", "users", _REGISTRATION_DAY.format(row='x')),
+    _stats_backfill("'active_users'", "user_activity", "x.activity_date", value="COUNT(DISTINCT user_id)"),
+    _stats_backfill("content_type || '_plays'", "play_events", _PLAY_DAY.format(row='x')),
+    _stats_backfill("content_type || '_plays'", "play_events", _PLAY_DAY.format(row='x'),
+                    dimension="CAST(x.content_id AS TEXT)"),
+    _stats_backfill("'qari_plays'", '''(SELECT e.played_at, s.qari_id FROM play_events e
+                    JOIN suras s ON e.content_type = 'sura' AND s.sura_id = e.content_id)''',
+                    _PLAY_DAY.format(row='x'), dimension="CAST(x.qari_id AS TEXT)"),
+    # История удалений из избранного не хранится: добавления - по оставшимся строкам
+    _stats_backfill("'sura_favorites_added'", "user_favorite_suras", "date(x.added_date, 'localtime')"),
+    _stats_backfill("'nasheed_favorites_added'", "user_favorite_nasheeds", "date(x.added_date, 'localtime')"),
+    '''INSERT INTO stats_rollup (period, bucket, metric, dimension, value)
+        SELECT 'total', '', 'users', '', COUNT(*) FROM users
+        UNION ALL SELECT 'total', '', 'users_by_language', COALESCE(language, ''), COUNT(*)
+            FROM users GROUP BY COALESCE(language, '')
+        UNION ALL SELECT 'total', '', 'favorites', 'sura', COUNT(*) FROM user_favorite_suras
+        UNION ALL SELECT 'total', '', 'favorites', 'nasheed', COUNT(*) FROM user_favorite_nasheeds''',
+]
+
+
+# Версионированные миграции схемы: (версия, описание, SQL-операторы).
+# Каждая применяется один раз в своей транзакции и записывается в schema_version.
+# Новые миграции только добавлять в конец, уже выпущенные не менять.
+MIGRATIONS = [
+    (1, "unique index on suras(qari_id, order_number)", [
+        # До индекса INSERT OR REPLACE в add_sura никогда не конфликтовал и плодил дубли.
+        # Оставляем последнюю загруженную версию суры и переносим на нее ссылки.
+        '''CREATE TEMP TABLE sura_duplicates AS
+            SELECT s.sura_id AS old_id, k.keep_id AS new_id
+            FROM suras s
+            JOIN (SELECT qari_id, order_number, MAX(sura_id) AS keep_id
+                  FROM suras GROUP BY qari_id, order_number) k
+              ON s.qari_id = k.qari_id AND s.order_number = k.order_number
+            WHERE s.sura_id <> k.keep_id''',
+        '''UPDATE OR IGNORE user_favorite_suras
+            SET sura_id = (SELECT new_id FROM sura_duplicates WHERE old_id = sura_id)
+            WHERE sura_id IN (SELECT old_id FROM sura_duplicates)''',
+        "DELETE FROM user_favorite_suras WHERE sura_id IN (SELECT old_id FROM sura_duplicates)",
+        '''UPDATE daily_content
+            SET sura_id = (SELECT new_id FROM sura_duplicates WHERE old_id = sura_id)
+            WHERE sura_id IN (SELECT old_id FROM sura_duplicates)''',
+        "DELETE FROM suras WHERE sura_id IN (SELECT old_id FROM sura_duplicates)",
+        "DROP TABLE sura_duplicates",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_suras_qari_order ON suras(qari_id, order_number)",
+    ]),
+    (2, "indexes for chat history, activity stats and admin chats", [
+        "CREATE INDEX IF NOT EXISTS idx_messages_chat_date ON messages(chat_id, message_date)",
+        # Покрывающий индекс: COUNT(DISTINCT user_id) за день читается без обращения к таблице
+        "CREATE INDEX IF NOT EXISTS idx_user_activity_date_user ON user_activity(activity_date, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_admin_chats_admin_user ON admin_chats(admin_id, user_id)",
+    ]),
+    (3, "translation cache", [
+        '''CREATE TABLE IF NOT EXISTS translation_cache (
+            cache_key TEXT PRIMARY KEY,
+            kind TEXT,
+            target TEXT,
+            model TEXT,
+            prompt_version INTEGER,
+            source_text TEXT,
+            result TEXT,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (4, "persistent broadcast jobs", [
+        '''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_by INTEGER,
+            status TEXT DEFAULT 'pending',
+            texts TEXT,
+            report TEXT,
+            total INTEGER DEFAULT 0,
+            progress_chat_id INTEGER,
+            progress_message_id INTEGER,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_date DATETIME,
+            finished_date DATETIME
+        )''',
+        # status: pending -> claimed -> sending -> sent / failed / blocked
+        '''CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER,
+            user_id INTEGER,
+            language TEXT,
+            status TEXT DEFAULT 'pending',
+            error TEXT,
+            updated_date DATETIME,
+            PRIMARY KEY (job_id, user_id)
+        ) WITHOUT ROWID''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status ON broadcast_recipients(job_id, status)",
+    ]),
+    (5, "users.is_blocked for broadcast segments", [
+        "ALTER TABLE users ADD COLUMN is_blocked INTEGER DEFAULT 0",
+    ]),
+    (6, "audio_fingerprints for idempotent sura imports", [
+        # Аудио, уже загруженное на канал: по sha256 содержимого (файлы из ZIP)
+        # или по file_unique_id Telegram (пересланные боту аудио)
+        '''CREATE TABLE IF NOT EXISTS audio_fingerprints (
+            fingerprint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sha256 TEXT,
+            file_unique_id TEXT,
+            file_size INTEGER,
+            duration INTEGER,
+            file_id TEXT NOT NULL,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_audio_fingerprints_sha256 ON audio_fingerprints(sha256, file_size) WHERE sha256 IS NOT NULL",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_audio_fingerprints_unique_id ON audio_fingerprints(file_unique_id) WHERE file_unique_id IS NOT NULL",
+    ]),
+    (7, "content_version shared by both bot processes", [
+        # Админ-бот увеличивает версию при каждом изменении контента,
+        # юзер-бот опрашивает ее и сбрасывает свои кэши (poll_content_version)
+        '''CREATE TABLE IF NOT EXISTS content_version (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "INSERT OR IGNORE INTO content_version (scope, version) VALUES ('content', 0)",
+    ]),
+    (8, "indexes for keyset pagination", [
+        "CREATE INDEX IF NOT EXISTS idx_users_registration ON users(registration_date, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_favorite_suras_user_date ON user_favorite_suras(user_id, added_date, sura_id)",
+        "CREATE INDEX IF NOT EXISTS idx_favorite_nasheeds_user_date ON user_favorite_nasheeds(user_id, added_date, nasheed_id)",
+    ]),
+    (9, "play events log", [
+        '''CREATE TABLE IF NOT EXISTS play_events (
+            event_id INTEGER PRIMARY KEY,
+            content_type TEXT NOT NULL,
+            content_id INTEGER NOT NULL,
+            user_id INTEGER,
+            source TEXT,
+            played_at INTEGER NOT NULL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_play_events_played_at ON play_events(played_at)",
+    ]),
+    (10, "trigram full-text index over user names", [
+        # Внешний контент: в индексе только триграммы, сами строки остаются в users
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            first_name, username,
+            content='users', content_rowid='user_id', tokenize='trigram'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, first_name, username) VALUES (new.user_id, new.first_name, new.username);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, first_name, username)
+            VALUES ('delete', old.user_id, old.first_name, old.username);
+        END''',
+        # save_user обновляет имя на каждый /start: индекс трогаем, только если оно изменилось
+        '''CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF first_name, username ON users
+        WHEN old.first_name IS NOT new.first_name OR old.username IS NOT new.username BEGIN
+            INSERT INTO users_fts (users_fts, rowid, first_name, username)
+            VALUES ('delete', old.user_id, old.first_name, old.username);
+            INSERT INTO users_fts (rowid, first_name, username) VALUES (new.user_id, new.first_name, new.username);
+        END''',
+        "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+    ]),
+    (11, "statistics rollups", [
+        '''CREATE TABLE IF NOT EXISTS stats_rollup (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            dimension TEXT NOT NULL DEFAULT '',
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket, metric, dimension)
+        ) WITHOUT ROWID''',
+        *STATS_TRIGGERS,
+        *STATS_BACKFILL,
+    ]),
+    (12, "read cursors and unread counters for admin chats", [
+        "ALTER TABLE admin_chats ADD COLUMN last_read_message_id INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE admin_chats ADD COLUMN unread_count INTEGER NOT NULL DEFAULT 0",
+        '''CREATE TABLE IF NOT EXISTS admin_unread (
+            admin_id INTEGER PRIMARY KEY,
+            unread_count INTEGER NOT NULL DEFAULT 0
+        )''',
+        # Прочитанным считается все, что было до последнего ответа админа в чате
+        '''UPDATE admin_chats SET last_read_message_id = COALESCE(
+            (SELECT MAX(message_id) FROM messages m WHERE m.chat_id = admin_chats.chat_id AND m.is_from_admin = 1), 0)''',
+        '''UPDATE admin_chats SET unread_count = (
+            SELECT COUNT(*) FROM messages m
+            WHERE m.chat_id = admin_chats.chat_id AND m.is_from_admin = 0
+            AND m.message_id > admin_chats.last_read_message_id)''',
+        '''INSERT OR REPLACE INTO admin_unread (admin_id, unread_count)
+            SELECT admin_id, SUM(unread_count) FROM admin_chats GROUP BY admin_id''',
+        '''CREATE TRIGGER IF NOT EXISTS chat_unread_user_message AFTER INSERT ON messages
+        WHEN new.is_from_admin = 0 BEGIN
+            UPDATE admin_chats SET unread_count = unread_count + 1 WHERE chat_id = new.chat_id;
+            INSERT INTO admin_unread (admin_id, unread_count)
+            SELECT admin_id, 1 FROM admin_chats WHERE chat_id = new.chat_id
+            ON CONFLICT (admin_id) DO UPDATE SET unread_count = admin_unread.unread_count + 1;
+        END''',
+        # Ответ админа означает, что чат прочитан
+        '''CREATE TRIGGER IF NOT EXISTS chat_read_admin_reply AFTER INSERT ON messages
+        WHEN new.is_from_admin = 1 BEGIN
+            UPDATE admin_unread SET unread_count = unread_count - (
+                SELECT unread_count FROM admin_chats WHERE chat_id = new.chat_id)
+            WHERE admin_id = (SELECT admin_id FROM admin_chats WHERE chat_id = new.chat_id);
+            UPDATE admin_chats SET unread_count = 0, last_read_message_id = new.message_id
+            WHERE chat_id = new.chat_id;
+        END''',
+    ]),
+    (13, "chat history ordered by message_id", [
+        "CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id, message_id)",
+        "DROP INDEX IF EXISTS idx_messages_chat_date",
+    ]),
+    (14, "keyset indexes on dates with NULL as ''", [
+        # Ключи страниц - COALESCE(дата, ''): NULL в курсоре не сравнить с датой
+        "CREATE INDEX IF NOT EXISTS idx_users_registration_key ON users(COALESCE(registration_date, ''), user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_favorite_suras_user_key "
+        "ON user_favorite_suras(user_id, COALESCE(added_date, ''), sura_id)",
+        "CREATE INDEX IF NOT EXISTS idx_favorite_nasheeds_user_key "
+        "ON user_favorite_nasheeds(user_id, COALESCE(added_date, ''), nasheed_id)",
+        "DROP INDEX IF EXISTS idx_users_registration",
+        "DROP INDEX IF EXISTS idx_favorite_suras_user_date",
+        "DROP INDEX IF EXISTS idx_favorite_nasheeds_user_date",
+    ]),
+]
+
+# Таблицы со счетчиком listens для каждого типа прослушиваемого контента
+PLAY_COUNTERS = {
+    'sura': "UPDATE suras SET listens = listens + ? WHERE sura_id = ?",
+    'nasheed': "UPDATE nasheeds SET listens = listens + ? WHERE nasheed_id = ?",
+}
+
+# Наибольшее значение INTEGER в SQLite
+SQLITE_MAX_INT = (1 << 63) - 1
+
+# Языки интерфейса; пользователи без выбранного языка получают русскую версию
+SUPPORTED_LANGUAGES = ('ar', 'uz', 'ru', 'en')
+
+
+# Горячие запросы: метод Database и аргументы для проверки. check_query_plans()
+# вызывает метод, перехватывает SQL, который он выполняет на самом деле, и
+# требует от плана каждого SELECT ни одного полного SCAN таблицы и ни одной
+# временной B-tree для сортировки. Курсоры заданы, чтобы проверить и переход
+# к следующей странице.
+HOT_QUERIES = {
+    'get_sura_file_id': (1, 1),
+    'get_sura_by_qari_and_order': (1, 1),
+    'get_daily_sura': ('2024-01-01',),
+    'get_daily_nasheed': ('2024-01-01',),
+    'get_daily_schedule': ('2024-01-01', '2024-01-08'),
+    'get_stats_summary': (date(2024, 1, 1),),
+    'get_chat_id': (1, 1),
+    'get_suras_page': (1, '114|5'),
+    'get_users_page': ('100|2024-01-01 00:00:00|1',),
+    'get_favorite_suras_page': (1, 'ru', '10|2024-01-01 00:00:00|1'),
+    'get_unread_messages_count': (1,),
+    'get_chat_messages_page': (1, '100|100'),
+    'iter_chat_messages': (1,),
+}
+
 class Database:
-    def __init__(self, db_path='bot.db'):
+    def __init__(self, db_path='bot.db', pool_size=5):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, max_size=pool_size)
+        self.activity = ActivityBuffer(self)
+        self.user_cache = UserStateCache()
+        self.broadcast_results = BroadcastResultBuffer(self)
+        self.plays = PlayEventBuffer(self)
+        self.content_listeners = []
+        self._closed = False
         self.init_db()
+        # Последняя известная этому процессу версия контента
+        self._content_version = self.get_content_version()
     
     def init_db(self):
         """Инициализация базы данных с новыми таблицами"""
@@ -101,11 +899,250 @@ class Database:
         
         conn.commit()
         conn.close()
+        self.migrate()
         logger.info("Database initialized successfully")
-    
+
+    def get_schema_version(self, conn=None):
+        own_conn = conn is None
+        if own_conn:
+            conn = self.get_connection()
+        try:
+            result = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+            return result[0] or 0
+        finally:
+            if own_conn:
+                conn.close()
+
+    def migrate(self):
+        """Применить недостающие миграции из MIGRATIONS"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_date DATETIME DEFAULT CURRENT_TIMESTAMP
+            )''')
+            conn.commit()
+            current = self.get_schema_version(conn)
+            for version, description, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                # Оба бота стартуют одновременно: берем блокировку записи
+                # и перепроверяем версию уже под ней
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    applied = conn.execute(
+                        "SELECT 1 FROM schema_version WHERE version = ?", (version,)
+                    ).fetchone()
+                    if not applied:
+                        for statement in statements:
+                            conn.execute(statement)
+                        conn.execute(
+                            "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                            (version, description)
+                        )
+                        logger.info(f"Applied migration {version}: {description}")
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Migration {version} failed: {e}")
+                    raise
+        finally:
+            conn.close()
+
+    def check_query_plans(self):
+        """EXPLAIN QUERY PLAN для SELECT-ов методов из HOT_QUERIES: {метод: [проблемные шаги плана]}
+
+        Вызывать при старте или в тестах: на время проверки get_connection
+        подменяется, и запросы фоновых потоков тоже попали бы в выборку.
+        """
+        problems = {}
+        conn = self.get_connection()
+        try:
+            for name, args in HOT_QUERIES.items():
+                statements = [
+                    sql for sql in self._trace_statements(getattr(self, name), *args)
+                    if sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+                ]
+                if not statements:
+                    problems[name] = ['no SELECT executed']
+                for sql in statements:
+                    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                    bad = [
+                        row[3] for row in plan
+                        if (row[3].startswith('SCAN') and 'COVERING INDEX' not in row[3])
+                        or 'TEMP B-TREE' in row[3]
+                    ]
+                    if bad:
+                        problems.setdefault(name, []).extend(bad)
+        finally:
+            conn.close()
+        return problems
+
+    def _trace_statements(self, method, *args):
+        """SQL, выполненный вызовом method(*args), с подставленными значениями параметров"""
+        statements = []
+        traced = []
+        get_connection = self.get_connection
+
+        def traced_connection():
+            conn = get_connection()
+            conn.set_trace_callback(statements.append)
+            traced.append(conn._conn)
+            return conn
+
+        self.get_connection = traced_connection
+        try:
+            result = method(*args)
+            if inspect.isgenerator(result):
+                for _ in result:
+                    pass
+        finally:
+            del self.get_connection
+            for conn in traced:
+                try:
+                    conn.set_trace_callback(None)
+                except sqlite3.ProgrammingError:
+                    pass  # лишнее соединение пула уже закрыто
+        return statements
+
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Соединение из пула; conn.close() возвращает его обратно"""
+        return self.pool.acquire()
+
+    def get_pool_stats(self):
+        return self.pool.get_stats()
+
+    def add_content_listener(self, listener):
+        """listener(event, data) вызывается после изменения чтецов, сур и нашидов.
+
+        Изменения, сделанные другим процессом, приходят одним событием
+        content_changed из poll_content_version().
+        """
+        self.content_listeners.append(listener)
+
+    def _fire_content_listeners(self, event, data):
+        for listener in self.content_listeners:
+            try:
+                listener(event, data)
+            except Exception as e:
+                logger.error(f"Content listener failed on {event}: {e}")
+
+    def _notify_content_change(self, event, **data):
+        self._bump_content_version()
+        self._fire_content_listeners(event, data)
+
+    def get_content_version(self):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT version FROM content_version WHERE scope = 'content'").fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def _bump_content_version(self):
+        conn = self.get_connection()
+        try:
+            row = conn.execute('''
+                UPDATE content_version SET version = version + 1, updated_date = CURRENT_TIMESTAMP
+                WHERE scope = 'content' RETURNING version
+            ''').fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        # Свое изменение слушатели получат напрямую; если версия ушла дальше,
+        # чужие изменения еще не обработаны - их подхватит poll_content_version
+        if row and row[0] == self._content_version + 1:
+            self._content_version = row[0]
+
+    def poll_content_version(self):
+        """Проверить, не менял ли контент другой процесс; True, если кэши сброшены"""
+        version = self.get_content_version()
+        if version == self._content_version:
+            return False
+        logger.info(f"Content version changed: {self._content_version} -> {version}")
+        self._content_version = version
+        # Удаление чтеца в другом процессе могло убрать избранные суры
+        self.user_cache.invalidate_field('has_favorite_suras')
+        self._fire_content_listeners('content_changed', {'version': version})
+        return True
+
+    def get_cache_stats(self):
+        return self.user_cache.get_stats()
+
+    def close(self):
+        """Корректное завершение работы с БД (вызывается при остановке бота)"""
+        if self._closed:
+            return
+        self._closed = True
+        self.activity.close()
+        self.broadcast_results.close()
+        self.plays.close()
+        logger.info(f"Activity buffer stats: {self.activity.get_stats()}")
+        logger.info(f"Play event buffer stats: {self.plays.get_stats()}")
+        logger.info(f"User state cache stats: {self.get_cache_stats()}")
+        logger.info(f"Database pool stats: {self.get_pool_stats()}")
+        self.pool.close_all()
     
+    # Pagination
+    def _keyset_page(self, columns, source, where, params, keys, cursor=None, backward=False,
+                     limit=10, descending=False):
+        """Страница выборки одним запросом: строки, общее количество и курсоры.
+
+        keys - [(выражение, тип)] уникального ключа сортировки; для него нужен
+        индекс, тогда переход к любой странице стоит как чтение первой.
+        Выражения не должны давать NULL: курсор хранит значения строкой, а
+        row value с NULL ни с чем не сравнивается (отсюда COALESCE у дат).
+        cursor берется из prev_cursor/next_cursor предыдущей страницы,
+        backward=True - страница перед курсором. Общее количество считается
+        только для первой страницы (COUNT(*) - это проход по всей выборке),
+        дальше оно едет в курсоре.
+        """
+        key_list = ', '.join(expr for expr, _ in keys)
+        if cursor:
+            total, *values = _decode_cursor(cursor, [('total', int)] + list(keys))
+            op = '<' if descending != backward else '>'
+            sql = (f"SELECT {columns}, {key_list} FROM {source} WHERE {where} "
+                   f"AND ({key_list}) {op} ({', '.join('?' * len(values))})")
+            query_params = list(params) + values
+            if len(keys) > 1:
+                # Row value по индексу на выражении (COALESCE) SQLite не ищет
+                # диапазоном; лишняя граница по первому ключу дает SEARCH
+                sql += f" AND {keys[0][0]} {op}= ?"
+                query_params.append(values[0])
+        else:
+            sql = (f"SELECT {columns}, {key_list}, (SELECT COUNT(*) FROM {source} WHERE {where}) "
+                   f"FROM {source} WHERE {where}")
+            query_params = list(params) + list(params)
+        order = 'DESC' if descending != backward else 'ASC'
+        sql += " ORDER BY " + ', '.join(f"{expr} {order}" for expr, _ in keys) + " LIMIT ?"
+        # Лишняя строка показывает, есть ли следующая страница
+        query_params.append(limit + 1)
+
+        conn = self.get_connection()
+        try:
+            fetched = conn.execute(sql, query_params).fetchall()
+        finally:
+            conn.close()
+
+        more = len(fetched) > limit
+        fetched = fetched[:limit]
+        if backward:
+            fetched.reverse()
+        if not cursor:
+            total = fetched[0][-1] if fetched else 0
+            fetched = [row[:-1] for row in fetched]
+        width = len(keys)
+        rows = [row[:-width] for row in fetched]
+        if not rows:
+            return Page(rows, total)
+
+        first_cursor = _encode_cursor((total, *fetched[0][-width:]))
+        last_cursor = _encode_cursor((total, *fetched[-1][-width:]))
+        if backward:
+            return Page(rows, total, first_cursor if more else None, last_cursor)
+        return Page(rows, total, first_cursor if cursor else None, last_cursor if more else None)
+
     # User methods
     def save_user(self, user_id, username, first_name):
         conn = self.get_connection()
@@ -116,8 +1153,9 @@ class Database:
         
         if exists:
             # Обновляем существующего пользователя без изменения языка
+            # (раз пользователь снова пишет боту, значит он его разблокировал)
             cursor.execute('''
-                UPDATE users SET username = ?, first_name = ?, last_active = CURRENT_TIMESTAMP 
+                UPDATE users SET username = ?, first_name = ?, last_active = CURRENT_TIMESTAMP, is_blocked = 0
                 WHERE user_id = ?
             ''', (username, first_name, user_id))
         else:
@@ -130,24 +1168,127 @@ class Database:
         conn.close()
     
     def update_user_activity(self, user_id):
+        """Учитывает действие пользователя в памяти; в БД попадет при ближайшем сбросе буфера"""
+        self.activity.record(user_id)
+
+    def write_activity_counts(self, counts):
+        """Пакетная запись {(user_id, activity_date): n} одной транзакцией"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        today = date.today().isoformat()
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_activity (user_id, activity_date, actions_count)
-            VALUES (?, ?, COALESCE((SELECT actions_count FROM user_activity WHERE user_id = ? AND activity_date = ?), 0) + 1)
-        ''', (user_id, today, user_id, today))
+        cursor.executemany('''
+            INSERT INTO user_activity (user_id, activity_date, actions_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, activity_date) DO UPDATE SET actions_count = actions_count + excluded.actions_count
+        ''', [(user_id, activity_date, count) for (user_id, activity_date), count in counts.items()])
         conn.commit()
         conn.close()
+        return len(counts)
+
+    def flush_activity(self):
+        return self.activity.flush()
     
+    def record_play(self, kind, content_id, user_id=None, source=None):
+        """Учитывает прослушивание суры или нашида; в БД попадет при ближайшем сбросе буфера.
+
+        source - откуда запущено: list, favorite, random, daily, inline
+        """
+        self.plays.record(kind, content_id, user_id, source)
+
+    def write_play_events(self, events, counts):
+        """Пакетная запись событий [(тип, id, user_id, source, played_at)] и
+        счетчиков {(тип, id): n} одной транзакцией"""
+        conn = self.get_connection()
+        try:
+            with conn:
+                for kind, statement in PLAY_COUNTERS.items():
+                    conn.executemany(statement, [
+                        (count, content_id) for (counter_kind, content_id), count in counts.items()
+                        if counter_kind == kind
+                    ])
+                conn.executemany('''
+                    INSERT INTO play_events (content_type, content_id, user_id, source, played_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', events)
+        finally:
+            conn.close()
+        return len(events)
+
+    # Statistics rollups
+    def rebuild_stats_rollup(self):
+        """Пересчитать stats_rollup по исходным таблицам (backfill_stats.py); число строк"""
+        self.activity.flush()
+        self.plays.flush()
+        conn = self.get_connection()
+        try:
+            # Под блокировкой записи: триггеры не добавят ничего между DELETE и пересчетом
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in STATS_BACKFILL:
+                    conn.execute(statement)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return conn.execute("SELECT COUNT(*) FROM stats_rollup").fetchone()[0]
+        finally:
+            conn.close()
+
+    def get_stats_summary(self, day=None):
+        """{(период, метрика, измерение): значение} за день, неделю и месяц даты day
+        и текущие значения (период 'total'); строки по отдельным сурам и чтецам не входят"""
+        day = day or date.today()
+        week = day - timedelta(days=day.weekday())
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT period, metric, dimension, value FROM stats_rollup
+                WHERE period = 'day' AND bucket = ? AND dimension = ''
+                UNION ALL SELECT period, metric, dimension, value FROM stats_rollup
+                WHERE period = 'week' AND bucket = ? AND dimension = ''
+                UNION ALL SELECT period, metric, dimension, value FROM stats_rollup
+                WHERE period = 'month' AND bucket = ? AND dimension = ''
+                UNION ALL SELECT period, metric, dimension, value FROM stats_rollup
+                WHERE period = 'total' AND bucket = ''
+            ''', (day.isoformat(), week.isoformat(), day.replace(day=1).isoformat())).fetchall()
+        finally:
+            conn.close()
+        return {(period, metric, dimension): value for period, metric, dimension, value in rows}
+
+    def get_top_plays(self, metric, period='week', day=None, limit=3):
+        """[(id, прослушиваний)] самых популярных сур, чтецов или нашидов за период даты day.
+
+        metric - sura_plays, qari_plays или nasheed_plays
+        """
+        day = day or date.today()
+        bucket = {
+            'day': day,
+            'week': day - timedelta(days=day.weekday()),
+            'month': day.replace(day=1),
+        }[period]
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT dimension, value FROM stats_rollup
+                WHERE period = ? AND bucket = ? AND metric = ? AND dimension <> ''
+                ORDER BY value DESC LIMIT ?
+            ''', (period, bucket.isoformat(), metric, limit)).fetchall()
+        finally:
+            conn.close()
+        return [(int(content_id), value) for content_id, value in rows]
+
     def get_user_language(self, user_id):
+        language = self.user_cache.get(user_id, 'language')
+        if language is not MISSING:
+            return language
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT language FROM users WHERE user_id = ?", (user_id,))
         result = cursor.fetchone()
         conn.close()
         # Возвращаем язык или None если не установлен
-        return result[0] if result and result[0] else None
+        language = result[0] if result and result[0] else None
+        self.user_cache.set(user_id, 'language', language)
+        return language
     
     def set_user_language(self, user_id, language):
         conn = self.get_connection()
@@ -155,7 +1296,25 @@ class Database:
         cursor.execute("UPDATE users SET language = ? WHERE user_id = ?", (language, user_id))
         conn.commit()
         conn.close()
+        self.user_cache.set(user_id, 'language', language)
     
+    def get_user(self, user_id):
+        conn = self.get_connection()
+        try:
+            return conn.execute(
+                "SELECT user_id, username, first_name FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    def get_users_page(self, cursor=None, backward=False, limit=20):
+        """Пользователи, новые сначала: (user_id, username, first_name)"""
+        return self._keyset_page(
+            "user_id, username, first_name", "users", "1", (),
+            [("COALESCE(registration_date, '')", str), ('user_id', int)],
+            cursor, backward, limit, descending=True
+        )
+
     def get_all_users(self):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -164,7 +1323,84 @@ class Database:
         conn.close()
         return users
     
+    def _recipient_segment(self, languages=None, active_since=None, include_blocked=False, exclude_user_ids=()):
+        """Условия WHERE и параметры для сегмента получателей рассылки"""
+        conditions = []
+        params = []
+        if not include_blocked:
+            conditions.append("COALESCE(u.is_blocked, 0) = 0")
+        if languages:
+            conditions.append(f"lang IN ({', '.join('?' * len(languages))})")
+            params.extend(languages)
+        if active_since:
+            self.activity.flush()
+            conditions.append(
+                "EXISTS (SELECT 1 FROM user_activity a WHERE a.user_id = u.user_id AND a.activity_date >= ?)"
+            )
+            params.append(str(active_since))
+        if exclude_user_ids:
+            conditions.append(f"u.user_id NOT IN ({', '.join('?' * len(exclude_user_ids))})")
+            params.extend(exclude_user_ids)
+        return conditions, params
+
+    def iter_broadcast_recipients(self, languages=None, active_since=None, include_blocked=False,
+                                  exclude_user_ids=(), batch_size=1000):
+        """Получатели рассылки пачками [(user_id, язык)] в порядке user_id.
+
+        Пачки выбираются keyset-запросом по первичному ключу (user_id > последний),
+        соединение берется на каждую пачку, поэтому весь список пользователей
+        никогда не лежит в памяти и не держит долгую транзакцию чтения.
+
+        Сегмент (в том числе сброс буфера активности) вычисляется сразу при
+        вызове, а не при первой пачке: генератор потом читают внутри открытой
+        транзакции записи (create_broadcast_job), и запись из flush() на
+        другом соединении ждала бы ее до busy timeout.
+        """
+        conditions, params = self._recipient_segment(languages, active_since, include_blocked, exclude_user_ids)
+        where = ''.join(f" AND {condition}" for condition in conditions)
+        sql = f'''
+            SELECT u.user_id,
+                   CASE WHEN u.language IN ({', '.join('?' * len(SUPPORTED_LANGUAGES))}) THEN u.language ELSE 'ru' END AS lang
+            FROM users u
+            WHERE u.user_id > ?{where}
+            ORDER BY u.user_id
+            LIMIT ?
+        '''
+        return self._iter_recipient_batches(sql, params, batch_size)
+
+    def _iter_recipient_batches(self, sql, params, batch_size):
+        last_user_id = -1 << 63
+        while True:
+            conn = self.get_connection()
+            try:
+                batch = conn.execute(sql, (*SUPPORTED_LANGUAGES, last_user_id, *params, batch_size)).fetchall()
+            finally:
+                conn.close()
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_user_id = batch[-1][0]
+
+    def count_broadcast_recipients(self, languages=None, active_since=None, include_blocked=False, exclude_user_ids=()):
+        conditions, params = self._recipient_segment(languages, active_since, include_blocked, exclude_user_ids)
+        where = ' AND '.join(conditions) or '1'
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT COUNT(*) FROM (
+                SELECT u.user_id, u.is_blocked,
+                       CASE WHEN u.language IN ({', '.join('?' * len(SUPPORTED_LANGUAGES))}) THEN u.language ELSE 'ru' END AS lang
+                FROM users u
+            ) u WHERE {where}
+        ''', (*SUPPORTED_LANGUAGES, *params))
+        result = cursor.fetchone()
+        conn.close()
+        return result[0] if result else 0
+
     def get_today_users_count(self):
+        self.activity.flush()
         conn = self.get_connection()
         cursor = conn.cursor()
         today = date.today().isoformat()
@@ -200,6 +1436,7 @@ class Database:
         qari_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        self._notify_content_change('qari_added', qari_id=qari_id, names=names)
         return qari_id
     
     def get_all_qaris(self):
@@ -246,6 +1483,8 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+        self.user_cache.invalidate_field('has_favorite_suras')
+        self._notify_content_change('qari_deleted', qari_id=qari_id)
         return photo_path
     
     # Sura methods
@@ -253,12 +1492,41 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT OR REPLACE INTO suras (qari_id, order_number, file_id, name_ar, name_uz, name_ru, name_en)
+            INSERT INTO suras (qari_id, order_number, file_id, name_ar, name_uz, name_ru, name_en)
             VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(qari_id, order_number) DO UPDATE SET
+                file_id = excluded.file_id,
+                name_ar = excluded.name_ar, name_uz = excluded.name_uz,
+                name_ru = excluded.name_ru, name_en = excluded.name_en
         ''', (qari_id, order_number, file_id, names['ar'], names['uz'], names['ru'], names['en']))
         conn.commit()
         conn.close()
+        self._notify_content_change('sura_added', qari_id=qari_id, order_number=order_number, file_id=file_id)
     
+    def add_suras(self, qari_id, suras):
+        """Пакетное добавление сур одной транзакцией: suras - [(номер, file_id, names)]"""
+        conn = self.get_connection()
+        try:
+            conn.executemany('''
+                INSERT INTO suras (qari_id, order_number, file_id, name_ar, name_uz, name_ru, name_en)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(qari_id, order_number) DO UPDATE SET
+                    file_id = excluded.file_id,
+                    name_ar = excluded.name_ar, name_uz = excluded.name_uz,
+                    name_ru = excluded.name_ru, name_en = excluded.name_en
+            ''', [
+                (qari_id, order_number, file_id, names['ar'], names['uz'], names['ru'], names['en'])
+                for order_number, file_id, names in suras
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+        # Одна версия контента на весь пакет
+        self._bump_content_version()
+        for order_number, file_id, names in suras:
+            self._fire_content_listeners('sura_added', {'qari_id': qari_id, 'order_number': order_number, 'file_id': file_id})
+        return len(suras)
+
     def get_suras_by_qari(self, qari_id, limit=10, offset=0):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -273,6 +1541,14 @@ class Database:
         conn.close()
         return suras
     
+    def get_suras_page(self, qari_id, cursor=None, backward=False, limit=10):
+        """Суры чтеца по порядку: (sura_id, order_number, name_ar, name_uz, name_ru, name_en)"""
+        return self._keyset_page(
+            "sura_id, order_number, name_ar, name_uz, name_ru, name_en", "suras", "qari_id = ?", (qari_id,),
+            [('order_number', int)],
+            cursor, backward, limit
+        )
+
     def get_sura_file_id(self, qari_id, order_number):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -284,6 +1560,21 @@ class Database:
         conn.close()
         return result[0] if result else None
     
+    def get_sura_availability(self):
+        """Все загруженные аудио одним запросом: (номер суры, qari_id, имя чтеца, file_id)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.order_number, q.qari_id, q.name_ru, s.file_id
+            FROM suras s
+            JOIN qaris q ON s.qari_id = q.qari_id
+            WHERE s.file_id IS NOT NULL
+            ORDER BY q.qari_id, s.order_number
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
     def search_suras(self, query, language='ru'):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -309,6 +1600,64 @@ class Database:
         conn.close()
         return result[0] if result else None
 
+    # Audio fingerprint methods
+    def get_audio_fingerprint(self, sha256=None, file_size=None, file_unique_id=None):
+        """file_id на канале для уже загруженного аудио или None"""
+        conn = self.get_connection()
+        try:
+            if sha256:
+                row = conn.execute(
+                    "SELECT file_id FROM audio_fingerprints WHERE sha256 = ? AND file_size = ?",
+                    (sha256, file_size)
+                ).fetchone()
+                if row:
+                    return row[0]
+            if file_unique_id:
+                row = conn.execute(
+                    "SELECT file_id FROM audio_fingerprints WHERE file_unique_id = ?", (file_unique_id,)
+                ).fetchone()
+                if row:
+                    return row[0]
+            return None
+        finally:
+            conn.close()
+
+    def save_audio_fingerprint(self, file_id, sha256=None, file_size=None, file_unique_id=None, duration=None):
+        """Запомнить загруженное на канал аудио; известные поля дополняют существующую запись"""
+        conn = self.get_connection()
+        try:
+            row = None
+            if sha256:
+                row = conn.execute(
+                    "SELECT fingerprint_id FROM audio_fingerprints WHERE sha256 = ? AND file_size = ?",
+                    (sha256, file_size)
+                ).fetchone()
+            if not row and file_unique_id:
+                row = conn.execute(
+                    "SELECT fingerprint_id FROM audio_fingerprints WHERE file_unique_id = ?", (file_unique_id,)
+                ).fetchone()
+            if row:
+                conn.execute('''
+                    UPDATE audio_fingerprints SET
+                        file_id = ?,
+                        sha256 = COALESCE(?, sha256),
+                        file_size = COALESCE(?, file_size),
+                        file_unique_id = COALESCE(?, file_unique_id),
+                        duration = COALESCE(?, duration)
+                    WHERE fingerprint_id = ?
+                ''', (file_id, sha256, file_size, file_unique_id, duration, row[0]))
+            else:
+                conn.execute('''
+                    INSERT INTO audio_fingerprints (sha256, file_size, file_unique_id, duration, file_id)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (sha256, file_size, file_unique_id, duration, file_id))
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            # Тот же файл параллельно сохранили под другим ключом - запись уже есть
+            logger.warning(f"Audio fingerprint conflict: {e}")
+        finally:
+            conn.close()
+
     # Nasheed methods
     def add_nasheed(self, file_id, titles, performer, cover_photo=None):
         conn = self.get_connection()
@@ -320,6 +1669,7 @@ class Database:
         nasheed_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        self._notify_content_change('nasheed_added', nasheed_id=nasheed_id)
         return nasheed_id
 
     def get_nasheeds(self, limit=10, offset=0):
@@ -335,6 +1685,14 @@ class Database:
         conn.close()
         return nasheeds
 
+    def get_nasheeds_page(self, cursor=None, backward=False, limit=10):
+        """Нашиды, новые сначала: (nasheed_id, title_ru, performer)"""
+        return self._keyset_page(
+            "nasheed_id, title_ru, performer", "nasheeds", "1", (),
+            [('nasheed_id', int)],
+            cursor, backward, limit, descending=True
+        )
+
     def get_total_nasheeds_count(self):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -357,6 +1715,7 @@ class Database:
         cursor.execute('INSERT OR IGNORE INTO user_favorite_nasheeds (user_id, nasheed_id) VALUES (?, ?)', (user_id, nasheed_id))
         conn.commit()
         conn.close()
+        self.user_cache.invalidate(user_id, 'has_favorite_nasheeds')
 
     def remove_favorite_nasheed(self, user_id, nasheed_id):
         conn = self.get_connection()
@@ -364,6 +1723,25 @@ class Database:
         cursor.execute('DELETE FROM user_favorite_nasheeds WHERE user_id = ? AND nasheed_id = ?', (user_id, nasheed_id))
         conn.commit()
         conn.close()
+        self.user_cache.invalidate(user_id, 'has_favorite_nasheeds')
+
+    def has_favorite_nasheeds(self, user_id):
+        """Есть ли у пользователя хотя бы один избранный нашид (кэшируется)"""
+        cached = self.user_cache.get(user_id, 'has_favorite_nasheeds')
+        if cached is not MISSING:
+            return cached
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT 1 FROM user_favorite_nasheeds ufn
+            JOIN nasheeds n ON ufn.nasheed_id = n.nasheed_id
+            WHERE ufn.user_id = ?
+            LIMIT 1
+        ''', (user_id,))
+        result = cursor.fetchone() is not None
+        conn.close()
+        self.user_cache.set(user_id, 'has_favorite_nasheeds', result)
+        return result
 
     def get_user_favorite_nasheeds(self, user_id):
         conn = self.get_connection()
@@ -373,6 +1751,16 @@ class Database:
         conn.close()
         return nasheeds
 
+    def get_favorite_nasheeds_page(self, user_id, cursor=None, backward=False, limit=10):
+        """Избранные нашиды, недавно добавленные сначала: (nasheed_id, title_ru, performer)"""
+        return self._keyset_page(
+            "n.nasheed_id, n.title_ru, n.performer",
+            "user_favorite_nasheeds ufn JOIN nasheeds n ON ufn.nasheed_id = n.nasheed_id",
+            "ufn.user_id = ?", (user_id,),
+            [("COALESCE(ufn.added_date, '')", str), ('ufn.nasheed_id', int)],
+            cursor, backward, limit, descending=True
+        )
+
     def is_nasheed_favorite(self, user_id, nasheed_id):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -383,18 +1771,37 @@ class Database:
         conn.close()
         return result is not None
 
-    def search_users(self, query):
+    def search_users(self, query, limit=20):
+        """Поиск по ID или подстроке имени/юзернейма через триграммный индекс users_fts.
+
+        Подстрока короче трех символов в индексе не ищется (триграмм в ней нет).
+        """
+        query = query.strip()
+        # ID - только ASCII-цифры в пределах INTEGER SQLite (int64); более
+        # длинное число не может быть ID и ищется только как подстрока
+        user_id = int(query) if query.isascii() and query.isdigit() else None
+        if user_id is not None and user_id > SQLITE_MAX_INT:
+            user_id = None
         conn = self.get_connection()
-        cursor = conn.cursor()
-        # Ищем по имени, юзернейму или ID
-        cursor.execute('''
-            SELECT user_id, username, first_name FROM users
-            WHERE first_name LIKE ? OR username LIKE ? OR user_id = ?
-            LIMIT 20
-        ''', (f'%{query}%', f'%{query}%', query if query.isdigit() else -1))
-        users = cursor.fetchall()
-        conn.close()
-        return users
+        try:
+            users = []
+            # Ищем по ID - поиск по первичному ключу
+            if user_id is not None:
+                users = conn.execute(
+                    "SELECT user_id, username, first_name FROM users WHERE user_id = ?", (user_id,)
+                ).fetchall()
+            if len(query) >= 3:
+                # Фраза в кавычках - подстрока целиком, как LIKE '%query%'
+                phrase = '"' + query.replace('"', '""') + '"'
+                users += conn.execute('''
+                    SELECT u.user_id, u.username, u.first_name FROM users_fts f
+                    JOIN users u ON u.user_id = f.rowid
+                    WHERE users_fts MATCH ? AND u.user_id <> ?
+                    LIMIT ?
+                ''', (phrase, -1 if user_id is None else user_id, limit - len(users))).fetchall()
+            return users
+        finally:
+            conn.close()
 
     # Favorite methods
     def add_favorite_sura(self, user_id, sura_id):
@@ -406,6 +1813,7 @@ class Database:
         ''', (user_id, sura_id))
         conn.commit()
         conn.close()
+        self.user_cache.invalidate(user_id, 'has_favorite_suras')
     
     def remove_favorite_sura(self, user_id, sura_id):
         conn = self.get_connection()
@@ -416,12 +1824,32 @@ class Database:
         ''', (user_id, sura_id))
         conn.commit()
         conn.close()
+        self.user_cache.invalidate(user_id, 'has_favorite_suras')
+
+    def has_favorite_suras(self, user_id):
+        """Есть ли у пользователя хотя бы одна избранная сура (кэшируется)"""
+        cached = self.user_cache.get(user_id, 'has_favorite_suras')
+        if cached is not MISSING:
+            return cached
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT 1 FROM user_favorite_suras ufs
+            JOIN suras s ON ufs.sura_id = s.sura_id
+            JOIN qaris q ON s.qari_id = q.qari_id
+            WHERE ufs.user_id = ?
+            LIMIT 1
+        ''', (user_id,))
+        result = cursor.fetchone() is not None
+        conn.close()
+        self.user_cache.set(user_id, 'has_favorite_suras', result)
+        return result
     
     def get_user_favorite_suras(self, user_id):
         conn = self.get_connection()
         cursor = conn.cursor()
         # Используем язык пользователя для названий
-        lang = self.get_user_language(user_id)
+        lang = self.get_user_language(user_id) or 'ru'
         cursor.execute(f'''
             SELECT s.sura_id, s.order_number, s.name_{lang}, s.name_ar, q.name_{lang} as qari_name, s.qari_id
             FROM user_favorite_suras ufs
@@ -434,6 +1862,19 @@ class Database:
         conn.close()
         return favorites
     
+    def get_favorite_suras_page(self, user_id, lang='ru', cursor=None, backward=False, limit=10):
+        """Избранные суры, недавно добавленные сначала:
+        (sura_id, order_number, название, name_ar, имя чтеца, qari_id)"""
+        if lang not in SUPPORTED_LANGUAGES:
+            lang = 'ru'
+        return self._keyset_page(
+            f"s.sura_id, s.order_number, s.name_{lang}, s.name_ar, q.name_{lang}, s.qari_id",
+            "user_favorite_suras ufs JOIN suras s ON ufs.sura_id = s.sura_id JOIN qaris q ON s.qari_id = q.qari_id",
+            "ufs.user_id = ?", (user_id,),
+            [("COALESCE(ufs.added_date, '')", str), ('ufs.sura_id', int)],
+            cursor, backward, limit, descending=True
+        )
+
     def is_sura_favorite(self, user_id, sura_id):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -446,30 +1887,30 @@ class Database:
         return result is not None
     
     # Daily content methods
-    def get_daily_sura(self):
+    def get_daily_sura(self, day=None):
         conn = self.get_connection()
         cursor = conn.cursor()
-        today = date.today().isoformat()
+        day = day or date.today().isoformat()
         cursor.execute('''
             SELECT s.*, q.name_ru as qari_name 
             FROM daily_content dc
             JOIN suras s ON dc.sura_id = s.sura_id
             JOIN qaris q ON s.qari_id = q.qari_id
             WHERE dc.date = ?
-        ''', (today,))
+        ''', (day,))
         result = cursor.fetchone()
         conn.close()
         return result
     
-    def get_daily_nasheed(self):
+    def get_daily_nasheed(self, day=None):
         conn = self.get_connection()
         cursor = conn.cursor()
-        today = date.today().isoformat()
+        day = day or date.today().isoformat()
         cursor.execute('''
             SELECT n.* FROM daily_content dc
             JOIN nasheeds n ON dc.nasheed_id = n.nasheed_id
             WHERE dc.date = ?
-        ''', (today,))
+        ''', (day,))
         result = cursor.fetchone()
         conn.close()
         return result
@@ -484,6 +1925,7 @@ class Database:
         ''', (today, sura_id))
         conn.commit()
         conn.close()
+        self._notify_content_change('daily_content_set', date=today)
 
     def set_daily_nasheed(self, nasheed_id):
         conn = self.get_connection()
@@ -495,34 +1937,79 @@ class Database:
         ''', (today, nasheed_id))
         conn.commit()
         conn.close()
-    
-    def get_random_sura(self):
-        """Получить случайную суру"""
+        self._notify_content_change('daily_content_set', date=today)
+
+    def get_daily_schedule(self, start_day, end_day):
+        """[(date, sura_id, nasheed_id)] контента дня за период, по возрастанию даты"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT s.*, q.name_ru as qari_name 
-            FROM suras s
-            JOIN qaris q ON s.qari_id = q.qari_id
-            ORDER BY RANDOM()
-            LIMIT 1
-        ''')
-        result = cursor.fetchone()
-        conn.close()
-        return result
+        try:
+            return conn.execute('''
+                SELECT date, sura_id, nasheed_id FROM daily_content
+                WHERE date BETWEEN ? AND ?
+                ORDER BY date
+            ''', (start_day, end_day)).fetchall()
+        finally:
+            conn.close()
+
+    def fill_daily_schedule(self, entries):
+        """Записать запланированный контент дня [(date, sura_id, nasheed_id)].
+
+        None в записи - слот не трогаем. Выбор админа не перезаписывается:
+        заменяется только пустой слот или ссылка на удаленную суру/нашид.
+        """
+        conn = self.get_connection()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO daily_content (date, sura_id, nasheed_id) VALUES (?, ?, ?)
+                    ON CONFLICT(date) DO UPDATE SET
+                        sura_id = CASE
+                            WHEN excluded.sura_id IS NOT NULL AND NOT EXISTS
+                                (SELECT 1 FROM suras s WHERE s.sura_id = daily_content.sura_id)
+                            THEN excluded.sura_id ELSE daily_content.sura_id END,
+                        nasheed_id = CASE
+                            WHEN excluded.nasheed_id IS NOT NULL AND NOT EXISTS
+                                (SELECT 1 FROM nasheeds n WHERE n.nasheed_id = daily_content.nasheed_id)
+                            THEN excluded.nasheed_id ELSE daily_content.nasheed_id END
+                ''', entries)
+        finally:
+            conn.close()
     
-    def get_random_nasheed(self):
-        """Получить случайный нашид"""
+    def get_sura_sampling_pool(self):
+        """[(sura_id, listens)] для случайного выбора (sampler.ContentSampler)"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM nasheeds
-            ORDER BY RANDOM()
-            LIMIT 1
-        ''')
-        result = cursor.fetchone()
-        conn.close()
-        return result
+        try:
+            return conn.execute('''
+                SELECT s.sura_id, s.listens FROM suras s
+                JOIN qaris q ON s.qari_id = q.qari_id
+                WHERE s.file_id IS NOT NULL
+                ORDER BY s.sura_id
+            ''').fetchall()
+        finally:
+            conn.close()
+
+    def get_nasheed_sampling_pool(self):
+        """[(nasheed_id, listens)] для случайного выбора (sampler.ContentSampler)"""
+        conn = self.get_connection()
+        try:
+            return conn.execute(
+                "SELECT nasheed_id, listens FROM nasheeds WHERE file_id IS NOT NULL ORDER BY nasheed_id"
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def get_sura_with_qari(self, sura_id):
+        """Сура с именем чтеца (столбцы suras + qari_name)"""
+        conn = self.get_connection()
+        try:
+            return conn.execute('''
+                SELECT s.*, q.name_ru as qari_name
+                FROM suras s
+                JOIN qaris q ON s.qari_id = q.qari_id
+                WHERE s.sura_id = ?
+            ''', (sura_id,)).fetchone()
+        finally:
+            conn.close()
 
     # Chat methods
     def get_chat_id(self, admin_id, user_id, create_if_not_exists=False):
@@ -558,17 +2045,365 @@ class Database:
         conn.commit()
         conn.close()
     
-    def get_chat_messages(self, chat_id, limit=50):
+    def get_unread_messages_count(self, admin_id):
+        """Непрочитанные сообщения пользователей во всех чатах админа.
+
+        Счетчик admin_unread ведут триггеры на messages, mark_chat_read его уменьшает.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT unread_count FROM admin_unread WHERE admin_id = ?", (admin_id,))
+        result = cursor.fetchone()
+        conn.close()
+        return result[0] if result else 0
+
+    def mark_chat_read(self, chat_id):
+        """Админ открыл чат: курсор чтения - на последнее сообщение, счетчики - в ноль"""
+        conn = self.get_connection()
+        try:
+            with conn:
+                conn.execute('''
+                    UPDATE admin_unread SET unread_count = unread_count - (
+                        SELECT unread_count FROM admin_chats WHERE chat_id = ?)
+                    WHERE admin_id = (SELECT admin_id FROM admin_chats WHERE chat_id = ?)
+                ''', (chat_id, chat_id))
+                conn.execute('''
+                    UPDATE admin_chats SET unread_count = 0, last_read_message_id = COALESCE(
+                        (SELECT MAX(message_id) FROM messages WHERE chat_id = ?), last_read_message_id)
+                    WHERE chat_id = ?
+                ''', (chat_id, chat_id))
+        finally:
+            conn.close()
+
+    def get_chat_messages_page(self, chat_id, cursor=None, backward=False, limit=15):
+        """Страница переписки, новые сообщения сначала; next_cursor ведет к более старым"""
+        return self._keyset_page(
+            "message_id, chat_id, from_user_id, message_text, message_date, is_from_admin",
+            "messages", "chat_id = ?", (chat_id,),
+            [('message_id', int)],
+            cursor, backward, limit, descending=True
+        )
+
+    def iter_chat_messages(self, chat_id, batch_size=500):
+        """Вся переписка пачками в порядке отправки (для выгрузки в файл).
+
+        Как iter_broadcast_recipients: keyset по message_id и соединение на каждую пачку.
+        """
+        last_message_id = 0
+        while True:
+            conn = self.get_connection()
+            try:
+                batch = conn.execute('''
+                    SELECT message_id, chat_id, from_user_id, message_text, message_date, is_from_admin
+                    FROM messages
+                    WHERE chat_id = ? AND message_id > ?
+                    ORDER BY message_id
+                    LIMIT ?
+                ''', (chat_id, last_message_id, batch_size)).fetchall()
+            finally:
+                conn.close()
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_message_id = batch[-1][0]
+
+    # Broadcast job methods
+    def create_broadcast_job(self, created_by, texts, recipients, progress_chat_id=None, progress_message_id=None, report=None):
+        """Создать рассылку: texts - {язык: текст}, recipients - (user_id, язык)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO broadcast_jobs (created_by, texts, report, progress_chat_id, progress_message_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (created_by, json.dumps(texts, ensure_ascii=False), json.dumps(report or {}, ensure_ascii=False),
+                  progress_chat_id, progress_message_id))
+            job_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT OR IGNORE INTO broadcast_recipients (job_id, user_id, language) VALUES (?, ?, ?)",
+                ((job_id, user_id, language) for user_id, language in recipients)
+            )
+            cursor.execute('''
+                UPDATE broadcast_jobs SET total = (SELECT COUNT(*) FROM broadcast_recipients WHERE job_id = ?)
+                WHERE job_id = ?
+            ''', (job_id, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+        return job_id
+
+    def get_broadcast_job(self, job_id):
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT * FROM messages
-            WHERE chat_id = ? 
-            ORDER BY message_date DESC 
-            LIMIT ?
-        ''', (chat_id, limit))
-        messages = cursor.fetchall()
+            SELECT job_id, status, texts, report, total, progress_chat_id, progress_message_id,
+                   created_date, started_date, finished_date
+            FROM broadcast_jobs WHERE job_id = ?
+        ''', (job_id,))
+        job = cursor.fetchone()
+        conn.close()
+        return job
+
+    def get_unfinished_broadcast_jobs(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT job_id FROM broadcast_jobs WHERE status IN ('pending', 'running') ORDER BY job_id")
+        jobs = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return jobs
+
+    def get_recent_broadcast_jobs(self, limit=5):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT job_id, status, total, created_date, finished_date
+            FROM broadcast_jobs ORDER BY job_id DESC LIMIT ?
+        ''', (limit,))
+        jobs = cursor.fetchall()
+        conn.close()
+        return jobs
+
+    def start_broadcast_job(self, job_id):
+        """Перевести рассылку в running.
+
+        После аварийной остановки забранные, но еще не начатые получатели
+        (claimed) возвращаются в очередь. Оставшиеся в статусе sending могли
+        уже получить сообщение, поэтому повторно им не отправляем.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE broadcast_recipients SET status = 'pending' WHERE job_id = ? AND status = 'claimed'",
+                (job_id,)
+            )
+            cursor.execute('''
+                UPDATE broadcast_recipients SET status = 'failed', error = 'interrupted', updated_date = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND status = 'sending'
+            ''', (job_id,))
+            interrupted = cursor.rowcount
+            cursor.execute('''
+                UPDATE broadcast_jobs SET status = 'running', started_date = COALESCE(started_date, CURRENT_TIMESTAMP)
+                WHERE job_id = ?
+            ''', (job_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        return interrupted
+
+    def claim_broadcast_recipients(self, job_id, limit=50):
+        """Забрать следующую пачку получателей, пометив их claimed: [(user_id, язык)]"""
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute('''
+                SELECT user_id, language FROM broadcast_recipients
+                WHERE job_id = ? AND status = 'pending'
+                ORDER BY user_id LIMIT ?
+            ''', (job_id, limit)).fetchall()
+            conn.executemany(
+                "UPDATE broadcast_recipients SET status = 'claimed' WHERE job_id = ? AND user_id = ?",
+                ((job_id, user_id) for user_id, _ in rows)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return rows
+
+    def mark_broadcast_recipients_sending(self, job_id, user_ids):
+        """Отметить начало отправки получателям одной транзакцией; вызывается до send_message"""
+        conn = self.get_connection()
+        conn.executemany(
+            "UPDATE broadcast_recipients SET status = 'sending', updated_date = CURRENT_TIMESTAMP "
+            "WHERE job_id = ? AND user_id = ?",
+            ((job_id, user_id) for user_id in user_ids)
+        )
+        conn.commit()
         conn.close()
-        return messages
 
-db = Database()
\ No newline at end of file
+    def release_broadcast_recipients(self, job_id, user_ids):
+        """Вернуть в pending получателей, которым отправка еще не начиналась"""
+        conn = self.get_connection()
+        conn.executemany(
+            "UPDATE broadcast_recipients SET status = 'pending' WHERE job_id = ? AND user_id = ? AND status = 'claimed'",
+            ((job_id, user_id) for user_id in user_ids)
+        )
+        conn.commit()
+        conn.close()
+
+    def write_broadcast_results(self, results):
+        """Пакетная запись {(job_id, user_id): (статус, ошибка)} одной транзакцией"""
+        conn = self.get_connection()
+        try:
+            conn.executemany('''
+                UPDATE broadcast_recipients SET status = ?, error = ?, updated_date = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND user_id = ?
+            ''', ((status, error, job_id, user_id) for (job_id, user_id), (status, error) in results.items()))
+            # Заблокировавших бота исключаем из следующих рассылок
+            conn.executemany(
+                "UPDATE users SET is_blocked = 1 WHERE user_id = ?",
+                ((user_id,) for (job_id, user_id), (status, error) in results.items() if status == 'blocked')
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return len(results)
+
+    def record_broadcast_result(self, job_id, user_id, status, error=None):
+        self.broadcast_results.record(job_id, user_id, status, error)
+
+    def flush_broadcast_results(self):
+        return self.broadcast_results.flush()
+
+    def get_broadcast_progress(self, job_id):
+        """Счетчики получателей по статусам: {'pending': .., 'sent': .., ...}"""
+        self.broadcast_results.flush()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT status, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY status
+        ''', (job_id,))
+        progress = dict(cursor.fetchall())
+        conn.close()
+        return progress
+
+    def get_broadcast_language_counts(self, job_id):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT language, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY language
+        ''', (job_id,))
+        counts = dict(cursor.fetchall())
+        conn.close()
+        return counts
+
+    def get_broadcast_errors(self, job_id, limit=10):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id, error FROM broadcast_recipients
+            WHERE job_id = ? AND status = 'failed' LIMIT ?
+        ''', (job_id, limit))
+        errors = cursor.fetchall()
+        conn.close()
+        return errors
+
+    def finish_broadcast_job(self, job_id, status='done', report=None):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE broadcast_jobs SET status = ?, report = COALESCE(?, report), finished_date = CURRENT_TIMESTAMP
+            WHERE job_id = ?
+        ''', (status, json.dumps(report, ensure_ascii=False) if report is not None else None, job_id))
+        conn.commit()
+        conn.close()
+
+    # Translation cache methods
+    def get_cached_translation(self, cache_key):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT result FROM translation_cache WHERE cache_key = ?", (cache_key,))
+        result = cursor.fetchone()
+        conn.close()
+        return result[0] if result else None
+
+    def save_cached_translation(self, cache_key, kind, target, model, prompt_version, source_text, result):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO translation_cache
+                (cache_key, kind, target, model, prompt_version, source_text, result)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (cache_key, kind, target, model, prompt_version, source_text, result))
+        conn.commit()
+        conn.close()
+
+    def get_translation_cache_size(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM translation_cache")
+        result = cursor.fetchone()
+        conn.close()
+        return result[0] if result else 0
+
+    def export_translation_cache(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT cache_key, kind, target, model, prompt_version, source_text, result, created_date
+            FROM translation_cache ORDER BY created_date
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def import_translation_cache(self, rows):
+        """Импорт строк из export_translation_cache; существующие ключи не перезаписываются"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        before = conn.total_changes
+        cursor.executemany('''
+            INSERT OR IGNORE INTO translation_cache
+                (cache_key, kind, target, model, prompt_version, source_text, result, created_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        imported = conn.total_changes - before
+        conn.close()
+        return imported
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database для использования в обработчиках бота.
+
+    Повторяет API Database: каждый метод выполняется в отдельном пуле потоков,
+    поэтому медленный запрос (например, запись под блокировкой) не останавливает
+    event loop и остальные апдейты продолжают обрабатываться.
+
+        lang = await adb.get_user_language(user_id)
+    """
+
+    def __init__(self, database, max_workers=None):
+        self._db = database
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or database.pool.max_size,
+            thread_name_prefix='db'
+        )
+        self._close_lock = threading.Lock()
+        self._closed = False
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        # Кэшируем обертку, чтобы не создавать ее на каждый вызов
+        setattr(self, name, method)
+        return method
+
+    def close(self):
+        """Дождаться выполнения запросов в очереди и закрыть БД.
+
+        Повторный вызов ничего не делает: БД закрывает и post_shutdown бота,
+        и finally процесса в run_bots.py.
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._executor.shutdown(wait=True)
+            self._db.close()
+
+    async def aclose(self):
+        """close() для обработчиков бота: ожидание очереди и сброс буферов не блокируют event loop"""
+        await asyncio.to_thread(self.close)
+
+db = Database(DATABASE_PATH)
+adb = AsyncDatabase(db)
\ No newline at end of file
@@ -1,7 +1,7 @@
 # init_db.py
 import os
-import sqlite3
-from database import DatabaseManager
+import sys
+from database import db
 
 def init_database():
     """Инициализация базы данных для Railway"""
@@ -10,11 +10,15 @@ def init_database():
     # Создаем директории
     os.makedirs("qari_photos", exist_ok=True)
     
-    # Инициализируем базу данных
-    db = DatabaseManager()
-    db.init_database()
+    # Таблицы и миграции применяются при создании Database()
+    print(f"✅ База данных инициализирована успешно! Версия схемы: {db.get_schema_version()}")
     
-    print("✅ База данных инициализирована успешно!")
+    # Проверяем, что горячие запросы идут по индексам
+    problems = db.check_query_plans()
+    for name, steps in problems.items():
+        print(f"⚠️ {name}: {'; '.join(steps)}")
+    db.close()
+    return not problems
 
 if __name__ == "__main__":
-    init_database()
+    sys.exit(0 if init_database() else 1)
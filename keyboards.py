@@ -0,0 +1,208 @@
+"""
+Кэш готовых inline-клавиатур
+
+Главное меню и список сур для админа зависят только от языка и страницы,
+поэтому строятся один раз (lru_cache). Список чтецов и страницы сур чтеца
+зависят от контента: они хранятся в KeyboardCache с ключом
+(экран, язык, страница, версия контента) и сбрасываются, когда админ
+добавляет или удаляет контент (в том числе из другого процесса - через
+Database.poll_content_version). Разметка в PTB неизменяема, поэтому один
+и тот же объект InlineKeyboardMarkup можно отдавать всем пользователям.
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import SURA_NAMES
+from database import db
+from text_resources import get_text
+
+logger = logging.getLogger(__name__)
+
+SURAS_PER_PAGE = 5
+ADMIN_SURAS_PER_PAGE = 10
+
+
+class KeyboardCache:
+    """LRU готовых экранов; версия контента входит в ключ"""
+
+    def __init__(self, max_size=2048, max_age=3600):
+        self.max_size = max_size
+        # Изменения из другого процесса приходят через poll_content_version;
+        # возраст ограничен лишь на случай, если опрос версии перестал работать
+        self.max_age = max_age
+        self.version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, screen, *parts):
+        key = (screen, *parts, self.version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.max_age:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, screen, *parts, value, version):
+        """version - версия, прочитанная до запросов к БД: экран, собранный
+        во время смены контента, не должен попасть под новую версию"""
+        key = (screen, *parts, version)
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def on_content_change(self, event, data):
+        """Слушатель Database: любая правка контента делает кэш устаревшим"""
+        self.invalidate()
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'version': self.version,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+keyboard_cache = KeyboardCache()
+db.add_content_listener(keyboard_cache.on_content_change)
+
+
+# Экраны без контента из БД
+@functools.lru_cache(maxsize=64)
+def main_menu_keyboard(lang, has_favorite_suras=False, has_favorite_nasheeds=False):
+    keyboard = [
+        [InlineKeyboardButton(get_text('btn_listen_quran', lang), callback_data="listen_quran"),
+         InlineKeyboardButton(get_text('btn_listen_nasheed', lang), callback_data="listen_nasheed")],
+        [InlineKeyboardButton(get_text('btn_sura_of_day', lang), callback_data="sura_of_day"),
+         InlineKeyboardButton(get_text('btn_nasheed_of_day', lang), callback_data="nasheed_of_day")],
+    ]
+
+    favorite_buttons = []
+    if has_favorite_suras:
+        favorite_buttons.append(InlineKeyboardButton(get_text('btn_favorite_suras', lang), callback_data="favorite_suras"))
+    if has_favorite_nasheeds:
+        favorite_buttons.append(InlineKeyboardButton(get_text('btn_favorite_nasheeds', lang), callback_data="favorite_nasheeds"))
+    if favorite_buttons:
+        keyboard.append(favorite_buttons)
+
+    keyboard.append([InlineKeyboardButton(get_text('btn_chat_admin', lang), callback_data="chat_with_admin"),
+                     InlineKeyboardButton(get_text('btn_language', lang), callback_data="change_language")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+@functools.lru_cache(maxsize=16)
+def admin_sura_select_keyboard(page):
+    """Список всех 114 сур для выбора админом, по 10 на страницу"""
+    start_index = page * ADMIN_SURAS_PER_PAGE + 1
+    end_index = min((page + 1) * ADMIN_SURAS_PER_PAGE, 114)
+
+    keyboard = []
+    for i in range(start_index, end_index + 1):
+        sura_name = SURA_NAMES.get(i, {}).get('ru', f'Сура {i}')
+        keyboard.append([InlineKeyboardButton(f"{i:03d}. {sura_name}", callback_data=f"select_sura_{i}")])
+
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"sura_select_page_{page-1}"))
+    if end_index < 114:
+        nav_buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"sura_select_page_{page+1}"))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+
+    keyboard.append([InlineKeyboardButton("🚫 Отмена", callback_data="admin_back")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+# Экраны с контентом из БД: (текст, клавиатура) или None, если показывать нечего
+async def qari_list_screen(database, lang):
+    screen = keyboard_cache.get('qaris', lang)
+    if screen is not None:
+        return screen
+    version = keyboard_cache.version
+
+    qaris = await database.get_all_qaris()
+    if not qaris:
+        return None
+
+    lang_map = {'ar': 1, 'ru': 2, 'uz': 3, 'en': 4}
+    name_index = lang_map.get(lang, 2)  # default to russian
+    keyboard = [[InlineKeyboardButton(qari[name_index], callback_data=f"qari_{qari[0]}")] for qari in qaris]
+    keyboard.append([InlineKeyboardButton(get_text('back', lang), callback_data="main_menu")])
+
+    screen = (get_text('choose_reciter', lang), InlineKeyboardMarkup(keyboard))
+    keyboard_cache.set('qaris', lang, value=screen, version=version)
+    return screen
+
+
+def page_buttons(page, prefix, previous_text="◀️", next_text="▶️"):
+    """Кнопки листания keyset-страницы: {prefix}p_{курсор} и {prefix}n_{курсор}"""
+    buttons = []
+    if page.prev_cursor:
+        buttons.append(InlineKeyboardButton(previous_text, callback_data=f"{prefix}p_{page.prev_cursor}"))
+    if page.next_cursor:
+        buttons.append(InlineKeyboardButton(next_text, callback_data=f"{prefix}n_{page.next_cursor}"))
+    return buttons
+
+
+def parse_page_callback(data, prefix):
+    """(курсор, назад?) из callback_data кнопки page_buttons; (None, False) - первая страница"""
+    if not data.startswith(prefix):
+        return None, False
+    direction, _, cursor = data[len(prefix):].partition('_')
+    return cursor or None, direction == 'p'
+
+
+async def qari_suras_screen(database, qari_id, lang, cursor=None, backward=False):
+    screen = keyboard_cache.get('qari_suras', qari_id, lang, cursor, backward)
+    if screen is not None:
+        return screen
+    version = keyboard_cache.version
+
+    # Страница, общее число сур и sura_id - одним запросом
+    page = await database.get_suras_page(qari_id, cursor, backward, SURAS_PER_PAGE)
+    if not page.rows:
+        return None
+
+    qari = await database.get_qari_by_id(qari_id)
+    lang_map = {'ar': 2, 'uz': 3, 'ru': 4, 'en': 5}
+    name_index = lang_map.get(lang, 4)  # default to ru
+    qari_name = qari[name_index] if qari else f"Чтец {qari_id}"
+
+    keyboard = []
+    for sura_data in page.rows:
+        order = sura_data[1]
+        sura_name = SURA_NAMES.get(order, {}).get(lang, f"Sura {order}")
+        keyboard.append([InlineKeyboardButton(f"{order}. {sura_name}", callback_data=f"play_sura_{order}")])
+
+    nav_buttons = page_buttons(page, "qari_page_", get_text('previous', lang), get_text('next', lang))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+
+    keyboard.append([InlineKeyboardButton(get_text('btn_search_sura', lang), switch_inline_query_current_chat="")])
+    keyboard.append([InlineKeyboardButton(get_text('back', lang), callback_data="listen_quran")])
+    keyboard.append([InlineKeyboardButton(get_text('home', lang), callback_data="main_menu")])
+
+    text = f"🎙 {qari_name}\n📖 Суры {page.rows[0][1]}-{page.rows[-1][1]} ({page.total}):"
+    screen = (text, InlineKeyboardMarkup(keyboard))
+    keyboard_cache.set('qari_suras', qari_id, lang, cursor, backward, value=screen, version=version)
+    return screen
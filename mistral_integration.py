@@ -1,24 +1,160 @@
 # mistral_integration.py
-import requests
+import asyncio
+import hashlib
+import httpx
 import logging
 import json
+import random
+import sys
+from collections import OrderedDict
 from config import MISTRAL_API_KEY
+from database import db, adb
 
 logger = logging.getLogger(__name__)
 
+# Статусы, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Увеличить при изменении любого промпта, чтобы старые переводы не использовались
+PROMPT_VERSION = 1
+TEXT_MODEL = "mistral-tiny"
+NAME_MODEL = "mistral-small-latest"
+BROADCAST_MODEL = "mistral-small-latest"
+
+class TranslationCache:
+    """Память переводов: LRU в процессе поверх таблицы translation_cache.
+
+    Ключ - sha256 от (версия промпта, тип перевода, целевые языки, модель, текст),
+    поэтому смена промпта или модели автоматически дает новые ключи.
+    """
+
+    def __init__(self, database, max_size=1000):
+        self.database = database
+        self.max_size = max_size
+        self._memory = OrderedDict()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def make_key(kind, target, model, text):
+        payload = json.dumps([PROMPT_VERSION, kind, target, model, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    async def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self._stats['memory_hits'] += 1
+            return self._memory[key]
+        try:
+            stored = await self.database.get_cached_translation(key)
+        except Exception as e:
+            logger.error(f"Translation cache read error: {e}")
+            stored = None
+        if stored is None:
+            self._stats['misses'] += 1
+            return None
+        value = json.loads(stored)
+        self._remember(key, value)
+        self._stats['db_hits'] += 1
+        return value
+
+    async def put(self, key, kind, target, model, text, value):
+        self._remember(key, value)
+        self._stats['stores'] += 1
+        try:
+            await self.database.save_cached_translation(
+                key, kind, target, model, PROMPT_VERSION, text, json.dumps(value, ensure_ascii=False)
+            )
+        except Exception as e:
+            logger.error(f"Translation cache write error: {e}")
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats['memory_size'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+        return stats
+
 class MistralTranslator:
-    def __init__(self, api_key):
+    """Асинхронный клиент Mistral AI.
+
+    Один httpx.AsyncClient на процесс держит открытые keep-alive соединения,
+    семафор ограничивает число одновременных запросов, а временные ошибки
+    (таймауты, 429, 5xx) повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, api_key, cache=None, max_concurrency=4, max_retries=3, backoff=0.5):
         self.api_key = api_key
+        self.cache = cache
         self.base_url = "https://api.mistral.ai/v1/chat/completions"
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        # Клиент создается лениво, уже внутри event loop бота
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                timeout=httpx.Timeout(20.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    async def _complete(self, data, timeout):
+        """POST в chat/completions с повторами; возвращает текст ответа модели"""
+        client = self._get_client()
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                response = None
+                try:
+                    response = await client.post(self.base_url, json=data, timeout=timeout)
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response.json()['choices'][0]['message']['content'].strip()
+                    error = f"HTTP {response.status_code}"
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    error = repr(e)
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"Mistral request failed after {attempt + 1} attempts: {error}")
+                delay = self._retry_delay(attempt, response)
+                logger.warning(f"Mistral request failed ({error}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
-    def translate_text(self, text, target_lang):
+    async def translate_text(self, text, target_lang):
         """Перевод текста через Mistral AI"""
+        cache_key = TranslationCache.make_key('text', target_lang, TEXT_MODEL, text)
+        if self.cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             lang_prompts = {
                 'ar': f"Translate exactly to Arabic only the text without explanations: {text}",
                 'uz': f"Translate exactly to Uzbek only the text without explanations: {text}", 
@@ -27,34 +163,38 @@ class MistralTranslator:
             }
             
             data = {
-                "model": "mistral-tiny",
+                "model": TEXT_MODEL,
                 "messages": [{"role": "user", "content": lang_prompts[target_lang]}],
                 "temperature": 0.1,
                 "max_tokens": 100
             }
             
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=10)
-            response.raise_for_status()
-            
-            translated = response.json()['choices'][0]['message']['content'].strip()
+            translated = await self._complete(data, timeout=10)
             logger.info(f"Translated '{text}' to '{target_lang}': '{translated}'")
+            if self.cache:
+                await self.cache.put(cache_key, 'text', target_lang, TEXT_MODEL, text, translated)
             return translated
             
         except Exception as e:
             logger.error(f"Translation error: {e}")
             return text  # Возвращаем оригинал при ошибке
 
-    def translate_to_all_languages(self, text, source_lang='ru'):
+    async def translate_to_all_languages(self, text, source_lang='ru'):
         """
         Перевод текста на все поддерживаемые языки (ar, uz, ru, en)
         Возвращает dict с переводами или JSON-отчет с ошибками
         """
+        cache_key = TranslationCache.make_key('all', 'ar,uz,ru,en', NAME_MODEL, text)
+        if self.cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return {
+                    "status": "ok",
+                    "action": "translate_name",
+                    "translations": cached,
+                    "needs_review": False
+                }
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             # Определяем системный промпт для генерации всех переводов сразу
             system_prompt = f"""You are a professional translator. Translate the given text to Arabic, Uzbek, Russian, and English.
 Return ONLY a valid JSON object in this exact format without any additional text or explanation:
@@ -69,7 +209,7 @@ Rules:
             user_prompt = f"Translate this text: {text}"
             
             data = {
-                "model": "mistral-small-latest",
+                "model": NAME_MODEL,
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
@@ -78,10 +218,7 @@ Rules:
                 "max_tokens": 300
             }
             
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=15)
-            response.raise_for_status()
-            
-            result_text = response.json()['choices'][0]['message']['content'].strip()
+            result_text = await self._complete(data, timeout=15)
             
             # Пытаемся распарсить JSON из ответа
             try:
@@ -100,6 +237,8 @@ Rules:
                     raise ValueError("Not all languages present in translation")
                 
                 logger.info(f"Successfully translated '{text}' to all languages")
+                if self.cache:
+                    await self.cache.put(cache_key, 'all', 'ar,uz,ru,en', NAME_MODEL, text, translations)
                 return {
                     "status": "ok",
                     "action": "translate_name",
@@ -128,14 +267,18 @@ Rules:
                 "needs_review": True
             }
     
-    def translate_broadcast_message(self, text, target_lang):
-        """Перевод сообщения для рассылки на конкретный язык"""
+    async def translate_broadcast_message(self, text, target_lang):
+        """Перевод сообщения для рассылки на конкретный язык.
+
+        Ошибка перевода пробрасывается: вызывающий решает, отправлять ли
+        оригинал, и отмечает сбой в отчете о рассылке.
+        """
+        cache_key = TranslationCache.make_key('broadcast', target_lang, BROADCAST_MODEL, text)
+        if self.cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             lang_names = {
                 'ar': 'Arabic',
                 'uz': 'Uzbek',
@@ -146,7 +289,7 @@ Rules:
             system_prompt = f"You are a professional translator. Translate the following message to {lang_names[target_lang]}. Preserve formatting, emojis, and line breaks. Return ONLY the translated text without any explanations."
             
             data = {
-                "model": "mistral-small-latest",
+                "model": BROADCAST_MODEL,
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": text}
@@ -155,16 +298,43 @@ Rules:
                 "max_tokens": 1000
             }
             
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=20)
-            response.raise_for_status()
-            
-            translated = response.json()['choices'][0]['message']['content'].strip()
+            translated = await self._complete(data, timeout=20)
             logger.info(f"Translated broadcast message to '{target_lang}'")
+            if self.cache:
+                await self.cache.put(cache_key, 'broadcast', target_lang, BROADCAST_MODEL, text, translated)
             return translated
             
         except Exception as e:
             logger.error(f"Broadcast translation error for {target_lang}: {e}")
-            return text  # Возвращаем оригинал при ошибке
+            raise
 
 # Глобальный экземпляр переводчика
-translator = MistralTranslator(MISTRAL_API_KEY)
\ No newline at end of file
+translator = MistralTranslator(MISTRAL_API_KEY, cache=TranslationCache(adb))
+
+def export_translation_cache(path):
+    """Выгрузить кэш переводов в JSON-файл (например, для переноса на новый сервер)"""
+    columns = ['cache_key', 'kind', 'target', 'model', 'prompt_version', 'source_text', 'result', 'created_date']
+    rows = [dict(zip(columns, row)) for row in db.export_translation_cache()]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=1)
+    return len(rows)
+
+def import_translation_cache(path):
+    with open(path, encoding='utf-8') as f:
+        rows = json.load(f)
+    return db.import_translation_cache([
+        (row['cache_key'], row['kind'], row['target'], row['model'], row['prompt_version'],
+         row['source_text'], row['result'], row['created_date'])
+        for row in rows
+    ])
+
+if __name__ == "__main__":
+    # python mistral_integration.py export|import <file.json>
+    if len(sys.argv) != 3 or sys.argv[1] not in ('export', 'import'):
+        print("Usage: python mistral_integration.py export|import <file.json>")
+        sys.exit(1)
+    if sys.argv[1] == 'export':
+        print(f"✅ Exported {export_translation_cache(sys.argv[2])} translations")
+    else:
+        print(f"✅ Imported {import_translation_cache(sys.argv[2])} new translations")
+    db.close()
\ No newline at end of file
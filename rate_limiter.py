@@ -0,0 +1,103 @@
+"""
+Ограничение частоты запросов к Telegram Bot API
+
+Telegram допускает около 30 сообщений в секунду на бота и примерно одно
+сообщение в секунду в один чат (20 в минуту для групп и каналов).
+TokenBucket сглаживает поток под эти лимиты, RateLimiter объединяет общий
+бакет с бакетами по чатам и умеет ставить всю отправку на паузу по RetryAfter.
+"""
+
+import asyncio
+import time
+
+
+def retry_after_seconds(error):
+    """Пауза из ошибки RetryAfter: в PTB 20 это число секунд, в новых версиях - timedelta"""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def idle_for(self, now):
+        """Сколько секунд бакет не использовался (для очистки бакетов по чатам)"""
+        return now - self._updated
+
+
+class RateLimiter:
+    def __init__(self, global_rate=25, per_chat_rate=1.0, chat_rates=None, max_chats=10000):
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        # Особые лимиты для отдельных чатов, например {CHANNEL_ID: 20 / 60}
+        self.chat_rates = chat_rates or {}
+        self.max_chats = max_chats
+        self._chat_buckets = {}
+        self._paused_until = 0.0
+        self._chat_paused_until = {}
+
+    def pause(self, seconds, chat_id=None):
+        """Остановить отправки на seconds секунд (ответ RetryAfter от Telegram).
+
+        С chat_id пауза касается только этого чата: флуд-контроль канала
+        не должен останавливать, например, идущую параллельно рассылку.
+        """
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+        else:
+            self._chat_paused_until[chat_id] = max(self._chat_paused_until.get(chat_id, 0.0), until)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chats:
+                now = time.monotonic()
+                # Бакет, простоявший дольше своего интервала, снова полон - его можно выбросить
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items()
+                    if value.idle_for(now) < 1.0 / value.rate
+                }
+            rate = self.chat_rates.get(chat_id, self.per_chat_rate)
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, capacity=1)
+        return bucket
+
+    async def acquire(self, chat_id=None):
+        if chat_id is not None:
+            while chat_id in self._chat_paused_until:
+                delay = self._chat_paused_until[chat_id] - time.monotonic()
+                if delay <= 0:
+                    self._chat_paused_until.pop(chat_id, None)
+                    break
+                await asyncio.sleep(delay)
+            await self._chat_bucket(chat_id).acquire()
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            await self.global_bucket.acquire()
+            # Пауза могла начаться, пока ждали токен
+            if self._paused_until <= time.monotonic():
+                return
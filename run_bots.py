@@ -9,11 +9,23 @@ import sys
 # Создаем необходимые директории
 os.makedirs("qari_photos", exist_ok=True)
 
+# Сколько ждем корректного завершения бота (сброс буферов БД) перед kill
+SHUTDOWN_TIMEOUT = 15
+
 def signal_handler(sig, frame):
     """Обработчик сигналов для корректного завершения"""
     logger.info("Получен сигнал завершения, останавливаем ботов...")
     sys.exit(0)
 
+def close_database():
+    """Сбрасывает буферы отложенной записи в БД перед выходом процесса бота
+    (если post_shutdown бота уже закрыл БД, повторный close ничего не делает)"""
+    try:
+        from database import adb
+        adb.close()
+    except Exception as e:
+        logger.error(f"Ошибка при закрытии БД: {e}")
+
 def run_admin_bot():
     """Запуск админ-бота в отдельном процессе"""
     try:
@@ -21,6 +33,8 @@ def run_admin_bot():
         admin_main()
     except Exception as e:
         logger.error(f"Ошибка в админ-боте: {e}")
+    finally:
+        close_database()
 
 def run_user_bot():
     """Запуск юзер-бота в отдельном процессе"""
@@ -29,6 +43,20 @@ def run_user_bot():
         user_main()
     except Exception as e:
         logger.error(f"Ошибка в юзер-боте: {e}")
+    finally:
+        close_database()
+
+def stop_processes(*processes):
+    """SIGTERM -> боты корректно завершают polling и сбрасывают буферы; kill только по таймауту"""
+    for process in processes:
+        process.terminate()
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    for process in processes:
+        process.join(timeout=max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.error(f"❌ {process.name} не завершился за {SHUTDOWN_TIMEOUT} с, принудительная остановка")
+            process.kill()
+            process.join()
 
 if __name__ == '__main__':
     # Настройка логирования
@@ -39,6 +67,14 @@ if __name__ == '__main__':
     
     logger = logging.getLogger(__name__)
     
+    from config import WEBHOOK_URL
+    if WEBHOOK_URL:
+        # Оба бота в одном процессе на webhook; сигналы остановки обрабатывает uvicorn
+        logger.info("🌐 Запуск ботов в режиме webhook...")
+        from webhook_server import main as webhook_main
+        webhook_main()
+        sys.exit(0)
+    
     # Обработчики сигналов
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -80,8 +116,5 @@ if __name__ == '__main__':
         logger.error(f"❌ Критическая ошибка: {e}")
     finally:
         logger.info("🔄 Завершение работы ботов...")
-        admin_process.terminate()
-        user_process.terminate()
-        admin_process.join(timeout=5)
-        user_process.join(timeout=5)
+        stop_processes(admin_process, user_process)
         logger.info("✅ Боты остановлены")
\ No newline at end of file
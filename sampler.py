@@ -0,0 +1,166 @@
+"""
+Случайный выбор сур и нашидов без ORDER BY RANDOM()
+
+Для каждого типа контента в памяти хранится массив id и таблица alias
+(метод Уолкера/Воуза), поэтому выбор - O(1) независимо от размера
+библиотеки, в том числе взвешенный: по прослушиваниям или по новизне.
+Последние выданные пользователю id помнятся, чтобы «Еще одна случайная»
+не повторяла только что сыгранное. Пул перечитывается из БД одним
+запросом после изменения контента (события Database, включая
+content_changed из другого процесса).
+"""
+
+import logging
+import random
+import threading
+from collections import OrderedDict, deque
+
+from config import RANDOM_NASHEED_WEIGHTING, RANDOM_SURA_WEIGHTING
+from database import db
+
+logger = logging.getLogger(__name__)
+
+UNIFORM = 'uniform'
+LISTENS = 'listens'
+RECENCY = 'recency'
+WEIGHTINGS = (UNIFORM, LISTENS, RECENCY)
+
+
+def build_alias_table(weights):
+    """Таблицы (prob, alias) метода alias для выбора индекса за O(1)"""
+    count = len(weights)
+    total = float(sum(weights))
+    if count == 0 or total <= 0:
+        return [1.0] * count, list(range(count))
+    scaled = [weight * count / total for weight in weights]
+    prob = [0.0] * count
+    alias = list(range(count))
+    small = [i for i, value in enumerate(scaled) if value < 1.0]
+    large = [i for i, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    # Остатки из-за погрешности округления - вероятность 1
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+
+def content_weights(rows, weighting, half_life=50):
+    """Веса для строк пула (id, listens) в порядке добавления"""
+    if weighting == LISTENS:
+        return [1 + (listens or 0) for _, listens in rows]
+    if weighting == RECENCY:
+        # Каждые half_life более новых записей вдвое уменьшают вес
+        newest = len(rows) - 1
+        return [0.5 ** ((newest - rank) / half_life) for rank in range(len(rows))]
+    return [1] * len(rows)
+
+
+class ContentPool:
+    """Массив id одного типа контента с таблицей alias"""
+
+    def __init__(self, rows, weighting=UNIFORM, rng=None):
+        self.ids = [row[0] for row in rows]
+        self.weighting = weighting
+        self._rng = rng or random.Random()
+        if weighting == UNIFORM:
+            self._prob = self._alias = None
+        else:
+            self._prob, self._alias = build_alias_table(content_weights(rows, weighting))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def pick(self):
+        index = self._rng.randrange(len(self.ids))
+        if self._prob is not None and self._rng.random() >= self._prob[index]:
+            index = self._alias[index]
+        return self.ids[index]
+
+
+class ContentSampler:
+    # Загрузка пула: метод Database, возвращающий [(id, listens)] в порядке добавления
+    POOL_LOADERS = {
+        'sura': 'get_sura_sampling_pool',
+        'nasheed': 'get_nasheed_sampling_pool',
+    }
+
+    def __init__(self, weighting=None, recent_window=10, max_users=10000, max_attempts=8):
+        # Способ взвешивания для каждого типа, по умолчанию - равновероятно
+        self.weighting = {}
+        for kind, mode in (weighting or {}).items():
+            if mode not in WEIGHTINGS:
+                logger.warning(f"Unknown weighting '{mode}' for {kind}, using {UNIFORM}")
+                mode = UNIFORM
+            self.weighting[kind] = mode
+        self.recent_window = recent_window
+        self.max_users = max_users
+        self.max_attempts = max_attempts
+        self._pools = {}
+        self._generation = 0           # растет при каждом изменении контента
+        self._recent = OrderedDict()   # (user_id, тип) -> последние выданные id
+        self._lock = threading.Lock()
+
+    def on_content_change(self, event, data):
+        """Слушатель Database: пул перечитается при следующем выборе"""
+        with self._lock:
+            self._generation += 1
+            self._pools.clear()
+
+    async def _pool(self, database, kind):
+        pool = self._pools.get(kind)
+        if pool is None:
+            generation = self._generation
+            rows = await getattr(database, self.POOL_LOADERS[kind])()
+            pool = ContentPool(rows, self.weighting.get(kind, UNIFORM))
+            with self._lock:
+                # Пул, прочитанный во время изменения контента, не сохраняем
+                if generation == self._generation:
+                    self._pools[kind] = pool
+            logger.info(f"Sampling pool '{kind}' loaded: {len(pool)} items, weighting={pool.weighting}")
+        return pool
+
+    def _recent_for(self, user_id, kind):
+        key = (user_id, kind)
+        recent = self._recent.get(key)
+        if recent is None:
+            recent = self._recent[key] = deque(maxlen=self.recent_window)
+            while len(self._recent) > self.max_users:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(key)
+        return recent
+
+    async def pick(self, database, kind, user_id=None):
+        """Случайный id контента или None, если пул пуст"""
+        pool = await self._pool(database, kind)
+        if not pool:
+            return None
+        if user_id is None:
+            return pool.pick()
+
+        with self._lock:
+            recent = self._recent_for(user_id, kind)
+            # Окно не больше половины пула, иначе повторы неизбежны
+            size = min(len(recent), len(pool) // 2)
+            window = set(list(recent)[len(recent) - size:])
+            choice = pool.pick()
+            for _ in range(self.max_attempts):
+                if choice not in window:
+                    break
+                choice = pool.pick()
+            recent.append(choice)
+        return choice
+
+    def forget(self, kind):
+        """Выбранный id уже удален из БД: перечитать пул"""
+        with self._lock:
+            self._pools.pop(kind, None)
+
+
+content_sampler = ContentSampler({'sura': RANDOM_SURA_WEIGHTING, 'nasheed': RANDOM_NASHEED_WEIGHTING})
+db.add_content_listener(content_sampler.on_content_change)
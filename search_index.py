@@ -0,0 +1,186 @@
+"""
+Индекс inline-поиска сур
+
+Названия сур (SURA_NAMES) нормализуются один раз при старте: все языки,
+транслитерация кириллицы в латиницу, варианты без артикля (Аль-, An-, ال).
+Поиск идет по триграммам, короткие запросы (1-2 символа) - по префиксам слов.
+Рядом хранится карта (сура, чтец) -> file_id, загружаемая одним запросом,
+поэтому ответ на inline-запрос не обращается к БД вообще. Актуальность
+карты обеспечивают события Database, в том числе content_changed от
+изменений, сделанных админ-ботом в другом процессе.
+"""
+
+import functools
+import logging
+import re
+import threading
+import time
+
+from config import SURA_NAMES
+from database import db
+
+logger = logging.getLogger(__name__)
+
+ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_FOLD = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي'})
+NON_WORD = re.compile(r'[\W_]+')
+
+CYRILLIC_TO_LATIN = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+ARTICLES = {'al', 'an', 'ar', 'as', 'ash', 'at', 'az', 'ad', 'ath', 'adh',
+            'аль', 'ал', 'ан', 'ар', 'ас', 'аш', 'ат', 'аз', 'ад'}
+
+
+def normalize_words(text):
+    """Нижний регистр, без огласовок и пунктуации; возвращает список слов"""
+    text = ARABIC_MARKS.sub('', text.lower()).translate(ARABIC_FOLD).replace('ё', 'е')
+    return NON_WORD.sub(' ', text).split()
+
+
+def fold_latin(text):
+    """Сглаживает разные латинские записи: kh/x -> h, q -> k, без удвоенных букв"""
+    text = text.replace('kh', 'h').replace('x', 'h').replace('q', 'k')
+    return re.sub(r'(.)\1+', r'\1', text)
+
+
+def name_variants(name):
+    """Все формы названия, по которым его можно найти (слитно, без пробелов)"""
+    words = normalize_words(name)
+    if not words:
+        return set()
+    forms = [words]
+    if len(words) > 1 and words[0] in ARTICLES:
+        forms.append(words[1:])
+    variants = set()
+    for form in forms:
+        compact = ''.join(form)
+        # Арабский артикль пишется слитно
+        if compact.startswith('ال') and len(compact) > 3:
+            variants.add(compact[2:])
+        variants.add(compact)
+        latin = compact.translate(CYRILLIC_TO_LATIN)
+        if latin.isascii():
+            variants.add(fold_latin(latin))
+    return variants
+
+
+def query_variants(query):
+    compact = ''.join(normalize_words(query))
+    if not compact:
+        return set()
+    variants = {compact}
+    latin = compact.translate(CYRILLIC_TO_LATIN)
+    if latin.isascii():
+        variants.add(fold_latin(latin))
+    return variants
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SuraSearchIndex:
+    def __init__(self, sura_names, refresh_interval=3600, cache_size=2048):
+        self.sura_names = sura_names
+        self.refresh_interval = refresh_interval
+        self._variants = {}   # номер суры -> множество форм названия
+        self._grams = {}      # триграмма -> номера сур
+        self._prefixes = {}   # первые 1-2 символа формы -> номера сур
+        for sura_num, names in sura_names.items():
+            variants = set()
+            for name in names.values():
+                variants |= name_variants(name)
+            self._variants[sura_num] = variants
+            for variant in variants:
+                for gram in trigrams(variant):
+                    self._grams.setdefault(gram, set()).add(sura_num)
+                for size in (1, 2):
+                    self._prefixes.setdefault(variant[:size], set()).add(sura_num)
+
+        # Запросы повторяются по мере набора текста - кэшируем ответы
+        self.search = functools.lru_cache(maxsize=cache_size)(self._search)
+
+        self._lock = threading.Lock()
+        self._files = {}        # номер суры -> {qari_id: file_id}
+        self._qari_names = {}   # qari_id -> имя чтеца
+        self._loaded_at = None
+
+    # Поиск по названиям
+    def _search(self, query, limit=20):
+        """Номера сур по запросу: сначала совпадения с начала названия"""
+        query = query.strip()
+        if query.isdigit():
+            return (int(query),) if int(query) in self.sura_names else ()
+
+        ranked = []
+        for variant in query_variants(query):
+            if len(variant) < 3:
+                candidates = self._prefixes.get(variant, ())
+            else:
+                grams = trigrams(variant)
+                candidates = set.intersection(*(self._grams.get(g, set()) for g in grams))
+            for sura_num in candidates:
+                forms = self._variants[sura_num]
+                if any(form.startswith(variant) for form in forms):
+                    ranked.append((0, sura_num))
+                elif len(variant) >= 3 and any(variant in form for form in forms):
+                    ranked.append((1, sura_num))
+
+        seen = set()
+        result = []
+        for _, sura_num in sorted(ranked):
+            if sura_num not in seen:
+                seen.add(sura_num)
+                result.append(sura_num)
+        return tuple(result[:limit])
+
+    # Карта доступных аудио
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def load(self, rows):
+        """Полная загрузка из Database.get_sura_availability()"""
+        files = {}
+        qari_names = {}
+        for order_number, qari_id, qari_name, file_id in rows:
+            files.setdefault(order_number, {})[qari_id] = file_id
+            qari_names[qari_id] = qari_name
+        with self._lock:
+            self._files = files
+            self._qari_names = qari_names
+            self._loaded_at = time.monotonic()
+        logger.info(f"Sura search index loaded: {len(rows)} audio files, {len(qari_names)} qaris")
+
+    def get_files(self, sura_num, limit=None):
+        """[(qari_id, имя чтеца, file_id), ...] в порядке добавления чтецов"""
+        with self._lock:
+            available = self._files.get(sura_num)
+            if not available:
+                return []
+            result = [(qari_id, self._qari_names.get(qari_id, ''), file_id)
+                      for qari_id, file_id in available.items()]
+        return result[:limit] if limit else result
+
+    def on_content_change(self, event, data):
+        """Слушатель Database: точечно обновляет карту после записи админом"""
+        with self._lock:
+            if event == 'qari_added':
+                self._qari_names[data['qari_id']] = data['names'].get('ru', '')
+            elif event == 'sura_added' and data['file_id']:
+                self._files.setdefault(int(data['order_number']), {})[data['qari_id']] = data['file_id']
+            elif event == 'qari_deleted':
+                self._qari_names.pop(data['qari_id'], None)
+                for available in self._files.values():
+                    available.pop(data['qari_id'], None)
+            elif event == 'content_changed':
+                # Контент изменил другой процесс: перечитать карту при следующем запросе
+                self._loaded_at = None
+
+
+sura_index = SuraSearchIndex(SURA_NAMES)
+db.add_content_listener(sura_index.on_content_change)
@@ -0,0 +1,309 @@
+"""
+Импорт сур чтеца из ZIP-архива
+
+Файлы читаются прямо из архива по одному (без extractall на диск),
+загружаются на канал несколькими параллельными загрузками под общим
+RateLimiter, а строки сур записываются в БД одной транзакцией в конце.
+ProgressReporter обновляет сообщение с прогрессом не чаще заданного интервала.
+
+Каждое загруженное аудио запоминается в audio_fingerprints (sha256 и размер
+содержимого, file_unique_id, длительность), поэтому повторный импорт того же
+архива после сбоя не загружает на канал уже загруженные суры.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+import zipfile
+
+from telegram import InputFile
+from telegram.error import RetryAfter
+
+from config import SURA_NAMES
+from rate_limiter import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.ogg')
+
+
+def sura_names_for(sura_number):
+    return SURA_NAMES.get(sura_number, {
+        'ar': f'سورة {sura_number}',
+        'uz': f'Sura {sura_number}',
+        'ru': f'Сура {sura_number}',
+        'en': f'Surah {sura_number}'
+    })
+
+
+def progress_bar(done, total):
+    percent = int(done / total * 100) if total else 100
+    filled = int(percent / 10)
+    return f"{'▰' * filled}{'▱' * (10 - filled)} {percent}%"
+
+
+def scan_zip(zip_ref):
+    """{номер суры: ZipInfo} по именам файлов: 001.mp3, 1.mp3, sura_001.mp3 и т.д."""
+    members = {}
+    for info in zip_ref.infolist():
+        filename = os.path.basename(info.filename)
+        if info.is_dir() or filename.startswith('.') or '__MACOSX' in info.filename:
+            continue
+        if not filename.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        match = re.search(r'(\d+)', filename)
+        if match and 1 <= int(match.group(1)) <= 114:
+            members[int(match.group(1))] = info
+    return members
+
+
+def read_member(zip_ref, info):
+    """(содержимое, sha256) файла архива; вызывается в отдельном потоке"""
+    data = zip_ref.read(info)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+class ProgressReporter:
+    """Редактирует сообщение с прогрессом не чаще раза в interval секунд.
+
+    update() только запоминает последний текст, поэтому частые обновления
+    не превращаются в десятки запросов editMessageText.
+    """
+
+    def __init__(self, message, interval=2.0):
+        self.message = message
+        self.interval = interval
+        self.edits = 0
+        self._text = None
+        self._shown = None
+        self._task = None
+
+    def update(self, text):
+        self._text = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _show(self, text, **kwargs):
+        if text == self._shown:
+            return
+        try:
+            await self.message.edit_text(text, **kwargs)
+            self._shown = text
+            self.edits += 1
+        except RetryAfter as e:
+            await asyncio.sleep(retry_after_seconds(e))
+        except Exception as e:
+            logger.error(f"Progress update error: {e}")
+
+    async def _run(self):
+        while True:
+            await self._show(self._text)
+            await asyncio.sleep(self.interval)
+
+    async def finish(self, text, **kwargs):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._show(text, **kwargs)
+
+
+class UploadStats:
+    """Время загрузок на канал: сколько ждали лимитов и сколько шел сам запрос"""
+
+    def __init__(self):
+        self.latencies = []   # длительность успешных запросов send_audio, сек
+        self.waited = 0.0     # суммарное ожидание RateLimiter, сек
+        self.flood_waits = 0
+        self.flood_seconds = 0.0
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        return {
+            "uploads": count,
+            "avg": round(sum(latencies) / count, 2) if count else 0.0,
+            "p50": round(latencies[count // 2], 2) if count else 0.0,
+            "p95": round(latencies[min(count - 1, int(count * 0.95))], 2) if count else 0.0,
+            "max": round(latencies[-1], 2) if count else 0.0,
+            "limiter_wait": round(self.waited, 1),
+            "flood_waits": self.flood_waits,
+            "flood_seconds": round(self.flood_seconds, 1),
+        }
+
+
+class ChannelUploader:
+    """Загрузка аудио на канал с ограничением параллельности и частоты.
+
+    Фиксированных задержек нет: отправка идет так быстро, как позволяет
+    RateLimiter, а канал ставится на паузу только по настоящему RetryAfter.
+    """
+
+    def __init__(self, bot, chat_id, limiter, concurrency=4):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.limiter = limiter
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = UploadStats()
+
+    async def send_audio(self, audio, **kwargs):
+        """send_audio с повтором по RetryAfter; возвращает сообщение на канале"""
+        while True:
+            started = time.monotonic()
+            await self.limiter.acquire(self.chat_id)
+            sending = time.monotonic()
+            self.stats.waited += sending - started
+            try:
+                message = await self.bot.send_audio(chat_id=self.chat_id, audio=audio, **kwargs)
+            except RetryAfter as e:
+                seconds = retry_after_seconds(e)
+                self.stats.flood_waits += 1
+                self.stats.flood_seconds += seconds
+                logger.warning(f"Channel upload flood control: pausing for {seconds}s")
+                self.limiter.pause(seconds, chat_id=self.chat_id)
+                continue
+            self.stats.latencies.append(time.monotonic() - sending)
+            return message
+
+
+async def upload_telegram_audio(database, uploader, audio):
+    """file_id аудио на канале и признак, что оно уже было загружено раньше.
+
+    audio - объект Audio из сообщения админа; повторно пересланный файл
+    узнается по file_unique_id и на канал не отправляется.
+    """
+    file_id = await database.get_audio_fingerprint(file_unique_id=audio.file_unique_id)
+    if file_id:
+        return file_id, True
+    message = await uploader.send_audio(audio.file_id)
+    await database.save_audio_fingerprint(
+        message.audio.file_id,
+        file_size=message.audio.file_size or audio.file_size,
+        file_unique_id=audio.file_unique_id,
+        duration=message.audio.duration or audio.duration
+    )
+    return message.audio.file_id, False
+
+
+class SuraZipImporter:
+    def __init__(self, database, uploader):
+        self.database = database
+        self.uploader = uploader
+
+    async def _upload_member(self, zip_ref, sura_number, info, report, uploaded):
+        filename = os.path.basename(info.filename)
+        if info.file_size == 0:
+            report['errors'].append(f"Сура {sura_number}: пустой файл")
+            report['skipped'] += 1
+            return
+        if info.file_size < 10000:  # Меньше 10KB - подозрительно
+            report['errors'].append(f"Сура {sura_number}: подозрительно малый размер ({info.file_size} байт)")
+
+        async with self.uploader.semaphore:
+            try:
+                # Распаковка одного файла в потоке, чтобы не блокировать event loop;
+                # при повреждении архива чтение падает с BadZipFile (проверка CRC)
+                data, sha256 = await asyncio.to_thread(read_member, zip_ref, info)
+                file_id = await self.database.get_audio_fingerprint(sha256=sha256, file_size=info.file_size)
+                if file_id:
+                    # Уже на канале после прошлого (возможно, прерванного) импорта
+                    report['reused'] += 1
+                    uploaded.append((sura_number, file_id, sura_names_for(sura_number)))
+                    return
+                message = await self.uploader.send_audio(
+                    InputFile(data, filename=filename),
+                    title=f"Surah {sura_number}",
+                    duration=0  # Telegram сам определит длительность
+                )
+                # Запоминаем сразу: при сбое дальше эта сура не будет загружаться заново
+                await self.database.save_audio_fingerprint(
+                    message.audio.file_id,
+                    sha256=sha256,
+                    file_size=info.file_size,
+                    file_unique_id=message.audio.file_unique_id,
+                    duration=message.audio.duration
+                )
+            except zipfile.BadZipFile as e:
+                report['integrity_check'] = "failed"
+                report['errors'].append(f"Сура {sura_number} ({filename}): поврежден в архиве: {e}")
+                report['skipped'] += 1
+                return
+            except Exception as e:
+                logger.error(f"Error processing file {filename}: {e}")
+                report['errors'].append(f"Сура {sura_number} ({filename}): {str(e)}")
+                report['skipped'] += 1
+                return
+
+        if (message.audio.duration or 0) < 1:
+            report['errors'].append(f"Сура {sura_number}: длительность меньше 1 секунды")
+        uploaded.append((sura_number, message.audio.file_id, sura_names_for(sura_number)))
+
+    async def import_zip(self, zip_path, qari_id, progress=None):
+        """Импортировать архив; возвращает отчет в формате validation_report"""
+        report = {
+            "action": "process_zip",
+            "status": "ok",
+            "qari_id": qari_id,
+            "uploaded": 0,
+            "reused": 0,
+            "skipped": 0,
+            "errors": [],
+            "missing_files": [],
+            "missing_numbers": [],
+            "integrity_check": "ok"
+        }
+        started = time.monotonic()
+
+        try:
+            zip_ref = zipfile.ZipFile(zip_path, 'r')
+        except zipfile.BadZipFile as e:
+            report['integrity_check'] = "failed"
+            report['status'] = "error"
+            report['errors'].append(f"Невалидный ZIP файл: {str(e)}")
+            return report
+
+        with zip_ref:
+            members = scan_zip(zip_ref)
+            if not members:
+                report['status'] = "error"
+                report['errors'].append("В архиве не найдено аудио файлов с корректными номерами (1-114)")
+                return report
+
+            missing_numbers = sorted(set(range(1, 115)) - set(members))
+            report['missing_numbers'] = missing_numbers
+            if missing_numbers:
+                report['missing_files'] = [f"{num:03d}.mp3" for num in missing_numbers[:10]]  # Первые 10
+                if len(missing_numbers) > 10:
+                    report['missing_files'].append(f"...и еще {len(missing_numbers)-10}")
+
+            total = len(members)
+            uploaded = []
+
+            def on_progress():
+                if progress:
+                    done = len(uploaded) + report['skipped']
+                    elapsed = time.monotonic() - started
+                    progress.update(
+                        f"🔄 Загрузка {total} сур на канал...\n\n{progress_bar(done, total)}\n\n"
+                        f"✅ Загружено: {len(uploaded)}/{total}\n"
+                        f"⏱ {elapsed:.0f} сек"
+                    )
+
+            async def upload(sura_number, info):
+                await self._upload_member(zip_ref, sura_number, info, report, uploaded)
+                on_progress()
+
+            on_progress()
+            await asyncio.gather(*(upload(sura_number, info) for sura_number, info in sorted(members.items())))
+
+        # Все строки сур - одной транзакцией
+        if uploaded:
+            await self.database.add_suras(qari_id, sorted(uploaded))
+        report['uploaded'] = len(uploaded)
+        report['elapsed'] = round(time.monotonic() - started, 1)
+        report['upload_stats'] = self.uploader.stats.summary()
+        if report['errors'] or report['missing_files']:
+            report['status'] = "warning" if report['uploaded'] > 0 else "error"
+        return report
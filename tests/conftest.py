@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# До импорта database: синглтон db открывает DATABASE_PATH при импорте модуля
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bot_tests_'), 'bot.db')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import pytest
+
+from database import Database
+
+ADMIN_ID = 1
+OTHER_ADMIN_ID = 2
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    yield db
+    db.close()
+
+
+def recount(db, admin_id):
+    """Непрочитанные по определению: сообщения пользователей после курсора чтения чата"""
+    conn = db.get_connection()
+    try:
+        return conn.execute('''
+            SELECT COUNT(*) FROM messages m JOIN admin_chats c ON m.chat_id = c.chat_id
+            WHERE c.admin_id = ? AND m.is_from_admin = 0 AND m.message_id > c.last_read_message_id
+        ''', (admin_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_user_messages_increment_unread(db):
+    first = db.get_chat_id(ADMIN_ID, 100, create_if_not_exists=True)
+    second = db.get_chat_id(ADMIN_ID, 200, create_if_not_exists=True)
+    other = db.get_chat_id(OTHER_ADMIN_ID, 300, create_if_not_exists=True)
+    for _ in range(3):
+        db.save_message(first, 100, 'hi')
+    db.save_message(second, 200, 'hello')
+    db.save_message(other, 300, 'hey')
+    assert db.get_unread_messages_count(ADMIN_ID) == 4 == recount(db, ADMIN_ID)
+    assert db.get_unread_messages_count(OTHER_ADMIN_ID) == 1
+
+
+def test_admin_reply_marks_chat_read(db):
+    first = db.get_chat_id(ADMIN_ID, 100, create_if_not_exists=True)
+    second = db.get_chat_id(ADMIN_ID, 200, create_if_not_exists=True)
+    db.save_message(first, 100, 'one')
+    db.save_message(first, 100, 'two')
+    db.save_message(second, 200, 'three')
+    db.save_message(first, ADMIN_ID, 'reply', is_from_admin=True)
+    assert db.get_unread_messages_count(ADMIN_ID) == 1 == recount(db, ADMIN_ID)
+    db.save_message(first, 100, 'four')
+    assert db.get_unread_messages_count(ADMIN_ID) == 2 == recount(db, ADMIN_ID)
+
+
+def test_mark_chat_read(db):
+    first = db.get_chat_id(ADMIN_ID, 100, create_if_not_exists=True)
+    second = db.get_chat_id(ADMIN_ID, 200, create_if_not_exists=True)
+    db.save_message(first, 100, 'one')
+    db.save_message(second, 200, 'two')
+    db.mark_chat_read(first)
+    assert db.get_unread_messages_count(ADMIN_ID) == 1 == recount(db, ADMIN_ID)
+    # Повторное открытие и пустой чат счетчик не портят
+    db.mark_chat_read(first)
+    db.mark_chat_read(db.get_chat_id(ADMIN_ID, 300, create_if_not_exists=True))
+    assert db.get_unread_messages_count(ADMIN_ID) == 1
+    db.mark_chat_read(second)
+    assert db.get_unread_messages_count(ADMIN_ID) == 0 == recount(db, ADMIN_ID)
+
+
+def test_unknown_admin_has_no_unread(db):
+    assert db.get_unread_messages_count(ADMIN_ID) == 0
@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from broadcast import BLOCKED, FAILED, SENT, BroadcastEngine, is_permanent_failure
+from rate_limiter import RateLimiter, TokenBucket
+
+
+class ScriptedBot:
+    """Бот, который для каждого чата по очереди бросает заданные ошибки, затем отправляет"""
+
+    def __init__(self, errors=None):
+        self.errors = {chat_id: list(chat_errors) for chat_id, chat_errors in (errors or {}).items()}
+        self.attempts = {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.attempts[chat_id] = self.attempts.get(chat_id, 0) + 1
+        chat_errors = self.errors.get(chat_id)
+        if chat_errors:
+            raise chat_errors.pop(0)
+        self.sent.append(chat_id)
+
+
+def fast_limiter():
+    return RateLimiter(global_rate=10000, per_chat_rate=10000)
+
+
+def test_permanent_failures():
+    assert is_permanent_failure(Forbidden('Forbidden: bot was blocked by the user'))
+    assert is_permanent_failure(BadRequest('Chat not found'))
+    assert is_permanent_failure(BadRequest('Forbidden: user is deactivated'))
+    assert not is_permanent_failure(BadRequest('Message is too long'))
+    assert not is_permanent_failure(TimedOut())
+    assert not is_permanent_failure(NetworkError('Connection reset'))
+
+
+def test_send_one_classifies_errors():
+    bot = ScriptedBot({
+        1: [Forbidden('bot was blocked by the user')],
+        2: [BadRequest('Message is too long')],
+        3: [TimedOut(), NetworkError('Connection reset')],
+        4: [TimedOut(), TimedOut(), TimedOut()],
+    })
+    engine = BroadcastEngine(bot, fast_limiter(), max_attempts=3, retry_delay=0)
+
+    async def run():
+        return [await engine.send_one(chat_id, 'text') for chat_id in (1, 2, 3, 4)]
+
+    (blocked, _), (bad_request, _), (retried, _), (failed, error) = asyncio.run(run())
+    assert blocked == BLOCKED
+    # BadRequest не повторяется, хотя в PTB это подкласс NetworkError
+    assert bad_request == FAILED and bot.attempts[2] == 1
+    assert retried == SENT and bot.attempts[3] == 3
+    assert failed == FAILED and bot.attempts[4] == 3
+    assert engine.stats.retries == 4
+
+
+def test_retry_after_pauses_limiter_and_retries():
+    bot = ScriptedBot({1: [RetryAfter(1)]})
+    limiter = fast_limiter()
+    engine = BroadcastEngine(bot, limiter, retry_delay=0)
+
+    async def run():
+        started = time.monotonic()
+        result = await engine.send_one(1, 'text')
+        return result, time.monotonic() - started
+
+    (status, error), elapsed = asyncio.run(run())
+    assert status == SENT and error is None
+    assert bot.attempts[1] == 2
+    assert engine.stats.flood_waits == 1
+    assert elapsed >= 0.9
+
+
+def test_run_records_results_for_every_recipient():
+    bot = ScriptedBot({5: [Forbidden('bot was blocked by the user')], 7: [BadRequest('Message is too long')]})
+    results = {}
+
+    async def on_result(chat_id, status, error):
+        results[chat_id] = status
+
+    engine = BroadcastEngine(bot, fast_limiter(), workers=4, on_result=on_result)
+    stats = asyncio.run(engine.run((chat_id, 'text') for chat_id in range(20)))
+    assert (stats.sent, stats.blocked, stats.failed) == (18, 1, 1)
+    assert results[5] == BLOCKED and results[7] == FAILED
+    assert len(results) == 20
+    assert not engine.in_flight
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def run():
+        started = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # Первый токен есть сразу, остальные 10 приходят по 1/50 секунды
+    assert asyncio.run(run()) >= 0.18
+
+
+def test_global_pause_blocks_all_chats():
+    limiter = fast_limiter()
+
+    async def run():
+        limiter.pause(0.3)
+        started = time.monotonic()
+        await asyncio.gather(limiter.acquire(1), limiter.acquire(2), limiter.acquire())
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.25
+
+
+def test_chat_pause_does_not_block_other_chats():
+    limiter = fast_limiter()
+
+    async def run():
+        limiter.pause(0.3, chat_id=1)
+        started = time.monotonic()
+        await limiter.acquire(2)
+        other = time.monotonic() - started
+        await limiter.acquire(1)
+        return other, time.monotonic() - started
+
+    other, paused = asyncio.run(run())
+    assert other < 0.1
+    assert paused >= 0.25
@@ -0,0 +1,150 @@
+import asyncio
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from broadcast import BroadcastWorker
+from database import AsyncDatabase, Database
+from rate_limiter import RateLimiter
+
+USERS = 120
+
+
+class FakeBot:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.sent = Counter()
+        self.edits = []
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(self.delay)
+        self.sent[chat_id] += 1
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    for i in range(USERS):
+        db.save_user(1000 + i, f'user{i}', f'User {i}')
+    return db
+
+
+@pytest.fixture
+def adb(db):
+    adb = AsyncDatabase(db)
+    yield adb
+    adb.close()
+
+
+async def create_job(adb):
+    recipients = [row for batch in await adb.iter_broadcast_recipients() for row in batch]
+    return await adb.create_broadcast_job(1, {'ru': 'text'}, recipients, progress_chat_id=1, progress_message_id=2)
+
+
+def recipient_statuses(db, job_id):
+    conn = db.get_connection()
+    try:
+        return dict(conn.execute(
+            "SELECT user_id, status FROM broadcast_recipients WHERE job_id = ?", (job_id,)
+        ).fetchall())
+    finally:
+        conn.close()
+
+
+def test_job_runs_to_completion(db, adb):
+    async def run():
+        job_id = await create_job(adb)
+        bot = FakeBot(delay=0)
+        worker = BroadcastWorker(bot, adb, limiter=RateLimiter(global_rate=10000))
+        worker.start(job_id)
+        await worker._jobs[job_id][0]
+        return job_id, bot
+
+    job_id, bot = asyncio.run(run())
+    assert db.get_broadcast_progress(job_id) == {'sent': USERS}
+    assert set(bot.sent.values()) == {1}
+    assert db.get_broadcast_job(job_id)[1] == 'done'
+
+
+def test_resume_after_crash_sends_each_recipient_once(db, adb):
+    """После аварии claimed возвращаются в очередь, а прерванные на лету (sending) повторно не отправляются"""
+    async def run():
+        job_id = await create_job(adb)
+        bot = FakeBot()
+        worker = BroadcastWorker(bot, adb, limiter=RateLimiter(global_rate=10000), claim_size=30)
+        worker.start(job_id)
+        await asyncio.sleep(0.3)
+        # Процесс "упал": задача оборвана без stop(), в БД остались claimed и sending
+        task = worker._jobs[job_id][0]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        db.flush_broadcast_results()
+        crashed = recipient_statuses(db, job_id)
+        assert 0 < len(bot.sent) < USERS
+
+        interrupted = db.start_broadcast_job(job_id)
+        assert interrupted == Counter(crashed.values())['sending']
+        worker.start(job_id)
+        await worker._jobs[job_id][0]
+        return job_id, bot, crashed
+
+    job_id, bot, crashed = asyncio.run(run())
+    final = recipient_statuses(db, job_id)
+    assert set(final.values()) <= {'sent', 'failed'}
+    assert max(bot.sent.values()) == 1
+    # Всем, кроме прерванных на лету, сообщение ушло ровно один раз
+    interrupted = {user_id for user_id, status in crashed.items() if status == 'sending'}
+    assert {user_id for user_id, status in final.items() if status == 'failed'} == interrupted
+    assert set(final) - interrupted <= set(bot.sent)
+    assert db.get_broadcast_job(job_id)[1] == 'done'
+
+
+def test_stop_returns_unsent_recipients_to_queue(db, adb):
+    async def run():
+        job_id = await create_job(adb)
+        worker = BroadcastWorker(FakeBot(), adb, limiter=RateLimiter(global_rate=10000), claim_size=30)
+        worker.start(job_id)
+        await asyncio.sleep(0.3)
+        await worker.stop()
+        return job_id
+
+    job_id = asyncio.run(run())
+    progress = db.get_broadcast_progress(job_id)
+    assert set(progress) <= {'pending', 'sent'}
+    assert progress['pending'] > 0
+    assert sum(progress.values()) == USERS
+    assert db.get_unfinished_broadcast_jobs() == [job_id]
+
+
+def test_database_error_fails_job_and_releases_claimed(db, adb, monkeypatch):
+    claim = db.claim_broadcast_recipients
+    calls = []
+
+    def flaky_claim(job_id, limit=50):
+        calls.append(limit)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError('disk I/O error')
+        return claim(job_id, limit)
+
+    monkeypatch.setattr(db, 'claim_broadcast_recipients', flaky_claim)
+
+    async def run():
+        job_id = await create_job(adb)
+        bot = FakeBot()
+        worker = BroadcastWorker(bot, adb, limiter=RateLimiter(global_rate=10000), claim_size=50)
+        worker.start(job_id)
+        await worker._jobs[job_id][0]
+        return job_id, bot
+
+    job_id, bot = asyncio.run(run())
+    job = db.get_broadcast_job(job_id)
+    assert job[1] == 'failed'
+    assert 'disk I/O error' in job[3]
+    progress = db.get_broadcast_progress(job_id)
+    assert 'claimed' not in progress and 'sending' not in progress
+    assert progress.get('sent', 0) == len(bot.sent)
+    assert 'disk I/O error' in bot.edits[-1]
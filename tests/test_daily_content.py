@@ -0,0 +1,107 @@
+import asyncio
+import datetime
+
+import pytest
+
+from daily_content import RANDOM, SEQUENTIAL, DailyContent
+from database import AsyncDatabase, Database
+from sampler import ContentSampler
+from sura_import import sura_names_for
+
+NAMES = {'ar': 'a', 'uz': 'u', 'ru': 'r', 'en': 'e'}
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    qari_id = db.add_qari('photo', NAMES)
+    db.add_suras(qari_id, [(number, f'file{number}', sura_names_for(number)) for number in range(1, 21)])
+    for index in range(6):
+        db.add_nasheed(f'nasheed{index}', NAMES, 'performer')
+    return db
+
+
+@pytest.fixture
+def adb(db):
+    adb = AsyncDatabase(db)
+    yield adb
+    adb.close()
+
+
+def days_from_today(count, start=0):
+    today = datetime.date.today()
+    return [(today + datetime.timedelta(days=offset)).isoformat() for offset in range(start, start + count)]
+
+
+def schedule(db, count=7):
+    days = days_from_today(count)
+    return {day: (sura_id, nasheed_id) for day, sura_id, nasheed_id in db.get_daily_schedule(days[0], days[-1])}
+
+
+def daily(adb, **kwargs):
+    kwargs.setdefault('sampler', ContentSampler())
+    kwargs.setdefault('max_attempts', 100)
+    return DailyContent(adb, **kwargs)
+
+
+def test_random_schedule_fills_every_day_without_repeats(db, adb):
+    filled = asyncio.run(daily(adb, days=7, policy=RANDOM, repeat_window=5).fill_schedule())
+    planned = schedule(db)
+    assert filled == 14
+    assert list(planned) == days_from_today(7)
+    suras = [sura_id for sura_id, _ in planned.values()]
+    nasheeds = [nasheed_id for _, nasheed_id in planned.values()]
+    assert None not in suras and None not in nasheeds
+    # Окно повторов не больше половины пула: 5 для сур, 3 для нашидов
+    assert all(len(set(suras[i:i + 6])) == 6 for i in range(len(suras) - 5))
+    assert all(len(set(nasheeds[i:i + 4])) == 4 for i in range(len(nasheeds) - 3))
+
+
+def test_admin_choice_is_kept_and_refill_is_idempotent(db, adb):
+    db.set_daily_sura(3)
+    content = daily(adb, days=7)
+    assert asyncio.run(content.fill_schedule()) == 13
+    assert schedule(db)[days_from_today(1)[0]][0] == 3
+    assert asyncio.run(content.fill_schedule()) == 0
+
+
+def test_deleted_content_is_replaced(db, adb):
+    content = daily(adb, days=7)
+    asyncio.run(content.fill_schedule())
+    tomorrow = days_from_today(1, start=1)[0]
+    deleted = schedule(db)[tomorrow][0]
+    conn = db.get_connection()
+    try:
+        conn.execute("DELETE FROM suras WHERE sura_id = ?", (deleted,))
+        conn.commit()
+    finally:
+        conn.close()
+    content.sampler.on_content_change('sura_deleted', {})
+    assert asyncio.run(content.fill_schedule()) == 1
+    assert schedule(db)[tomorrow][0] not in (None, deleted)
+
+
+def test_sequential_continues_from_history(db, adb):
+    yesterday = days_from_today(1, start=-1)[0]
+    db.fill_daily_schedule([(yesterday, 18, 6)])
+    asyncio.run(daily(adb, days=4, policy=SEQUENTIAL).fill_schedule())
+    planned = schedule(db, 4)
+    assert [sura_id for sura_id, _ in planned.values()] == [19, 20, 1, 2]
+    assert [nasheed_id for _, nasheed_id in planned.values()] == [1, 2, 3, 4]
+
+
+def test_today_served_from_memory_until_content_changes(db, adb):
+    content = daily(adb, days=1)
+
+    async def run():
+        await content.fill_schedule()
+        first = await content.get('sura')
+        db.set_daily_sura(5)
+        # Событие из БД теста не подписано на content: в памяти старая строка
+        cached = await content.get('sura')
+        content.on_content_change('daily_content_set', {})
+        return first, cached, await content.get('sura')
+
+    first, cached, changed = asyncio.run(run())
+    assert cached == first
+    assert changed[0] == 5
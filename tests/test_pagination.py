@@ -0,0 +1,86 @@
+import pytest
+
+from database import Database
+from sura_import import sura_names_for
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    yield db
+    db.close()
+
+
+def walk_forward(fetch, limit):
+    pages = [fetch(None, False, limit)]
+    while pages[-1].next_cursor:
+        pages.append(fetch(pages[-1].next_cursor, False, limit))
+    return pages
+
+
+def walk_backward(fetch, page, limit):
+    pages = [page]
+    while pages[-1].prev_cursor:
+        pages.append(fetch(pages[-1].prev_cursor, True, limit))
+    return pages[::-1]
+
+
+def flatten(pages):
+    return [row for page in pages for row in page]
+
+
+def test_suras_pages_cover_all_rows_once(db):
+    qari_id = db.add_qari('photo', {'ar': 'a', 'uz': 'u', 'ru': 'r', 'en': 'e'})
+    db.add_suras(qari_id, [(number, f'file{number}', sura_names_for(number)) for number in range(1, 24)])
+
+    def fetch(cursor, backward, limit):
+        return db.get_suras_page(qari_id, cursor, backward, limit)
+
+    pages = walk_forward(fetch, 5)
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert [row[1] for row in flatten(pages)] == list(range(1, 24))
+    assert {page.total for page in pages} == {23}
+    assert pages[0].prev_cursor is None and pages[-1].next_cursor is None
+    # Назад от последней страницы - те же страницы в обратном порядке
+    back = walk_backward(fetch, pages[-1], 5)
+    assert [[row[1] for row in page] for page in back] == [[row[1] for row in page] for page in pages]
+
+
+def test_total_counted_only_on_first_page(db):
+    qari_id = db.add_qari('photo', {'ar': 'a', 'uz': 'u', 'ru': 'r', 'en': 'e'})
+    db.add_suras(qari_id, [(number, f'file{number}', sura_names_for(number)) for number in range(1, 11)])
+    first = db.get_suras_page(qari_id, limit=4)
+    db.add_suras(qari_id, [(number, f'file{number}', sura_names_for(number)) for number in range(11, 15)])
+    # Число в курсоре не пересчитывается при листании
+    assert db.get_suras_page(qari_id, first.next_cursor, limit=4).total == 10
+    assert db.get_suras_page(qari_id, limit=4).total == 14
+
+
+def test_users_pages_with_equal_and_null_dates(db):
+    for user_id in range(1, 31):
+        db.save_user(user_id, f'user{user_id}', f'User {user_id}')
+    conn = db.get_connection()
+    try:
+        # Одинаковые даты (порядок решает user_id) и пользователи без даты регистрации
+        conn.execute("UPDATE users SET registration_date = '2024-01-0' || (user_id % 3 + 1) || ' 10:00:00'")
+        conn.execute("UPDATE users SET registration_date = NULL WHERE user_id % 7 = 0")
+        conn.commit()
+        expected = [row[0] for row in conn.execute(
+            "SELECT user_id FROM users ORDER BY COALESCE(registration_date, '') DESC, user_id DESC"
+        )]
+    finally:
+        conn.close()
+
+    def fetch(cursor, backward, limit):
+        return db.get_users_page(cursor, backward, limit)
+
+    pages = walk_forward(fetch, 7)
+    assert [row[0] for row in flatten(pages)] == expected
+    assert {page.total for page in pages} == {30}
+    back = walk_backward(fetch, pages[-1], 7)
+    assert [row[0] for row in flatten(back)] == expected
+
+
+def test_empty_selection(db):
+    page = db.get_users_page()
+    assert (page.rows, page.total, page.prev_cursor, page.next_cursor) == ([], 0, None, None)
@@ -0,0 +1,33 @@
+import pytest
+
+from database import HOT_QUERIES, Database
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / 'bot.db'))
+    yield database
+    database.close()
+
+
+def test_hot_queries_use_indexes(database):
+    """Каждый SELECT горячих методов идет по индексу, без SCAN и TEMP B-TREE"""
+    assert database.check_query_plans() == {}
+
+
+def test_hot_queries_are_database_methods():
+    for name in HOT_QUERIES:
+        assert callable(getattr(Database, name, None)), name
+
+
+def test_plan_check_reports_full_scan(database, monkeypatch):
+    def scan_users():
+        conn = database.get_connection()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM users WHERE first_name = ?", ('x',)).fetchone()
+        finally:
+            conn.close()
+
+    monkeypatch.setattr(database, 'scan_users', scan_users, raising=False)
+    monkeypatch.setitem(HOT_QUERIES, 'scan_users', ())
+    assert database.check_query_plans() == {'scan_users': ['SCAN users']}
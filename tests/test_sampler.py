@@ -0,0 +1,97 @@
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+
+from sampler import LISTENS, RECENCY, UNIFORM, ContentPool, ContentSampler, build_alias_table, content_weights
+
+
+class FakeDatabase:
+    def __init__(self, suras):
+        self.suras = suras
+        self.loads = 0
+
+    async def get_sura_sampling_pool(self):
+        self.loads += 1
+        return list(self.suras)
+
+
+def alias_probabilities(prob, alias):
+    """Итоговая вероятность каждого индекса по таблицам alias"""
+    count = len(prob)
+    result = [value / count for value in prob]
+    for index, target in enumerate(alias):
+        result[target] += (1.0 - prob[index]) / count
+    return result
+
+
+@pytest.mark.parametrize('weights', [[1, 1, 1, 1], [1, 2, 3, 4], [10, 1, 0, 5, 1], [1000, 1]])
+def test_alias_table_is_exact(weights):
+    prob, alias = build_alias_table(weights)
+    total = sum(weights)
+    assert alias_probabilities(prob, alias) == pytest.approx([weight / total for weight in weights])
+
+
+def test_alias_table_without_weights():
+    assert build_alias_table([]) == ([], [])
+    assert alias_probabilities(*build_alias_table([0, 0])) == pytest.approx([0.5, 0.5])
+
+
+def test_content_weights():
+    rows = [(1, 0), (2, 9), (3, None)]
+    assert content_weights(rows, UNIFORM) == [1, 1, 1]
+    assert content_weights(rows, LISTENS) == [1, 10, 1]
+    recency = content_weights([(i, 0) for i in range(101)], RECENCY, half_life=50)
+    # Самая новая запись весит 1, на 50 позиций старше - вдвое меньше
+    assert recency[-1] == 1 and recency[50] == pytest.approx(0.5) and recency[0] == pytest.approx(0.25)
+
+
+def test_weighted_pool_follows_listens():
+    pool = ContentPool([(1, 0), (2, 99)], LISTENS, rng=random.Random(1))
+    picks = Counter(pool.pick() for _ in range(10000))
+    assert 0.98 < picks[2] / 10000 < 1.0
+
+
+def test_unknown_weighting_falls_back_to_uniform():
+    sampler = ContentSampler({'sura': 'popular', 'nasheed': LISTENS})
+    assert sampler.weighting == {'sura': UNIFORM, 'nasheed': LISTENS}
+
+
+def test_no_repeats_within_recent_window():
+    database = FakeDatabase([(i, 0) for i in range(20)])
+    sampler = ContentSampler(recent_window=5, max_attempts=100)
+
+    async def run():
+        return [await sampler.pick(database, 'sura', user_id=1) for _ in range(200)]
+
+    picks = asyncio.run(run())
+    for index in range(len(picks) - 5):
+        assert len(set(picks[index:index + 6])) == 6
+    assert database.loads == 1
+
+
+def test_window_limited_to_half_of_small_pool():
+    database = FakeDatabase([(1, 0), (2, 0)])
+    sampler = ContentSampler(recent_window=10, max_attempts=100)
+
+    async def run():
+        return [await sampler.pick(database, 'sura', user_id=1) for _ in range(20)]
+
+    picks = asyncio.run(run())
+    # Окно в один элемент: подряд одна и та же сура не выпадает
+    assert all(first != second for first, second in zip(picks, picks[1:]))
+
+
+def test_empty_pool_and_content_change():
+    database = FakeDatabase([])
+    sampler = ContentSampler()
+
+    async def run():
+        empty = await sampler.pick(database, 'sura')
+        database.suras = [(7, 0)]
+        sampler.on_content_change('sura_added', {})
+        return empty, await sampler.pick(database, 'sura')
+
+    assert asyncio.run(run()) == (None, 7)
+    assert database.loads == 2
@@ -0,0 +1,64 @@
+import pytest
+
+from config import SURA_NAMES
+from search_index import SuraSearchIndex, name_variants, normalize_words, query_variants
+
+
+@pytest.fixture(scope='module')
+def index():
+    return SuraSearchIndex(SURA_NAMES)
+
+
+def test_normalize_words():
+    assert normalize_words('Аль-Фатиха!') == ['аль', 'фатиха']
+    # Огласовки и формы алифа убираются
+    assert normalize_words('الْفَاتِحَة') == normalize_words('الفاتحه')
+    assert normalize_words('Ёё') == ['ее']
+
+
+def test_name_variants_drop_articles():
+    variants = name_variants('Аль-Фатиха')
+    assert {'альфатиха', 'фатиха', 'fatiha', 'alfatiha'} <= variants
+    assert 'فاتحه' in name_variants('الفاتحة')
+
+
+def test_query_variants_fold_latin_spellings():
+    assert 'ihlas' in query_variants('Ikhlas') & query_variants('ixlas')
+    assert 'ihlas' in query_variants('ихлас')
+    assert query_variants('  --  ') == set()
+
+
+@pytest.mark.parametrize('query', ['фатиха', 'Al-Fatiha', 'fotiha', 'الفاتحة', 'Фатих'])
+def test_search_in_every_language(index, query):
+    assert index.search(query)[0] == 1
+
+
+def test_search_by_number(index):
+    assert index.search('36') == (36,)
+    assert index.search('115') == ()
+
+
+def test_prefix_matches_ranked_first(index):
+    results = index.search('ара')
+    # Совпадения с начала названия (Ар-Рахман) раньше совпадений в середине (Аль-Бакара)
+    assert results.index(55) < results.index(2)
+
+
+def test_short_queries_use_prefixes(index):
+    results = index.search('фа')
+    assert 1 in results and len(results) <= 20
+    assert index.search('ё') == ()
+
+
+def test_file_map_follows_content_events(index):
+    index.load([(1, 10, 'Чтец', 'file-1-10'), (2, 10, 'Чтец', 'file-2-10')])
+    assert index.get_files(1) == [(10, 'Чтец', 'file-1-10')]
+    index.on_content_change('qari_added', {'qari_id': 11, 'names': {'ru': 'Другой'}})
+    index.on_content_change('sura_added', {'qari_id': 11, 'order_number': 1, 'file_id': 'file-1-11'})
+    assert [qari_id for qari_id, _, _ in index.get_files(1)] == [10, 11]
+    index.on_content_change('qari_deleted', {'qari_id': 10})
+    assert index.get_files(1) == [(11, 'Другой', 'file-1-11')]
+    assert index.get_files(2) == []
+    assert not index.is_stale()
+    index.on_content_change('content_changed', {'version': 2})
+    assert index.is_stale()
@@ -0,0 +1,89 @@
+from datetime import date, datetime
+
+import pytest
+
+from database import Database
+from sura_import import sura_names_for
+
+NAMES = {'ar': 'a', 'uz': 'u', 'ru': 'r', 'en': 'e'}
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    yield db
+    db.close()
+
+
+def rollup(db):
+    conn = db.get_connection()
+    try:
+        return {
+            (period, bucket, metric, dimension): value
+            for period, bucket, metric, dimension, value in conn.execute(
+                "SELECT period, bucket, metric, dimension, value FROM stats_rollup WHERE value <> 0"
+            )
+        }
+    finally:
+        conn.close()
+
+
+def fill(db):
+    for user_id in range(1, 11):
+        db.save_user(user_id, f'user{user_id}', f'User {user_id}')
+    for user_id in range(1, 8):
+        db.set_user_language(user_id, ('ru', 'uz', 'en')[user_id % 3])
+    db.set_user_language(1, 'ar')
+
+    # Активность по дням через границы недели и месяца, в хронологическом порядке
+    days = ['2024-01-29', '2024-01-30', '2024-01-31', '2024-02-01', '2024-02-05', '2024-02-06']
+    for index, day in enumerate(days):
+        db.write_activity_counts({(user_id, day): 1 for user_id in range(1, 11) if (user_id + index) % 3})
+
+    qari_id = db.add_qari('photo', NAMES)
+    db.add_suras(qari_id, [(number, f'file{number}', sura_names_for(number)) for number in range(1, 6)])
+    nasheed_id = db.add_nasheed('nasheed', NAMES, 'performer')
+    sura_ids = [row[0] for row in db.get_suras_page(qari_id, limit=5)]
+    played_at = int(datetime(2024, 2, 6, 12).timestamp())
+    db.write_play_events(
+        [('sura', sura_ids[i % 5], i, 'list', played_at - i * 86400) for i in range(20)]
+        + [('nasheed', nasheed_id, i, 'list', played_at - i * 3600) for i in range(5)],
+        {}
+    )
+    for user_id in range(1, 4):
+        db.add_favorite_sura(user_id, sura_ids[user_id])
+        db.add_favorite_nasheed(user_id, nasheed_id)
+
+
+def test_triggers_match_backfill(db):
+    fill(db)
+    maintained = rollup(db)
+    db.rebuild_stats_rollup()
+    assert rollup(db) == maintained
+
+
+def test_summary_counts(db):
+    fill(db)
+    summary = db.get_stats_summary(date(2024, 2, 6))
+    assert summary[('total', 'users', '')] == 10
+    assert summary[('total', 'users_by_language', 'ar')] == 1
+    assert summary[('total', 'users_by_language', '')] == 3
+    assert summary[('total', 'favorites', 'sura')] == 3
+    # Неделя с понедельника 5 февраля: активны все, кто был 5-го или 6-го
+    assert summary[('week', 'active_users', '')] == 10
+    assert summary[('day', 'nasheed_plays', '')] == 5
+    today = db.get_stats_summary()
+    assert today[('day', 'new_users', '')] == 10
+
+
+def test_removing_favorites_updates_gauge(db):
+    fill(db)
+    conn = db.get_connection()
+    try:
+        conn.execute("DELETE FROM user_favorite_nasheeds WHERE user_id = 1")
+        conn.commit()
+    finally:
+        conn.close()
+    summary = db.get_stats_summary()
+    assert summary[('total', 'favorites', 'nasheed')] == 2
+    assert summary[('day', 'nasheed_favorites_removed', '')] == 1
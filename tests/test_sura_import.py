@@ -0,0 +1,120 @@
+import asyncio
+import itertools
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+from database import AsyncDatabase, Database
+from rate_limiter import RateLimiter
+from sura_import import ChannelUploader, SuraZipImporter, upload_telegram_audio
+
+CHANNEL_ID = -100
+NAMES = {'ar': 'a', 'uz': 'u', 'ru': 'r', 'en': 'e'}
+
+
+class FakeChannelBot:
+    """send_audio возвращает сообщение с новыми file_id; fail_on - номера вызовов с ошибкой"""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.calls = 0
+        self._ids = itertools.count(1)
+
+    async def send_audio(self, chat_id, audio, **kwargs):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise RuntimeError('upload failed')
+        number = next(self._ids)
+        return SimpleNamespace(audio=SimpleNamespace(
+            file_id=f'file{number}', file_unique_id=f'unique{number}', duration=60, file_size=20000
+        ))
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'bot.db'))
+
+
+@pytest.fixture
+def adb(db):
+    adb = AsyncDatabase(db)
+    yield adb
+    adb.close()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / 'suras.zip'
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        for number in (1, 2, 3):
+            zip_ref.writestr(f'{number:03d}.mp3', bytes([number]) * 20000)
+        zip_ref.writestr('cover.jpg', b'not audio')
+    return str(path)
+
+
+def uploader(bot):
+    return ChannelUploader(bot, CHANNEL_ID, RateLimiter(global_rate=10000, per_chat_rate=10000))
+
+
+def sura_files(db, qari_id):
+    conn = db.get_connection()
+    try:
+        return dict(conn.execute(
+            "SELECT order_number, file_id FROM suras WHERE qari_id = ?", (qari_id,)
+        ).fetchall())
+    finally:
+        conn.close()
+
+
+def test_reimport_reuses_uploaded_files(db, adb, archive):
+    qari_id = db.add_qari('photo', NAMES)
+    other_qari_id = db.add_qari('photo', NAMES)
+    bot = FakeChannelBot()
+
+    first = asyncio.run(SuraZipImporter(adb, uploader(bot)).import_zip(archive, qari_id))
+    assert (first['uploaded'], first['reused'], bot.calls) == (3, 0, 3)
+    assert len(first['missing_numbers']) == 111
+
+    # Тот же архив: файлы узнаются по sha256 и размеру, на канал ничего не уходит
+    second = asyncio.run(SuraZipImporter(adb, uploader(bot)).import_zip(archive, other_qari_id))
+    assert (second['uploaded'], second['reused'], bot.calls) == (3, 3, 3)
+    assert sura_files(db, other_qari_id) == sura_files(db, qari_id)
+    assert set(sura_files(db, qari_id)) == {1, 2, 3}
+
+
+def test_interrupted_import_uploads_only_the_rest(db, adb, archive):
+    qari_id = db.add_qari('photo', NAMES)
+    bot = FakeChannelBot(fail_on={2})
+
+    first = asyncio.run(SuraZipImporter(adb, uploader(bot)).import_zip(archive, qari_id))
+    assert first['uploaded'] == 2 and first['skipped'] == 1
+    assert first['status'] == 'warning'
+
+    retry = asyncio.run(SuraZipImporter(adb, uploader(bot)).import_zip(archive, qari_id))
+    assert (retry['uploaded'], retry['reused']) == (3, 2)
+    assert bot.calls == 4
+    assert set(sura_files(db, qari_id)) == {1, 2, 3}
+
+
+def test_forwarded_audio_reused_by_file_unique_id(adb):
+    bot = FakeChannelBot()
+    audio = SimpleNamespace(file_id='admin-file', file_unique_id='admin-unique', file_size=20000, duration=60)
+
+    async def run():
+        channel = uploader(bot)
+        return (await upload_telegram_audio(adb, channel, audio),
+                await upload_telegram_audio(adb, channel, audio))
+
+    first, second = asyncio.run(run())
+    assert first == ('file1', False)
+    assert second == ('file1', True)
+    assert bot.calls == 1
+
+
+def test_invalid_archive(adb, tmp_path):
+    path = tmp_path / 'broken.zip'
+    path.write_bytes(b'not a zip')
+    report = asyncio.run(SuraZipImporter(adb, uploader(FakeChannelBot())).import_zip(str(path), 1))
+    assert report['status'] == 'error'
+    assert report['integrity_check'] == 'failed'
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+import mistral_integration
+from database import AsyncDatabase, Database
+from mistral_integration import MistralTranslator, TranslationCache
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def adb(db):
+    adb = AsyncDatabase(db)
+    yield adb
+    adb.close()
+
+
+class CountingTranslator(MistralTranslator):
+    """Переводчик без сети: ответ модели - текст запроса в верхнем регистре"""
+
+    def __init__(self, cache, fail=False):
+        super().__init__('key', cache=cache)
+        self.requests = 0
+        self.fail = fail
+
+    async def _complete(self, data, timeout):
+        self.requests += 1
+        if self.fail:
+            raise RuntimeError('Mistral request failed after 4 attempts: HTTP 503')
+        return data['messages'][-1]['content'].upper()
+
+
+def test_keys_depend_on_every_part():
+    key = TranslationCache.make_key('text', 'ru', 'model', 'hello')
+    assert key == TranslationCache.make_key('text', 'ru', 'model', 'hello')
+    assert len({
+        key,
+        TranslationCache.make_key('broadcast', 'ru', 'model', 'hello'),
+        TranslationCache.make_key('text', 'en', 'model', 'hello'),
+        TranslationCache.make_key('text', 'ru', 'other-model', 'hello'),
+        TranslationCache.make_key('text', 'ru', 'model', 'hello!'),
+    }) == 5
+
+
+def test_prompt_version_changes_keys(monkeypatch):
+    key = TranslationCache.make_key('text', 'ru', 'model', 'hello')
+    monkeypatch.setattr(mistral_integration, 'PROMPT_VERSION', mistral_integration.PROMPT_VERSION + 1)
+    assert TranslationCache.make_key('text', 'ru', 'model', 'hello') != key
+
+
+def test_memory_then_database_hits(adb):
+    async def run():
+        translator = CountingTranslator(TranslationCache(adb))
+        first = await translator.translate_broadcast_message('salom', 'ru')
+        again = await translator.translate_broadcast_message('salom', 'ru')
+        # Новый процесс: память пуста, перевод берется из translation_cache
+        restarted = CountingTranslator(TranslationCache(adb))
+        stored = await restarted.translate_broadcast_message('salom', 'ru')
+        return translator, restarted, first, again, stored
+
+    translator, restarted, first, again, stored = asyncio.run(run())
+    assert first == again == stored == 'SALOM'
+    assert translator.requests == 1 and restarted.requests == 0
+    assert translator.cache.get_stats()['memory_hits'] == 1
+    assert restarted.cache.get_stats()['db_hits'] == 1
+
+
+def test_memory_is_bounded(adb):
+    cache = TranslationCache(adb, max_size=2)
+
+    async def run():
+        for index in range(3):
+            await cache.put(str(index), 'text', 'ru', 'model', str(index), f'value {index}')
+        return await cache.get('0')
+
+    # Вытесненная из памяти запись читается из БД
+    assert asyncio.run(run()) == 'value 0'
+    assert cache.get_stats()['memory_size'] == 2
+    assert cache.get_stats()['db_hits'] == 1
+
+
+def test_failed_translation_is_raised_and_not_cached(adb):
+    translator = CountingTranslator(TranslationCache(adb), fail=True)
+    with pytest.raises(RuntimeError):
+        asyncio.run(translator.translate_broadcast_message('salom', 'en'))
+    assert translator.cache.get_stats()['stores'] == 0
+
+
+def test_export_import_round_trip(db, tmp_path, monkeypatch):
+    for index in range(3):
+        db.save_cached_translation(f'key{index}', 'text', 'ru', 'model', 1, f'source {index}', f'"result {index}"')
+    path = tmp_path / 'cache.json'
+    monkeypatch.setattr(mistral_integration, 'db', db)
+    assert mistral_integration.export_translation_cache(path) == 3
+
+    target = Database(str(tmp_path / 'target.db'))
+    try:
+        target.save_cached_translation('key0', 'text', 'ru', 'model', 1, 'source 0', '"local"')
+        monkeypatch.setattr(mistral_integration, 'db', target)
+        # Уже существующие ключи не перезаписываются
+        assert mistral_integration.import_translation_cache(path) == 2
+        assert target.get_cached_translation('key0') == '"local"'
+        assert target.get_cached_translation('key2') == '"result 2"'
+        assert mistral_integration.import_translation_cache(path) == 0
+    finally:
+        target.close()
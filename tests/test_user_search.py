@@ -0,0 +1,68 @@
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    db.save_user(101, 'abdulloh_uz', 'Абдулло')
+    db.save_user(102, 'maryam', 'Марьям')
+    db.save_user(103, None, 'Абдурахман')
+    db.save_user(1010, 'user1010', 'Test')
+    yield db
+    db.close()
+
+
+def found(users):
+    return sorted(user_id for user_id, _, _ in users)
+
+
+def check_index(db):
+    """FTS5 сверяет индекс с таблицей users (rank = 1 - сверка с внешним контентом):
+    ошибка, если триггеры пропустили изменение"""
+    conn = db.get_connection()
+    try:
+        conn.execute("INSERT INTO users_fts (users_fts, rank) VALUES ('integrity-check', 1)")
+    finally:
+        conn.close()
+
+
+def test_substring_search(db):
+    assert found(db.search_users('абду')) == [101, 103]
+    assert found(db.search_users('ryam')) == [102]
+    assert found(db.search_users('_uz')) == [101]
+    assert db.search_users('нет такого') == []
+
+
+def test_id_search_first_then_names(db):
+    users = db.search_users('1010')
+    assert users[0][0] == 1010
+    assert found(users) == [1010]
+    assert found(db.search_users('101')) == [101, 1010]
+
+
+def test_short_and_odd_queries(db):
+    # Короче трех символов - только ID, в триграммном индексе не ищется
+    assert db.search_users('Аб') == []
+    assert db.search_users('"') == []
+    # Число за пределами INTEGER SQLite ищется только как подстрока
+    assert db.search_users('9' * 30) == []
+    assert db.search_users('١٠١') == []
+
+
+def test_triggers_keep_index_in_sync(db):
+    conn = db.get_connection()
+    try:
+        conn.execute("UPDATE users SET first_name = 'Мария' WHERE user_id = 102")
+        conn.execute("DELETE FROM users WHERE user_id = 103")
+        conn.commit()
+    finally:
+        conn.close()
+    db.save_user(104, 'new_user', 'Абдулазиз')
+    # Повторный /start с тем же именем индекс не трогает
+    db.save_user(101, 'abdulloh_uz', 'Абдулло')
+    check_index(db)
+    assert db.search_users('Марьям') == []
+    assert found(db.search_users('Мария')) == [102]
+    assert found(db.search_users('абду')) == [101, 104]
@@ -0,0 +1,65 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from webhook_server import SECRET_HEADER, WebhookServer
+
+SECRET = 'secret-token'
+UPDATE = {
+    'update_id': 1,
+    'message': {'message_id': 1, 'date': 0, 'chat': {'id': 5, 'type': 'private'}, 'text': '/start'},
+}
+
+
+@pytest.fixture
+def server():
+    bots = {name: SimpleNamespace(bot=None, update_queue=asyncio.Queue()) for name in ('user', 'admin')}
+    return WebhookServer(bots, SECRET, max_body_size=1024)
+
+
+def request(server, path, body=b'', secret=SECRET, method='POST', chunk_size=None):
+    """Прогнать один HTTP-запрос через ASGI-приложение: (статус, тело ответа)"""
+    headers = [(b'content-type', b'application/json')]
+    if secret is not None:
+        headers.append((SECRET_HEADER, secret.encode()))
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': headers, 'client': ('127.0.0.1', 1)}
+    chunk_size = chunk_size or max(len(body), 1)
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(server(scope, receive, send))
+    return sent[0]['status'], sent[1]['body']
+
+
+def test_update_goes_to_bot_queue(server):
+    assert request(server, '/telegram/admin', json.dumps(UPDATE).encode(), chunk_size=10) == (200, b'ok')
+    update = server.bots['admin'].update_queue.get_nowait()
+    assert update.update_id == 1 and update.message.text == '/start'
+    assert server.bots['user'].update_queue.empty()
+    assert server.stats == {'accepted': 1, 'rejected': 0}
+
+
+@pytest.mark.parametrize('secret', [None, '', 'secret-tokem', SECRET + 'x'])
+def test_wrong_secret_rejected(server, secret):
+    assert request(server, '/telegram/user', json.dumps(UPDATE).encode(), secret=secret) == (403, b'forbidden')
+    assert server.bots['user'].update_queue.empty()
+    assert server.stats['rejected'] == 1
+
+
+def test_routing_and_bad_requests(server):
+    assert request(server, '/telegram/unknown', json.dumps(UPDATE).encode())[0] == 404
+    assert request(server, '/telegram/user', method='GET')[0] == 405
+    assert request(server, '/telegram/user', b'{not json')[0] == 400
+    assert request(server, '/telegram/user', b'x' * 2048, chunk_size=512)[0] == 413
+    assert request(server, '/healthz', secret=None, method='GET') == (200, b'ok')
+    assert server.bots['user'].update_queue.empty()
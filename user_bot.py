@@ -1,11 +1,16 @@
 # user_bot.py
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, ConversationHandler, InlineQueryHandler
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, ConversationHandler, InlineQueryHandler, ChosenInlineResultHandler
 from telegram.ext import filters
 
-from config import USER_BOT_TOKEN, ADMIN_ID, SURA_NAMES
-from database import db
+from config import USER_BOT_TOKEN, ADMIN_ID, SURA_NAMES, TELEGRAM_API_URL, WEBHOOK_CONCURRENCY
+from database import adb
+from search_index import sura_index
+from sampler import content_sampler
+from daily_content import ROTATION_TIME, daily_content
+from keyboards import main_menu_keyboard, page_buttons, parse_page_callback, qari_list_screen, qari_suras_screen
 from text_resources import get_text
 from mistral_integration import translator
 
@@ -17,28 +22,9 @@ logger = logging.getLogger(__name__)
 
 async def _get_main_keyboard(user_id):
     """Формирует клавиатуру главного меню в зависимости от наличия избранного."""
-    lang = db.get_user_language(user_id) or 'ru'  # Дефолт на русский если None
-    
-    keyboard = [
-        [InlineKeyboardButton(get_text('btn_listen_quran', lang), callback_data="listen_quran"),
-         InlineKeyboardButton(get_text('btn_listen_nasheed', lang), callback_data="listen_nasheed")],
-        [InlineKeyboardButton(get_text('btn_sura_of_day', lang), callback_data="sura_of_day"),
-         InlineKeyboardButton(get_text('btn_nasheed_of_day', lang), callback_data="nasheed_of_day")],
-    ]
-    
-    favorite_buttons = []
+    lang = await adb.get_user_language(user_id) or 'ru'  # Дефолт на русский если None
     # Проверяем, есть ли у пользователя избранные суры или нашиды
-    if db.get_user_favorite_suras(user_id):
-        favorite_buttons.append(InlineKeyboardButton(get_text('btn_favorite_suras', lang), callback_data="favorite_suras"))
-    if db.get_user_favorite_nasheeds(user_id):
-        favorite_buttons.append(InlineKeyboardButton(get_text('btn_favorite_nasheeds', lang), callback_data="favorite_nasheeds"))
-    
-    if favorite_buttons:
-        keyboard.append(favorite_buttons)
-
-    keyboard.append([InlineKeyboardButton(get_text('btn_chat_admin', lang), callback_data="chat_with_admin"),
-                     InlineKeyboardButton(get_text('btn_language', lang), callback_data="change_language")])
-    return InlineKeyboardMarkup(keyboard)
+    return main_menu_keyboard(lang, await adb.has_favorite_suras(user_id), await adb.has_favorite_nasheeds(user_id))
 
 async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Стартовая команда юзер-бота - сначала выбор языка для новых пользователей, потом меню"""
@@ -47,11 +33,11 @@ async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"✅ /start received from user {user.id}")
     
     # Сохраняем/обновляем пользователя
-    db.save_user(user.id, user.username, user.first_name)
-    db.update_user_activity(user.id)
+    await adb.save_user(user.id, user.username, user.first_name)
+    await adb.update_user_activity(user.id)
     
     # Проверяем, выбран ли язык
-    user_lang = db.get_user_language(user.id)
+    user_lang = await adb.get_user_language(user.id)
     logger.info(f"🌍 User {user.id} language: {user_lang}")
     
     # Если язык НЕ выбран (None) - показываем выбор языка
@@ -98,113 +84,60 @@ async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def listen_quran(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Меню выбора чтеца"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
     
-    lang = db.get_user_language(query.from_user.id) or 'ru'
-    qaris = db.get_all_qaris()
+    lang = await adb.get_user_language(query.from_user.id) or 'ru'
+    screen = await qari_list_screen(adb, lang)
     
-    if not qaris:
+    if not screen:
         await query.edit_message_text(
             get_text('no_reciters', lang),
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(get_text('back', lang), callback_data="main_menu")]])
         )
         return
     
-    keyboard = []
-    lang_map = {'ar': 1, 'ru': 2, 'uz': 3, 'en': 4}
-    name_index = lang_map.get(lang, 2) # default to russian
-
-    for qari in qaris:
-        qari_id = qari[0]
-        display_name = qari[name_index]
-        keyboard.append([InlineKeyboardButton(display_name, callback_data=f"qari_{qari_id}")])
-    
-    keyboard.append([InlineKeyboardButton(get_text('back', lang), callback_data="main_menu")])
-    
-    await query.edit_message_text(
-        get_text('choose_reciter', lang),
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    text, keyboard = screen
+    await query.edit_message_text(text, reply_markup=keyboard)
 
 async def show_qari_suras(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать суры чтеца с пагинацией"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
 
     # Определяем qari_id из callback_data или user_data
     if query.data.startswith("qari_page_"):
         qari_id = context.user_data.get('current_qari')
-        page = int(query.data.split("_")[-1])
-        context.user_data['sura_page'] = page
+    elif query.data.startswith("back_to_suras_"):
+        qari_id = context.user_data.get('current_qari')
     else: # qari_...
         qari_id = int(query.data.split("_")[1])
         context.user_data['current_qari'] = qari_id
-        context.user_data['sura_page'] = 0 # Сброс страницы
+    cursor, backward = parse_page_callback(query.data, "qari_page_")
 
     user_id = query.from_user.id
-    page = context.user_data.get('sura_page', 0)
-    items_per_page = 5  # Уменьшено до 5 для удобства
-    
-    suras = db.get_suras_by_qari(qari_id, items_per_page, page * items_per_page)
+    lang = await adb.get_user_language(user_id) or 'ru'
     
-    # Получаем общее количество сур для этого чтеца
-    qari_suras_all = db.get_suras_by_qari(qari_id, 114, 0)
-    total_suras = len(qari_suras_all)
-    if not total_suras: # Проверка, если get_suras_by_qari вернет пустой список
-        total_suras = 0
+    # Готовый экран из кэша; строится заново только после изменения контента
+    screen = await qari_suras_screen(adb, qari_id, lang, cursor, backward)
     
-    if not suras:
-        lang = db.get_user_language(user_id) or 'ru'
+    if not screen:
         await query.edit_message_text(
             get_text('no_suras', lang),
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(get_text('back', lang), callback_data="listen_quran")]])
         )
         return
     
-    # Получаем имя чтеца и язык
-    qari = db.get_qari_by_id(qari_id)
-    lang = db.get_user_language(user_id) or 'ru'
-    lang_map = {'ar': 2, 'uz': 3, 'ru': 4, 'en': 5}
-    name_index = lang_map.get(lang, 4) # default to ru
-    qari_name = qari[name_index] if qari else f"Чтец {qari_id}"
-    
-    keyboard = []
-    # Используем SURA_NAMES для локализации
-    for sura_data in suras:
-        order = sura_data[0]
-        # Берем название из SURA_NAMES на языке пользователя
-        sura_name = SURA_NAMES.get(order, {}).get(lang, f"Sura {order}")
-        display_name = f"{order}. {sura_name}"
-        keyboard.append([InlineKeyboardButton(display_name, callback_data=f"play_sura_{order}")])
-    
-    # Кнопки навигации
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(get_text('previous', lang), callback_data=f"qari_page_{page-1}"))
-    
-    if (page + 1) * items_per_page < total_suras:
-        nav_buttons.append(InlineKeyboardButton(get_text('next', lang), callback_data=f"qari_page_{page+1}"))
-    
-    if nav_buttons:
-        keyboard.append(nav_buttons)
-    
-    keyboard.append([InlineKeyboardButton(get_text('btn_search_sura', lang), switch_inline_query_current_chat="")])
-    keyboard.append([InlineKeyboardButton(get_text('back', lang), callback_data="listen_quran")])
-    keyboard.append([InlineKeyboardButton(get_text('home', lang), callback_data="main_menu")])
-    
     # Сохраняем message_id для возможности возврата
     if query.message:
         context.user_data['suras_list_message_id'] = query.message.message_id
     
-    await query.edit_message_text(
-        f"🎙 {qari_name}\n📖 Суры {page*items_per_page+1}-{page*items_per_page+len(suras)}:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    text, keyboard = screen
+    await query.edit_message_text(text, reply_markup=keyboard)
 
 async def play_sura(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Воспроизведение суры с добавлением в избранное"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
     
     parts = query.data.split("_")
     sura_number = int(parts[2])
@@ -220,16 +153,16 @@ async def play_sura(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("❌ Ошибка: чтец не выбран")
         return
     
-    file_id = db.get_sura_file_id(qari_id, sura_number)
-    sura_id = db.get_sura_by_qari_and_order(qari_id, sura_number)
+    file_id = await adb.get_sura_file_id(qari_id, sura_number)
+    sura_id = await adb.get_sura_by_qari_and_order(qari_id, sura_number)
     
     # Получаем название суры на языке пользователя
-    lang = db.get_user_language(user_id) or 'ru'
+    lang = await adb.get_user_language(user_id) or 'ru'
     sura_name = SURA_NAMES.get(sura_number, {}).get(lang, f"Sura {sura_number}")
     
     if file_id:
         try:
-            is_favorite = db.is_sura_favorite(user_id, sura_id) if sura_id else False
+            is_favorite = await adb.is_sura_favorite(user_id, sura_id) if sura_id else False
             keyboard = []
             if sura_id:
                 if not is_favorite:
@@ -250,6 +183,8 @@ async def play_sura(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 caption=f"📖 {sura_number}. {sura_name}",
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
+            if sura_id:
+                await adb.record_play('sura', sura_id, user_id, 'favorite' if len(parts) > 3 else 'list')
             # Удаляем старое сообщение со списком сур
             try:
                 await query.message.delete()
@@ -277,9 +212,9 @@ async def play_sura(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def sura_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сура дня или случайная сура"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
     
-    daily_sura = db.get_daily_sura()
+    daily_sura = await daily_content.get('sura')
     if not daily_sura:
         # Предлагаем случайную суру
         keyboard = [
@@ -293,7 +228,7 @@ async def sura_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         # Логика отправки суры дня
         sura_id, qari_id, order_number, file_id, name_ar, name_uz, name_ru, name_en, _, _, qari_name = daily_sura
-        lang = db.get_user_language(query.from_user.id) or 'ru'
+        lang = await adb.get_user_language(query.from_user.id) or 'ru'
         lang_map = {'ar': name_ar, 'uz': name_uz, 'ru': name_ru, 'en': name_en}
         sura_name = lang_map.get(lang, name_ru)
         
@@ -302,6 +237,7 @@ async def sura_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
             audio=file_id, 
             caption=f"🌙 Сура дня: {sura_name} - {qari_name}"
         )
+        await adb.record_play('sura', sura_id, query.from_user.id, 'daily')
         await query.message.delete()
         
         # Автоматически возвращаемся в меню через 3 секунды
@@ -318,9 +254,9 @@ async def sura_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def nasheed_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Нашид дня или случайный нашид"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
     
-    daily_nasheed = db.get_daily_nasheed()
+    daily_nasheed = await daily_content.get('nasheed')
     if not daily_nasheed:
         # Предлагаем случайный нашид
         keyboard = [
@@ -333,7 +269,7 @@ async def nasheed_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     else:
         nasheed_id, file_id, title_ar, title_uz, title_ru, title_en, performer, _, _, _ = daily_nasheed
-        lang = db.get_user_language(query.from_user.id) or 'ru'
+        lang = await adb.get_user_language(query.from_user.id) or 'ru'
         lang_map = {'ar': title_ar, 'uz': title_uz, 'ru': title_ru, 'en': title_en}
         nasheed_title = lang_map.get(lang, title_ru)
         
@@ -342,6 +278,7 @@ async def nasheed_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
             audio=file_id, 
             caption=f"⭐ Нашид дня: {nasheed_title} - {performer}"
         )
+        await adb.record_play('nasheed', nasheed_id, query.from_user.id, 'daily')
         await query.message.delete()
         
         # Автоматически возвращаемся в меню через 3 секунды
@@ -359,10 +296,10 @@ async def nasheed_of_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def chat_with_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Чат с администратором"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
     
     user_id = query.from_user.id
-    lang = db.get_user_language(user_id) or 'ru'
+    lang = await adb.get_user_language(user_id) or 'ru'
     
     # Удаляем старое меню
     try:
@@ -385,7 +322,7 @@ async def chat_with_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_info = f"👤 Пользователь {user.first_name} (@{user.username or 'нет username'}, ID: {user_id}) хочет связаться с вами."
     
     # Создаем чат в БД
-    db.get_chat_id(ADMIN_ID, user_id, create_if_not_exists=True)
+    await adb.get_chat_id(ADMIN_ID, user_id, create_if_not_exists=True)
 
     await context.bot.send_message(
         chat_id=ADMIN_ID,
@@ -398,12 +335,14 @@ async def chat_with_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def favorite_suras(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Избранные суры пользователя"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
     
     user_id = query.from_user.id
-    favorites = db.get_user_favorite_suras(user_id)
+    lang = await adb.get_user_language(user_id) or 'ru'
+    cursor, backward = parse_page_callback(query.data, "fav_suras_page_")
+    favorites = await adb.get_favorite_suras_page(user_id, lang, cursor, backward)
     
-    if not favorites:
+    if not favorites.rows:
         await query.edit_message_text(
             "❌ У вас пока нет избранных сур",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")]])
@@ -415,6 +354,9 @@ async def favorite_suras(update: Update, context: ContextTypes.DEFAULT_TYPE):
         display_name = f"{order}. {name} ({qari_name or '...'})"
         keyboard.append([InlineKeyboardButton(display_name, callback_data=f"play_sura_{order}_{qari_id}"), InlineKeyboardButton("❌", callback_data=f"remove_fav_sura_{sura_id}")])
     
+    nav_buttons = page_buttons(favorites, "fav_suras_page_")
+    if nav_buttons:
+        keyboard.append(nav_buttons)
     keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")])
     
     await query.edit_message_text(
@@ -425,15 +367,12 @@ async def favorite_suras(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def listen_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать список нашидов с пагинацией"""
     query = update.callback_query
-    db.update_user_activity(query.from_user.id)
+    await adb.update_user_activity(query.from_user.id)
 
-    page = context.user_data.get('nasheed_page', 0)
-    items_per_page = 10
+    cursor, backward = parse_page_callback(query.data, "nasheed_page_")
+    nasheeds = await adb.get_nasheeds_page(cursor, backward)
 
-    nasheeds = db.get_nasheeds(items_per_page, page * items_per_page)
-    total_nasheeds = db.get_total_nasheeds_count()
-
-    if not nasheeds:
+    if not nasheeds.rows:
         await query.edit_message_text(
             "🎵 Нашидов пока нет.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")]])
@@ -445,19 +384,14 @@ async def listen_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE):
         display_name = f"{title} - {performer or '... '}"
         keyboard.append([InlineKeyboardButton(display_name, callback_data=f"play_nasheed_{nasheed_id}")])
 
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("◀️", callback_data=f"nasheed_page_{page-1}"))
-    if (page + 1) * items_per_page < total_nasheeds:
-        nav_buttons.append(InlineKeyboardButton("▶️", callback_data=f"nasheed_page_{page+1}"))
-
+    nav_buttons = page_buttons(nasheeds, "nasheed_page_")
     if nav_buttons:
         keyboard.append(nav_buttons)
 
     keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
     
     await query.edit_message_text(
-        f"🎵 Нашиды (Стр. {page+1})",
+        f"🎵 Нашиды ({nasheeds.total})",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
@@ -467,7 +401,7 @@ async def play_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     nasheed_id = int(query.data.split("_")[-1])
 
-    nasheed = db.get_nasheed_by_id(nasheed_id)
+    nasheed = await adb.get_nasheed_by_id(nasheed_id)
     if not nasheed:
         await query.message.reply_text("❌ Нашид не найден.")
         return
@@ -475,7 +409,7 @@ async def play_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE):
     file_id = nasheed[1]
     title = nasheed[4] # title_ru
 
-    is_favorite = db.is_nasheed_favorite(user_id, nasheed_id)
+    is_favorite = await adb.is_nasheed_favorite(user_id, nasheed_id)
     keyboard = []
     if not is_favorite:
         keyboard.append([InlineKeyboardButton("💝 Добавить в избранное", callback_data=f"add_fav_nasheed_{nasheed_id}")])
@@ -490,6 +424,7 @@ async def play_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE):
         audio=file_id, 
         caption=f"🎵 {title}",
         reply_markup=InlineKeyboardMarkup(keyboard))
+    await adb.record_play('nasheed', nasheed_id, user_id, 'list')
     # Удаляем старое сообщение со списком
     await query.message.delete()
     
@@ -509,9 +444,10 @@ async def favorite_nasheeds(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Избранные нашиды пользователя"""
     query = update.callback_query
     user_id = query.from_user.id
-    favorites = db.get_user_favorite_nasheeds(user_id)
+    cursor, backward = parse_page_callback(query.data, "fav_nasheeds_page_")
+    favorites = await adb.get_favorite_nasheeds_page(user_id, cursor, backward)
 
-    if not favorites:
+    if not favorites.rows:
         await query.edit_message_text(
             "❌ У вас пока нет избранных нашидов.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")]])
@@ -526,6 +462,9 @@ async def favorite_nasheeds(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("❌", callback_data=f"remove_fav_nasheed_{nasheed_id}")
         ])
 
+    nav_buttons = page_buttons(favorites, "fav_nasheeds_page_")
+    if nav_buttons:
+        keyboard.append(nav_buttons)
     keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")])
     await query.edit_message_text(
         "💝 Ваши избранные нашиды:",
@@ -536,7 +475,7 @@ async def exit_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Выход из режима чата с админом"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = db.get_user_language(user_id) or 'ru'
+    lang = await adb.get_user_language(user_id) or 'ru'
     
     context.user_data['in_chat'] = False
     context.user_data.pop('chat_message_id', None)
@@ -571,11 +510,7 @@ async def handle_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         await chat_with_admin(update, context)
     elif data == "listen_quran":
         await listen_quran(update, context)
-    elif data == "listen_nasheed":
-        context.user_data['nasheed_page'] = 0
-        await listen_nasheed(update, context)
-    elif data.startswith("nasheed_page_"):
-        context.user_data['nasheed_page'] = int(data.split("_")[-1])
+    elif data == "listen_nasheed" or data.startswith("nasheed_page_"):
         await listen_nasheed(update, context)
     elif data.startswith("qari_"):
         await show_qari_suras(update, context)
@@ -591,9 +526,9 @@ async def handle_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         await sura_of_day(update, context)
     elif data == "nasheed_of_day":
         await nasheed_of_day(update, context)
-    elif data == "favorite_suras":
+    elif data == "favorite_suras" or data.startswith("fav_suras_page_"):
         await favorite_suras(update, context)
-    elif data == "favorite_nasheeds":
+    elif data == "favorite_nasheeds" or data.startswith("fav_nasheeds_page_"):
         await favorite_nasheeds(update, context)
     elif data == "exit_chat":
         await exit_chat(update, context)
@@ -602,7 +537,7 @@ async def handle_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     elif data.startswith("add_fav_sura_"):
         sura_id = data.split("_")[3]
         user_id = query.from_user.id
-        db.add_favorite_sura(user_id, sura_id)
+        await adb.add_favorite_sura(user_id, sura_id)
         await query.answer("✅ Добавлено в избранное!")
         # Обновляем клавиатуру
         qari_id = context.user_data.get('current_qari')
@@ -615,7 +550,7 @@ async def handle_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     elif data.startswith("remove_fav_sura_"):
         sura_id = data.split("_")[3]
         user_id_from_query = query.from_user.id
-        db.remove_favorite_sura(user_id_from_query, sura_id)
+        await adb.remove_favorite_sura(user_id_from_query, sura_id)
         await query.answer("✅ Удалено из избранного!")
         # Обновляем клавиатуру или список избранного
         if query.message and "Ваши избранные суры" in query.message.text: # Если мы в избранном
@@ -630,7 +565,7 @@ async def handle_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 
     elif data.startswith("add_fav_nasheed_"):
         nasheed_id = int(data.split("_")[-1])
-        db.add_favorite_nasheed(query.from_user.id, nasheed_id)
+        await adb.add_favorite_nasheed(query.from_user.id, nasheed_id)
         await query.answer("✅ Добавлено в избранное!")
         new_keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("💔 Удалить из избранного", callback_data=f"remove_fav_nasheed_{nasheed_id}")],
@@ -640,7 +575,7 @@ async def handle_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 
     elif data.startswith("remove_fav_nasheed_"):
         nasheed_id = int(data.split("_")[-1])
-        db.remove_favorite_nasheed(query.from_user.id, nasheed_id)
+        await adb.remove_favorite_nasheed(query.from_user.id, nasheed_id)
         await query.answer("✅ Удалено из избранного!")
         if query.message and "Ваши избранные нашиды" in query.message.text:
             await favorite_nasheeds(update, context)
@@ -660,12 +595,25 @@ async def handle_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     elif data == "random_nasheed":
         await play_random_nasheed(update, context)
 
+async def _pick_random(sampler, kind, user_id, fetch):
+    """Случайная запись без повторов из последних выданных пользователю"""
+    for _ in range(2):
+        content_id = await sampler.pick(adb, kind, user_id)
+        if content_id is None:
+            return None
+        row = await fetch(content_id)
+        if row:
+            return row
+        # Удалена другим процессом до того, как пришло событие - перечитываем пул
+        sampler.forget(kind)
+    return None
+
 async def play_random_sura(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Воспроизведение случайной суры"""
     query = update.callback_query
     user_id = query.from_user.id
     
-    random_sura = db.get_random_sura()
+    random_sura = await _pick_random(content_sampler, 'sura', user_id, adb.get_sura_with_qari)
     if not random_sura:
         await query.edit_message_text(
             "❌ Суры не найдены в базе данных",
@@ -674,12 +622,12 @@ async def play_random_sura(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     sura_id, qari_id, order_number, file_id, name_ar, name_uz, name_ru, name_en, _, _, qari_name = random_sura
-    lang = db.get_user_language(user_id) or 'ru'
+    lang = await adb.get_user_language(user_id) or 'ru'
     lang_map = {'ar': name_ar, 'uz': name_uz, 'ru': name_ru, 'en': name_en}
     sura_name = lang_map.get(lang, name_ru)
     
     # Кнопки для избранного
-    is_favorite = db.is_sura_favorite(user_id, sura_id)
+    is_favorite = await adb.is_sura_favorite(user_id, sura_id)
     keyboard = []
     if not is_favorite:
         keyboard.append([InlineKeyboardButton("❤️ Добавить в избранное", callback_data=f"add_fav_sura_{sura_id}")])
@@ -695,6 +643,7 @@ async def play_random_sura(update: Update, context: ContextTypes.DEFAULT_TYPE):
         caption=f"🎲 Случайная сура: {sura_name} - {qari_name}",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
+    await adb.record_play('sura', sura_id, user_id, 'random')
     await query.message.delete()
     
     # Автоматически возвращаемся в меню через 3 секунды
@@ -714,7 +663,7 @@ async def play_random_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     user_id = query.from_user.id
     
-    random_nasheed = db.get_random_nasheed()
+    random_nasheed = await _pick_random(content_sampler, 'nasheed', user_id, adb.get_nasheed_by_id)
     if not random_nasheed:
         await query.edit_message_text(
             "❌ Нашиды не найдены в базе данных",
@@ -723,12 +672,12 @@ async def play_random_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     nasheed_id, file_id, title_ar, title_uz, title_ru, title_en, performer, _, _, _ = random_nasheed
-    lang = db.get_user_language(user_id) or 'ru'
+    lang = await adb.get_user_language(user_id) or 'ru'
     lang_map = {'ar': title_ar, 'uz': title_uz, 'ru': title_ru, 'en': title_en}
     nasheed_title = lang_map.get(lang, title_ru)
     
     # Кнопки для избранного
-    is_favorite = db.is_nasheed_favorite(user_id, nasheed_id)
+    is_favorite = await adb.is_nasheed_favorite(user_id, nasheed_id)
     keyboard = []
     if not is_favorite:
         keyboard.append([InlineKeyboardButton("💝 Добавить в избранное", callback_data=f"add_fav_nasheed_{nasheed_id}")])
@@ -744,6 +693,7 @@ async def play_random_nasheed(update: Update, context: ContextTypes.DEFAULT_TYPE
         caption=f"🎲 Случайный нашид: {nasheed_title} - {performer}",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
+    await adb.record_play('nasheed', nasheed_id, user_id, 'random')
     await query.message.delete()
     
     # Автоматически возвращаемся в меню через 3 секунды
@@ -762,11 +712,11 @@ async def user_start_from_callback(update: Update, context: ContextTypes.DEFAULT
     """Старт из callback (без сообщения)"""
     query = update.callback_query
     user = query.from_user
-    db.save_user(user.id, user.username, user.first_name)
-    db.update_user_activity(user.id)
+    await adb.save_user(user.id, user.username, user.first_name)
+    await adb.update_user_activity(user.id)
     keyboard = await _get_main_keyboard(user.id)
     
-    lang = db.get_user_language(user.id) or 'ru'
+    lang = await adb.get_user_language(user.id) or 'ru'
     main_menu_text = get_text('main_menu', lang)
     
     await query.edit_message_text(
@@ -800,7 +750,7 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     logger.info(f"🌍 User {user_id} selected language: {language}")
     
-    db.set_user_language(user_id, language)
+    await adb.set_user_language(user_id, language)
     
     # Показываем главное меню на выбранном языке
     keyboard = await _get_main_keyboard(user_id)
@@ -813,14 +763,14 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка сообщений пользователя - поддержка текста, фото, видео, аудио"""
-    db.update_user_activity(update.effective_user.id)
+    await adb.update_user_activity(update.effective_user.id)
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id) or 'ru'
+    lang = await adb.get_user_language(user_id) or 'ru'
 
     # Проверяем, находится ли пользователь в режиме чата с админом
     if context.user_data.get('in_chat'):
         user = update.effective_user
-        chat_id = db.get_chat_id(ADMIN_ID, user_id, create_if_not_exists=True)
+        chat_id = await adb.get_chat_id(ADMIN_ID, user_id, create_if_not_exists=True)
         
         # Определяем тип сообщения
         message_text = ""
@@ -839,7 +789,7 @@ async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # Сохраняем сообщение в БД
         if chat_id and message_text:
-            db.save_message(chat_id, user_id, message_text, is_from_admin=False)
+            await adb.save_message(chat_id, user_id, message_text, is_from_admin=False)
             logger.info(f"💬 Message from user {user_id} saved to DB: {message_text}")
         
         # НЕ ОТПРАВЛЯЕМ подтверждения - просто сохраняем
@@ -861,11 +811,15 @@ async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
 async def inline_sura_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """AI-поиск сур с автодополнением - показывает сразу варианты"""
+    """Поиск сур с автодополнением по предрассчитанному индексу - без запросов к БД"""
     from telegram import InlineQueryResultAudio
     
     query_text = update.inline_query.query.strip()
     
+    # Карта доступных аудио перечитывается одним запросом раз в refresh_interval
+    if sura_index.is_stale():
+        sura_index.load(await adb.get_sura_availability())
+    
     results = []
     
     # Если пустой запрос - показываем популярные суры
@@ -873,22 +827,15 @@ async def inline_sura_search(update: Update, context: ContextTypes.DEFAULT_TYPE)
         popular = [1, 36, 55, 67, 112]  # Фатиха, Йа-Син, Рахман, Мульк, Ихлас
         for sura_num in popular:
             names = SURA_NAMES.get(sura_num, {})
-            qaris = db.get_all_qaris()
-            
-            for qari in qaris[:3]:  # Топ 3 чтеца
-                qari_id = qari[0]
-                qari_name_ru = qari[2]
-                file_id = db.get_sura_file_id(qari_id, sura_num)
-                
-                if file_id:
-                    results.append(
-                        InlineQueryResultAudio(
-                            id=f"pop_{qari_id}_{sura_num}",
-                            audio_file_id=file_id,
-                            title=f"⭐ {sura_num}. {names.get('ru', '')}",
-                            performer=qari_name_ru
-                        )
+            for qari_id, qari_name_ru, file_id in sura_index.get_files(sura_num, limit=3):  # Топ 3 чтеца
+                results.append(
+                    InlineQueryResultAudio(
+                        id=f"pop_{qari_id}_{sura_num}",
+                        audio_file_id=file_id,
+                        title=f"⭐ {sura_num}. {names.get('ru', '')}",
+                        performer=qari_name_ru
                     )
+                )
         
         await update.inline_query.answer(results[:10], cache_time=30)
         return
@@ -896,59 +843,101 @@ async def inline_sura_search(update: Update, context: ContextTypes.DEFAULT_TYPE)
     logger.info(f"🔍 Inline search: '{query_text}'")
     
     # Поиск с автодополнением на ВСЕХ языках
-    for sura_num, names in SURA_NAMES.items():
-        found = False
-        
-        # Поиск по всем языкам + номеру
-        for lang_code, name in names.items():
-            if query_text.lower() in name.lower() or str(sura_num) == query_text:
-                found = True
-                break
+    for sura_num in sura_index.search(query_text):
+        names = SURA_NAMES[sura_num]
+        # Автодополнение в заголовке
+        title = f"{sura_num}. {names['ru']} ({names['ar']})"
+        for qari_id, qari_name_ru, file_id in sura_index.get_files(sura_num):
+            results.append(
+                InlineQueryResultAudio(
+                    id=f"s_{qari_id}_{sura_num}",
+                    audio_file_id=file_id,
+                    title=title,
+                    performer=f"🎙 {qari_name_ru}",
+                    caption=f"📖 {names['ru']}\n🇸🇦 {names['ar']}\n🎙 {qari_name_ru}"
+                )
+            )
         
-        if found:
-            # Получаем всех чтецов с этой сурой
-            qaris = db.get_all_qaris()
-            
-            for qari in qaris:
-                qari_id = qari[0]
-                qari_name_ru = qari[2]
-                
-                file_id = db.get_sura_file_id(qari_id, sura_num)
-                
-                if file_id:
-                    # Автодополнение в заголовке
-                    title = f"{sura_num}. {names['ru']} ({names['ar']})"
-                    
-                    results.append(
-                        InlineQueryResultAudio(
-                            id=f"s_{qari_id}_{sura_num}",
-                            audio_file_id=file_id,
-                            title=title,
-                            performer=f"🎙 {qari_name_ru}",
-                            caption=f"📖 {names['ru']}\n🇸🇦 {names['ar']}\n🎙 {qari_name_ru}"
-                        )
-                    )
-            
-            if len(results) >= 20:
-                break
+        if len(results) >= 20:
+            break
     
     await update.inline_query.answer(results, cache_time=10, is_personal=True)
 
+async def inline_result_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Учитываем суру, отправленную из inline-поиска (нужен /setinlinefeedback в BotFather)"""
+    result = update.chosen_inline_result
+    try:
+        _, qari_id, sura_number = result.result_id.split("_")
+        sura_id = await adb.get_sura_by_qari_and_order(int(qari_id), int(sura_number))
+    except ValueError:
+        return
+    if sura_id:
+        await adb.record_play('sura', sura_id, result.from_user.id, 'inline')
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка ошибок"""
     logger.error(f"Exception while handling an update: {context.error}")
 
+# Как часто проверять версию контента, которую поднимает админ-бот
+CONTENT_POLL_INTERVAL = 2
+
+async def watch_content_version():
+    """Сбрасывает кэши юзер-бота, когда админ-бот меняет чтецов, суры или нашиды"""
+    while True:
+        try:
+            await adb.poll_content_version()
+        except Exception as e:
+            logger.error(f"Content version poll failed: {e}")
+        await asyncio.sleep(CONTENT_POLL_INTERVAL)
+
+async def refresh_daily_content(context: ContextTypes.DEFAULT_TYPE):
+    """Планируем контент дня вперед и загружаем сегодняшний в память"""
+    try:
+        await daily_content.fill_schedule()
+    except Exception as e:
+        logger.error(f"Daily content scheduling failed: {e}")
+    await daily_content.warm()
+
+async def on_startup(application: Application):
+    """Запускаем опрос версии контента и ротацию контента дня"""
+    application.bot_data['content_watcher'] = asyncio.create_task(watch_content_version())
+    if application.job_queue is None:
+        # Без JobQueue контент дня берется из БД при первом запросе за день
+        logger.warning("JobQueue is not available (install python-telegram-bot[job-queue]): daily content is not scheduled")
+        return
+    application.job_queue.run_daily(refresh_daily_content, ROTATION_TIME, name="daily_content")
+    application.job_queue.run_once(refresh_daily_content, 1, name="daily_content_startup")
+
+async def on_stop(application: Application):
+    application.bot_data['content_watcher'].cancel()
+
+async def on_shutdown(application: Application):
+    """Закрываем пул соединений с БД при остановке бота"""
+    await adb.aclose()
+
 async def force_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Принудительное обновление - для тестирования"""
     logger.info(f"🔄 Force refresh from user {update.effective_user.id}")
     await update.message.reply_text("🔄 Обновление бота...\nОтправьте /start")
 
-def main():
-    logger.info("=" * 60)
-    logger.info("🚀 STARTING USER BOT")
-    logger.info("=" * 60)
-    
-    application = Application.builder().token(USER_BOT_TOKEN).build()
+def build_application(webhook=False):
+    """Юзер-бот со всеми обработчиками.
+
+    webhook=True - без Updater: апдейты приносит webhook_server и они
+    обрабатываются параллельно, до WEBHOOK_CONCURRENCY одновременно.
+    """
+    builder = (
+        Application.builder()
+        .token(USER_BOT_TOKEN)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    if webhook:
+        builder = builder.updater(None).concurrent_updates(WEBHOOK_CONCURRENCY)
+    application = builder.build()
     
     # Обработчики
     logger.info("📝 Registering handlers...")
@@ -959,6 +948,8 @@ def main():
     # InlineQueryHandler для поиска сур
     application.add_handler(InlineQueryHandler(inline_sura_search))
     logger.info("  ✅ InlineQueryHandler: inline_sura_search")
+    application.add_handler(ChosenInlineResultHandler(inline_result_chosen))
+    logger.info("  ✅ ChosenInlineResultHandler: inline_result_chosen")
     
     # CallbackQueryHandler должен быть первым, чтобы обрабатывать все нажатия кнопок
     application.add_handler(CallbackQueryHandler(handle_user_callback))
@@ -973,6 +964,14 @@ def main():
     
     application.add_error_handler(error_handler)
     logger.info("  ✅ ErrorHandler: error_handler")
+    return application
+
+def main():
+    logger.info("=" * 60)
+    logger.info("🚀 STARTING USER BOT")
+    logger.info("=" * 60)
+    
+    application = build_application()
     
     logger.info("=" * 60)
     logger.info("✅ User bot started successfully!")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка webhook_server на изолированном окружении
+
+Скрипт сам поднимает webhook_server с обоими ботами на локальном порту, но
+с временной БД (DATABASE_PATH во временной папке), фиктивными токенами и
+заглушкой Bot API на соседнем порту (TELEGRAM_API_URL): ни bot.db, ни
+настоящий Telegram не затрагиваются. Затем шлет POST-запросы в формате
+Telegram: каждый пятый апдейт - /start, остальные - нажатия кнопок меню, от
+случайных пользователей. Заодно проверяет, что запросы без секрета и на
+неизвестный путь отклоняются. Задержка считается до ответа сервера, то есть
+до постановки апдейта в очередь бота; после остановки печатается, какие
+методы Bot API вызвали обработчики.
+
+Запуск:
+    python webhook_loadtest.py [--updates 1000] [--concurrency 50] [--bot user] [--port 8765]
+(заглушка Bot API слушает port + 1)
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import secrets
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+CALLBACKS = ["listen_quran", "listen_nasheed", "sura_of_day", "random_sura", "main_menu"]
+
+FAKE_TOKENS = {"USER_BOT_TOKEN": "1000001:loadtest", "ADMIN_BOT_TOKEN": "1000002:loadtest"}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def fake_update(update_id, user_id):
+    """Апдейт в формате Bot API: /start или нажатие кнопки"""
+    user = {"id": user_id, "is_bot": False, "first_name": f"Test {user_id}", "language_code": "ru"}
+    chat = {"id": user_id, "type": "private", "first_name": user["first_name"]}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user}
+    if update_id % 5 == 0:
+        message.update(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+        return {"update_id": update_id, "message": message}
+    # Кнопка нажата под сообщением бота
+    message.update({"text": "🛠", "from": {"id": 1, "is_bot": True, "first_name": "Bot"}})
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": CALLBACKS[update_id % len(CALLBACKS)],
+        },
+    }
+
+
+class FakeBotApi:
+    """Заглушка Bot API: на любой метод отвечает успехом и считает вызовы"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    def _result(self, method):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Loadtest", "username": "loadtest_bot"}
+        if method.startswith(("send", "edit", "copy", "forward")):
+            return {"message_id": next(self._message_ids), "date": int(time.time()),
+                    "chat": {"id": 1, "type": "private"}}
+        return True
+
+    async def __call__(self, scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        method = scope["path"].rsplit("/", 1)[-1]
+        self.calls[method] += 1
+        body = json.dumps({"ok": True, "result": self._result(method)}).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def check_rejections(client, url, secret):
+    """Сервер должен отвечать 403 без секрета и 404 на неизвестный путь"""
+    update = fake_update(1, 1)
+    wrong = await client.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret + "x"})
+    unknown = await client.post(url.rsplit("/", 1)[0] + "/unknown", json=update,
+                                headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+    print(f"wrong secret -> {wrong.status_code}, unknown path -> {unknown.status_code}")
+    return wrong.status_code == 403 and unknown.status_code == 404
+
+
+async def send_updates(url, secret, updates, concurrency, users):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+    latencies = []
+    statuses = {}
+    update_ids = itertools.count(int(time.time()) * 1000)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        rejections_ok = await check_rejections(client, url, secret)
+
+        async def send(index):
+            update_id = next(update_ids)
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(url, json=fake_update(update_id, 10_000 + index % users), headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(index) for index in range(updates)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{updates} updates to {url} in {elapsed:.2f}s ({updates / elapsed:.0f}/s), statuses {statuses}")
+    print(f"latency ms: p50 {percentile(latencies, 50):.1f}, p95 {percentile(latencies, 95):.1f}, "
+          f"p99 {percentile(latencies, 99):.1f}, max {max(latencies):.1f}")
+    return rejections_ok and statuses.get(200, 0) == updates
+
+
+async def start_server(app, port, lifespan):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan=lifespan, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            raise SystemExit(f"server on port {port} failed to start")
+        await asyncio.sleep(0.05)
+    return server, serving
+
+
+async def run(bot, updates, concurrency, users, port):
+    secret = secrets.token_urlsafe(16)
+    base_url = f"http://127.0.0.1:{port}"
+    api_url = f"http://127.0.0.1:{port + 1}"
+    with tempfile.TemporaryDirectory(prefix="webhook_loadtest_") as tmp:
+        # До импорта ботов: config и синглтон db читают окружение при импорте
+        os.environ.update(FAKE_TOKENS)
+        os.environ.update({
+            "DATABASE_PATH": os.path.join(tmp, "loadtest.db"),
+            "TELEGRAM_API_URL": f"{api_url}/bot",
+            "WEBHOOK_URL": "",
+            "WEBHOOK_SECRET": secret,
+        })
+        from webhook_server import create_server
+
+        api = FakeBotApi()
+        # Заглушка нужна уже при старте: приложения вызывают getMe в initialize()
+        api_server, api_serving = await start_server(api, port + 1, lifespan="off")
+        webhook = create_server()
+        server, serving = await start_server(webhook, port, lifespan="on")
+        try:
+            ok = await send_updates(f"{base_url}/telegram/{bot}", secret, updates, concurrency, users)
+            started = time.perf_counter()
+            while not webhook.bots[bot].update_queue.empty():
+                await asyncio.sleep(0.05)
+        finally:
+            # Application.stop дожидается уже начатых обработчиков
+            server.should_exit = True
+            await serving
+            api_server.should_exit = True
+            await api_serving
+        print(f"queue drained and bots stopped in {time.perf_counter() - started:.2f}s, "
+              f"Bot API calls: {dict(api.calls.most_common())}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot", default="user", choices=["user", "admin"])
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.bot, args.updates, args.concurrency, args.users, args.port))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Оба бота в режиме webhook на одном локальном HTTP-сервере
+
+Вместо двух процессов с long polling один процесс поднимает ASGI-сервер
+(uvicorn), на котором юзер-бот и админ-бот принимают апдейты по разным
+путям: /telegram/user и /telegram/admin. Telegram присылает апдейт сразу,
+без задержки опроса; запрос без правильного секрета в заголовке
+X-Telegram-Bot-Api-Secret-Token отклоняется. Апдейт только кладется в
+update_queue приложения, а обрабатывают его сами Application: юзер-бот -
+параллельно, до WEBHOOK_CONCURRENCY одновременно, админ-бот - по одному
+(см. build_application(webhook=True) в обоих модулях).
+
+Запуск: WEBHOOK_URL=https://example.com python webhook_server.py
+(или run_bots.py - при заданном WEBHOOK_URL он запускает этот сервер).
+Проверка без Telegram: python webhook_loadtest.py
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+
+from telegram import Update
+
+from config import WEBHOOK_CONCURRENCY, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH_PREFIX = "/telegram"
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+
+
+class WebhookServer:
+    """ASGI-приложение: POST {префикс}/{имя бота} -> update_queue приложения этого бота.
+
+    bots - {имя: Application}, приложения собраны с webhook=True (без Updater).
+    При старте (ASGI lifespan) приложения запускаются и, если задан
+    public_url, регистрируют у Telegram свой webhook.
+    """
+
+    def __init__(self, bots, secret_token, public_url=None, max_body_size=1 << 20):
+        self.bots = bots
+        self.secret_token = secret_token.encode()
+        self.public_url = public_url
+        self.max_body_size = max_body_size
+        self._routes = {f"{WEBHOOK_PATH_PREFIX}/{name}": application for name, application in bots.items()}
+        self.stats = {'accepted': 0, 'rejected': 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            status, body = await self._handle(scope, receive)
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+            })
+            await send({'type': 'http.response.body', 'body': body})
+
+    async def _handle(self, scope, receive):
+        """(HTTP-статус, тело ответа) для одного запроса"""
+        path = scope['path']
+        if path == '/healthz':
+            return 200, b'ok'
+        application = self._routes.get(path)
+        if application is None:
+            return 404, b'not found'
+        if scope['method'] != 'POST':
+            return 405, b'method not allowed'
+
+        headers = dict(scope['headers'])
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, b''), self.secret_token):
+            self.stats['rejected'] += 1
+            logger.warning(f"Webhook {path}: wrong secret token from {scope.get('client')}")
+            return 403, b'forbidden'
+
+        body = await self._read_body(receive)
+        if body is None:
+            return 413, b'payload too large'
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Webhook {path}: bad update: {e}")
+            return 400, b'bad request'
+
+        # Обработка идет в Application; Telegram получает ответ сразу
+        await application.update_queue.put(update)
+        self.stats['accepted'] += 1
+        return 200, b'ok'
+
+    async def _read_body(self, receive):
+        """Тело запроса целиком или None, если оно больше max_body_size"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.start()
+                except Exception as e:
+                    logger.error(f"Webhook server startup failed: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def start(self):
+        """То же, что делает run_polling до начала опроса: initialize, post_init, start"""
+        for name, application in self.bots.items():
+            await application.initialize()
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            if self.public_url:
+                await application.bot.set_webhook(
+                    url=f"{self.public_url}{WEBHOOK_PATH_PREFIX}/{name}",
+                    secret_token=self.secret_token.decode(),
+                    allowed_updates=Update.ALL_TYPES,
+                    max_connections=WEBHOOK_CONCURRENCY,
+                )
+            logger.info(f"Bot '{name}' is receiving updates at {WEBHOOK_PATH_PREFIX}/{name}")
+
+    async def stop(self):
+        """Сначала останавливаем обработку у всех ботов, затем освобождаем ресурсы:
+        боты делят одну БД, и post_shutdown первого закрывает ее для обоих"""
+        for application in self.bots.values():
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+        for application in self.bots.values():
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+        logger.info(f"Webhook server stopped: {self.stats}")
+
+
+def create_server():
+    """Сервер с обоими ботами; секрет - WEBHOOK_SECRET или случайный на время работы"""
+    from admin_bot import build_application as build_admin_application
+    from user_bot import build_application as build_user_application
+
+    return WebhookServer(
+        {
+            'user': build_user_application(webhook=True),
+            'admin': build_admin_application(webhook=True),
+        },
+        WEBHOOK_SECRET or secrets.token_urlsafe(32),
+        WEBHOOK_URL or None,
+    )
+
+
+def main():
+    import uvicorn
+
+    if not WEBHOOK_URL:
+        logger.warning("WEBHOOK_URL is not set: webhooks are not registered with Telegram")
+    server = uvicorn.Server(uvicorn.Config(
+        create_server(), host=WEBHOOK_HOST, port=WEBHOOK_PORT, lifespan='on', log_level='info'
+    ))
+    asyncio.run(server.serve())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    main()